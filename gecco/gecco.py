@@ -17,28 +17,44 @@ import sys
 import os
 import socket
 import socketserver
+import signal
 import datetime
 import time
 import subprocess
 import json
 import traceback
 import random
+import itertools
 import importlib
 import inspect
 from collections import OrderedDict, defaultdict
 #from threading import Thread, Lock
-from queue import Empty
-from threading import Thread
-from multiprocessing import Process, Lock, JoinableQueue as Queue #pylint: disable=no-name-in-module
+from queue import Empty, Queue as ThreadQueue
+from threading import Thread, Lock as ThreadLock, Condition as ThreadCondition, Semaphore as ThreadSemaphore
+from concurrent.futures import ThreadPoolExecutor, wait
+from multiprocessing import Process, Lock, Event, Queue, Array #pylint: disable=no-name-in-module
 from glob import glob
 import argparse
 import psutil
-import yaml
 from pynlpl.formats import folia, fql #pylint: disable=import-error,no-name-in-module
-from ucto import Tokenizer #pylint: disable=import-error,no-name-in-module
 
 import gecco.helpers.evaluation
-from gecco.helpers.common import folia2json
+from gecco.helpers.common import writejson, inputkey, expandfiles, foliafilename, text2folia, lazyimport
+import gecco.helpers.protocol as protocol
+from gecco.helpers.queues import getqueue
+from gecco.helpers.registry import Heartbeat, heartbeatfile, readheartbeat, probeall, unixsocketpath, islocalhost
+from gecco.helpers.routing import ROUTINGPOLICIES, getrouter
+from gecco.helpers.scheduling import ExecutionPlan
+from gecco.helpers.streaming import FoLiAStreamReader, FoLiAStreamWriter
+from gecco.helpers.resultstore import ResultStore, fingerprint
+from gecco.helpers.tracing import Tracer, servertrace
+from gecco.helpers.metrics import Metrics, MASTERMETRICS, SERVERMETRICS, cachegauges, memory, servehttp, mergemetrics
+from gecco.helpers.editing import Edit, SuggestionsEdit, ErrorDetectionEdit, SplitEdit, MergeEdit, DeletionEdit, InsertionEdit
+
+#only imported when needed, so commands that don't use them start quickly
+asyncio = lazyimport('asyncio')
+yaml = lazyimport('yaml')
+ucto = lazyimport('ucto')
 
 
 
@@ -48,258 +64,956 @@ if 'VIRTUAL_ENV' in os.environ:
 
 VERSION = '0.2.3'
 
+class Job:
+    """A document to correct, along with the state the data thread keeps for it while it is being processed"""
+
+    def __init__(self, foliadoc, module_ids, outputfile, dumpxml, dumpjson, connection=None, **parameters):
+        self.foliadoc = foliadoc #may still be a filename, the document is only loaded by the data thread, i.e. in the process that edits it
+        self.module_ids = module_ids
+        self.outputfile = outputfile
+        self.dumpxml = dumpxml
+        self.dumpjson = dumpjson
+        self.connection = connection #connection to the client that submitted the job to the daemon, if any
+        self.parameters = parameters
+        self.index = None #assigned by the data thread, identifies the job's units in the queues
+        self.queued = defaultdict(int) #number of units queued per module
+        self.completed = defaultdict(int) #number of units completed per module
+        self.produced = False #all input of the job is queued
+        self.finished = False
+        self.outputs = [] #(module_id, unit_id, outputdata, inputdata) tuples, applied once the job is complete
+        self.duplicates = {} #(module_id, input key) => ids of the units whose input is the same as that of the one unit queued, they get its output
+        self.traces = {} #(module_id, unit_id) => trace ID, for the units that are traced
+        self.corrections = defaultdict(int) #number of corrections per module
+        self.error = None
+        self.changed = ThreadCondition() #notified whenever units complete
+        self.stream = None #(writer, chunk, job) if this job is a chunk of a document processed in streaming mode
+        self.scope = None #if set, only units within these elements are processed (streaming mode: the chunk without its context)
+
+    def modules(self, corrector):
+        """The modules that run on this job, in order of the execution plan"""
+        return [ module for module in corrector if not self.module_ids or module.id in self.module_ids ]
+
+    def iscomplete(self, module_ids=None):
+        """Have all queued units (of the specified modules) completed? Call with the lock of self.changed held"""
+        if module_ids is None:
+            module_ids = self.queued.keys()
+        return all( self.completed[module_id] >= self.queued[module_id] for module_id in module_ids )
+
+    def select(self, unit):
+        """Returns the elements of the type unit in the document, or only those within the scope of the job if it has one"""
+        if self.scope is None:
+            return self.foliadoc.select(unit)
+        return itertools.chain.from_iterable( itertools.chain([element] if isinstance(element, unit) else [], element.select(unit)) for element in self.scope )
+
+
 class DataThread(Process):
-    def __init__(self, corrector, foliadoc, module_ids, outputfile,  inputqueue, outputqueue, infoqueue,waitforprocessors,dumpxml, dumpjson,**parameters):
+    """Loads the documents, feeds the input of their units to the processors and applies the output once a document is complete. The next document is loaded and fed while the output of the previous ones is still coming in.
+
+    Jobs come from a list, or from clients connecting to the Unix domain socket at socketpath (the daemon). In the latter case, the data thread runs until a client asks it to shut down.
+    """
+
+    def __init__(self, corrector, jobs, socketpath, inputqueue, outputqueue, infoqueue,waitforprocessors,inputready,**parameters):
         super().__init__()
 
         self.corrector = corrector
+        self.joblist = jobs
+        self.socketpath = socketpath
         self.inputqueue = inputqueue
         self.outputqueue = outputqueue
         self.infoqueue = infoqueue
-        self.module_ids = module_ids
-        self.outputfile = outputfile
         self.parameters = parameters
-        self.dumpxml = dumpxml
-        self.dumpjson = dumpjson
         self.waitforprocessors = waitforprocessors
+        self.inputready = inputready
         self.debug =  'debug' in self.parameters and self.parameters['debug']
+        self.tokenizer = None #ucto tokenizer for plain text input, set up on first use and reused for all documents
         self._stop = False
 
-        #Load FoLiA document
-        if isinstance(foliadoc, str):
+    def load(self, job):
+        """Load the FoLiA document (tokenising it first if it's plain text) and initialise the modules on it"""
+        if isinstance(job.foliadoc, str):
             #We got a filename instead of a FoLiA document, that's okay
-            ext = foliadoc.split('.')[-1].lower()
-            if not ext in ('xml','folia','gz','bz2'):
-                #Preprocessing - Tokenize input text (plaintext) and produce FoLiA output
-                self.corrector.log("Starting Tokeniser")
-
-                inputtextfile = foliadoc
-
-                if ext == 'txt':
-                    outputtextfile = '.'.join(inputtextfile.split('.')[:-1]) + '.folia.xml'
-                else:
-                    outputtextfile = inputtextfile + '.folia.xml'
-
-                tokenizer = Tokenizer(self.corrector.settings['ucto'],xmloutput=True)
-                tokenizer.tokenize(inputtextfile, outputtextfile)
-
-                foliadoc = outputtextfile
-
+            foliadoc = job.foliadoc
+            if foliafilename(foliadoc) != foliadoc:
+                #Preprocessing - Tokenize input text (plaintext) and produce FoLiA in memory
+                self.corrector.log("Tokenising " + foliadoc)
+                if self.tokenizer is None:
+                    self.tokenizer = ucto.Tokenizer(self.corrector.settings['ucto'])
+                with open(foliadoc,'r',encoding='utf-8') as f:
+                    text = f.read()
+                job.foliadoc = text2folia(self.tokenizer, text, self.corrector.settings['ucto'])
+                job.foliadoc.filename = foliafilename(foliadoc) #saved next to the input, unless an output file is specified
                 self.corrector.log("Tokeniser finished")
+            else:
+                #good, load
+                self.corrector.log("Reading FoLiA document " + foliadoc)
+                job.foliadoc = folia.Document(file=foliadoc)
 
-            #good, load
-            self.corrector.log("Reading FoLiA document")
-            self.foliadoc = folia.Document(file=foliadoc)
-        else:
-            self.foliadoc = foliadoc
-
-        if 'metadata' in parameters:
-            for k, v in parameters['metadata'].items():
-                self.foliadoc.metadata[k] = v
+        if 'metadata' in job.parameters:
+            for k, v in job.parameters['metadata'].items():
+                job.foliadoc.metadata[k] = v
 
-        begintime = time.time()
         self.corrector.log("Initialising modules on document") #not parallel, acts on same document anyway, should be very quick
-        for module in self.corrector:
-            if not module_ids or module.id in module_ids:
-                self.corrector.log("\tInitialising module " + module.id)
-                module.init(self.foliadoc)
-
-        #data in inputqueue takes the form (module, data), where data is an instance of module.UNIT (a folia document or element)
-        if folia.Document in self.corrector.units:
-            self.corrector.log("\tPreparing input of full documents")
+        for module in job.modules(self.corrector):
+            self.corrector.log("\tInitialising module " + module.id)
+            module.init(job.foliadoc)
 
-            for module in self.corrector:
-                if not module_ids or module.id in module_ids:
-                    if module.UNIT is folia.Document:
-                        self.corrector.log("\t\tQueuing full-document module " + module.id)
-                        inputdata = module.prepareinput(self.foliadoc,**parameters)
-                        if inputdata is not None:
-                            self.inputqueue.put( (module.id, self.foliadoc.id, inputdata) )
-
-        for unit in self.corrector.units:
-            if unit is not folia.Document:
-                self.corrector.log("\tPreparing input of " + str(unit.__name__))
-                for element in self.foliadoc.select(unit):
-                    for module in self.corrector:
-                        if not module_ids or module.id in module_ids:
-                            if module.UNIT is unit:
-                                inputdata = module.prepareinput(element,**parameters)
+    def produce(self, job):
+        """Prepare the input for all modules and feed it into the input queue, processors consume it as it comes in"""
+        begintime = time.time()
+        duplicates = 0
+        tracer = self.corrector.tracer
+        traceid = preparetime = None
+        #data in inputqueue takes the form (job, module, unit_id, data, trace), where data is the input the module prepared from an instance of module.UNIT (a folia document or element) and trace is (trace ID, time queued) for traced units, None for others
+        #the input is produced one level of the execution plan at a time; the input of modules that depend on others is only produced once those are done with the document
+        plan = self.corrector.getplan()
+        for level in plan.levels:
+            modules = [ module for module in level if not job.module_ids or module.id in job.module_ids ]
+            if not modules:
+                continue
+            prerequisites = set().union(*( plan.prerequisites[module.id] for module in modules )) #only these have to be done, modules of earlier levels that the level doesn't depend on may still be running
+            if prerequisites:
+                self.inputqueue.flush()
+                with job.changed:
+                    job.changed.wait_for(lambda: job.iscomplete(prerequisites)) #pylint: disable=cell-var-from-loop
+            for module in modules:
+                if module.UNIT is folia.Document:
+                    self.corrector.log("\tQueuing full-document module " + module.id)
+                    traceid = tracer.traceid() if tracer is not None else None
+                    preparetime = time.time()
+                    inputdata = module.prepareinput(job.foliadoc,**job.parameters)
+                    if inputdata is not None:
+                        job.queued[module.id] += 1
+                        self.inputqueue.put( (job.index, module.id, job.foliadoc.id, inputdata, self.trace(job, module, job.foliadoc.id, traceid, preparetime)) )
+
+            for unit in self.corrector.units:
+                if unit is not folia.Document:
+                    unitmodules = [ module for module in modules if module.UNIT is unit ]
+                    if unitmodules:
+                        self.corrector.log("\tPreparing input of " + str(unit.__name__))
+                        for element in job.select(unit):
+                            for module in unitmodules:
+                                if tracer is not None:
+                                    traceid = tracer.traceid()
+                                    preparetime = time.time()
+                                inputdata = module.prepareinput(element,**job.parameters)
                                 if inputdata is not None:
-                                    self.inputqueue.put( (module.id, element.id, inputdata ) )
-
-        for _ in range(self.corrector.settings['threads']):
-            self.inputqueue.put( (None,None,None) ) #signals the end of the queue, once for each thread
+                                    if module.settings['deduplicate']:
+                                        key = inputkey(inputdata)
+                                        if key is not None:
+                                            if (module.id, key) in job.duplicates:
+                                                #the same input is already queued for this module, this unit will get its output
+                                                job.duplicates[(module.id, key)].append(element.id)
+                                                self.corrector.metrics.add(module.id, 'duplicates')
+                                                duplicates += 1
+                                                continue
+                                            job.duplicates[(module.id, key)] = []
+                                    job.queued[module.id] += 1
+                                    self.inputqueue.put( (job.index, module.id, element.id, inputdata, self.trace(job, module, element.id, traceid, preparetime) if tracer is not None else None) )
+
+        self.inputqueue.flush() #don't keep the last units of the job waiting for more input to come in
+        with job.changed:
+            job.produced = True
+            self.checkcomplete(job)
 
         duration = time.time() - begintime
-        self.corrector.log("Input ready (" + str(duration) + "s)")
+        self.corrector.log("Input ready (" + str(duration) + "s, " + str(duplicates) + " units with duplicate input)")
+
+    def trace(self, job, module, unit_id, traceid, preparetime):
+        """Records the preparation of the input of a traced unit (if traceid is set), returns what goes in the input queue for tracing"""
+        if traceid is None:
+            return None
+        job.traces[(module.id, unit_id)] = traceid
+        now = time.time()
+        self.corrector.tracer.span('prepareinput', traceid, preparetime, now, module.id, unit=unit_id)
+        return (traceid, now)
+
+    def startjob(self, job):
+        """Loads the document of the job and queues its input"""
+        job.index = self.nextindex
+        self.nextindex += 1
+        self.jobs[job.index] = job
+        #Input is streamed into the queue while the processors are already consuming it.
+        #Output is only applied once all input of a document is prepared, as prepareinput() must see the unedited document
+        try:
+            self.load(job)
+            self.produce(job)
+        except Exception as e: #pylint: disable=broad-except
+            self.corrector.log("***ERROR*** Failed to prepare document: " + str(e))
+            exc_type, exc_value, exc_traceback = sys.exc_info() #pylint: disable=unused-variable
+            traceback.print_tb(exc_traceback, limit=50, file=sys.stderr)
+            self.inputqueue.flush()
+            with job.changed:
+                job.error = str(e)
+                job.produced = True #units already queued will still complete, the job finishes (with an error) after them
+                self.checkcomplete(job)
+
+    def stream(self, job):
+        """Processes a document in streaming mode: it is read a chunk of paragraphs at a time, every chunk is processed as a job of its own and written to the output once it's done"""
+        if job.dumpxml or job.dumpjson:
+            self.corrector.log("***ERROR*** Can't print documents in streaming mode, skipping " + job.foliadoc)
+            job.error = "Can't print documents in streaming mode"
+            if job.connection is not None:
+                self.reply(job)
+            return
+        self.corrector.log("Streaming FoLiA document " + job.foliadoc)
+        count = 0
+        failed = False
+        try:
+            writer = FoLiAStreamWriter(job.outputfile if job.outputfile else job.foliadoc)
+        except OSError as e:
+            self.corrector.log("***ERROR*** Unable to write output: " + str(e))
+            job.error = str(e)
+            if job.connection is not None:
+                self.reply(job)
+            return
+        try:
+            for chunk in FoLiAStreamReader(job.foliadoc).chunks(self.corrector.settings['streamchunk'], self.corrector.settings['streamcontext']):
+                self.slots.acquire() #chunks hold slots until they are written, so memory is bounded even if one chunk takes long
+                try:
+                    chunkdoc = chunk.document()
+                except Exception:
+                    self.slots.release()
+                    raise
+                chunkjob = Job(chunkdoc, job.module_ids, None, False, False, **job.parameters)
+                chunkjob.stream = (writer, chunk, job)
+                chunkjob.scope = chunk.targets
+                count += 1
+                self.startjob(chunkjob)
+        except Exception as e: #pylint: disable=broad-except
+            self.corrector.log("***ERROR*** Failed to read document " + job.foliadoc + ": " + str(e))
+            exc_type, exc_value, exc_traceback = sys.exc_info() #pylint: disable=unused-variable
+            traceback.print_tb(exc_traceback, limit=50, file=sys.stderr)
+            job.error = str(e)
+            failed = True
+        if writer.settotal(count, failed):
+            self.streamdone(job)
+
+    def writechunk(self, chunkjob):
+        """Hands a finished chunk to the writer of its document, returns the number of chunks written"""
+        writer, chunk, job = chunkjob.stream
+        for module_id, count in chunkjob.corrections.items():
+            job.corrections[module_id] += count
+        done = writer.add(chunk)
+        if writer.error is not None and job.error is None:
+            self.corrector.log("***ERROR*** Failed to write document " + job.foliadoc + ": " + writer.error)
+            job.error = writer.error
+        if writer.closed:
+            self.streamdone(job)
+        return done
+
+    def streamdone(self, job):
+        if job.error is None:
+            self.corrector.log("Document " + job.foliadoc + " written")
+        if job.connection is not None:
+            self.reply(job)
+
+    def checkcomplete(self, job):
+        """Hands the job to the finisher once all its units have completed. Call with the lock of job.changed held"""
+        if job.produced and not job.finished and job.iscomplete():
+            job.finished = True
+            self.finishing.put(job)
+
+    def collect(self):
+        """Moves everything from the output queue to the jobs, runs in a separate thread so the processors can always get rid of their output, even while we are still producing input"""
+        running = self.corrector.settings['threads']
+        while running:
+            try:
+                item = self.outputqueue.get(True,self.corrector.settings['timeout'])
+            except Empty:
+                continue
+            self.outputqueue.task_done()
+            jobindex, module_id, unit_id, outputdata, inputdata = item
+            if jobindex is None: #signals the end of the output of one processor
+                running -= 1
+                continue
+            job = self.jobs[jobindex]
+            with job.changed:
+                if unit_id is None: #marks a number of units of the module that completed without output
+                    job.completed[module_id] += outputdata
+                else:
+                    job.outputs.append( (module_id, unit_id, outputdata, inputdata) )
+                    job.completed[module_id] += 1
+                job.changed.notify_all()
+                self.checkcomplete(job)
 
-    def run(self):
-        self.corrector.log("Waiting for processors to be ready...") #not parallel, acts on same document anyway, should be fairly quick depending on module
+    def finish(self):
+        """Applies the output of complete jobs and saves them, runs in a separate thread so we can go on producing the input of the next job"""
         self.waitforprocessors.acquire(True,self.corrector.settings['timeout'])
+        while True:
+            job = self.finishing.get()
+            if job is None:
+                break
+            try:
+                if job.error is None:
+                    self.apply(job)
+            except Exception as e: #pylint: disable=broad-except
+                self.corrector.log("***ERROR*** Failed to finish document: " + str(e))
+                exc_type, exc_value, exc_traceback = sys.exc_info() #pylint: disable=unused-variable
+                traceback.print_tb(exc_traceback, limit=50, file=sys.stderr)
+                job.error = str(e)
+            if job.stream is not None:
+                done = self.writechunk(job)
+            else:
+                if job.connection is not None:
+                    self.reply(job)
+                done = 1
+            del self.jobs[job.index]
+            self.documentsdone += done
+            for _ in range(done):
+                self.slots.release()
+
+    def fanout(self, job):
+        """Yields the outputs of the job, and a copy of each for the units that had the same input"""
+        for module_id, unit_id, outputdata, inputdata in job.outputs:
+            yield module_id, unit_id, outputdata, inputdata
+            if job.duplicates:
+                for duplicate in job.duplicates.get( (module_id, inputkey(inputdata)), () ):
+                    yield module_id, duplicate, outputdata, inputdata
+
+    def apply(self, job):
         self.corrector.log("Processing output...") #not parallel, acts on same document anyway, should be fairly quick depending on module
-        while not self._stop:
-            module_id, unit_id, outputdata, inputdata = self.outputqueue.get(True,self.corrector.settings['timeout'])
-            self.outputqueue.task_done()
-            if module_id is None and unit_id is None and outputdata is None and inputdata is None: #signals the end of the queue
-                self._stop = True
-            elif outputdata:
+        for module_id, unit_id, outputdata, inputdata in self.fanout(job):
+            if outputdata:
                 module = self.corrector.modules[module_id]
+                traceid = job.traces.get((module_id, unit_id)) if job.traces else None
+                begintime = time.time() if traceid else None
                 try:
-                    queries = module.processoutput(outputdata, inputdata, unit_id,**self.parameters)
+                    queries = module.processoutput(outputdata, inputdata, unit_id,**job.parameters)
                 except Exception as e: #pylint: disable=broad-except
                     self.corrector.log("***ERROR*** Exception processing output of " + module_id + ": " + str(e)) #not parallel, acts on same document anyway, should be fairly quick depending on module
                     exc_type, exc_value, exc_traceback = sys.exc_info() #pylint: disable=unused-variable
                     traceback.print_tb(exc_traceback, limit=50, file=sys.stderr)
                     queries = None
+                if traceid:
+                    self.corrector.tracer.span('processoutput', traceid, begintime, time.time(), module_id, unit=unit_id)
+                    begintime = time.time()
                 if queries is not None:
-                    if isinstance(queries, str):
+                    if isinstance(queries, (str, Edit)):
                         queries = (queries,)
                     for query in queries:
                         try:
-                            if self.debug:
-                                self.corrector.log("Processing FQL query " + query)
-                            q = fql.Query(query)
-                            q(self.foliadoc)
-                            self.infoqueue.put( module.id)
+                            if isinstance(query, str) or not self.corrector.settings['directedits']:
+                                if self.debug:
+                                    self.corrector.log("Processing FQL query " + str(query))
+                                q = fql.Query(str(query))
+                                q(job.foliadoc)
+                            else:
+                                if self.debug:
+                                    self.corrector.log("Applying edit " + str(query))
+                                query.apply(job.foliadoc) #edit records are applied directly, without going through FQL where possible
+                            job.corrections[module.id] += 1
+                            self.correctionspermod[module.id] += 1
                         except fql.SyntaxError as e:
                             self.corrector.log("***ERROR*** FQL Syntax error in " + module_id + ":" + str(e)) #not parallel, acts on same document anyway, should be fairly quick depending on module
-                            self.corrector.log(" query: " + query)
+                            self.corrector.log(" query: " + str(query))
                             exc_type, exc_value, exc_traceback = sys.exc_info()
                             traceback.print_tb(exc_traceback, limit=50, file=sys.stderr)
                         except fql.QueryError as e:
                             self.corrector.log("***ERROR*** FQL Query error in " + module_id + ":" + str(e)) #not parallel, acts on same document anyway, should be fairly quick depending on module
-                            self.corrector.log(" query: " + query)
+                            self.corrector.log(" query: " + str(query))
                             exc_type, exc_value, exc_traceback = sys.exc_info()
                             traceback.print_tb(exc_traceback, limit=50, file=sys.stderr)
                         except Exception as e: #pylint: disable=broad-except
                             self.corrector.log("***ERROR*** Error processing query for " + module_id + ": " + e.__class__.__name__ + " -- " +  str(e)) #not parallel, acts on same document anyway, should be fairly quick depending on module
-                            self.corrector.log(" query: " + query)
+                            self.corrector.log(" query: " + str(query))
                             exc_type, exc_value, exc_traceback = sys.exc_info() #pylint: disable=unused-variable
                             traceback.print_tb(exc_traceback, limit=50, file=sys.stderr)
-
-        self.infoqueue.put(None) #signals end
+                    if traceid:
+                        self.corrector.tracer.span('edit', traceid, begintime, time.time(), module_id, unit=unit_id, edits=len(queries))
+        job.outputs = []
+        job.duplicates = {}
+        job.traces = {}
 
         self.corrector.log("Finalising modules on document") #not parallel, acts on same document anyway, should be fairly quick depending on module
-        for module in self.corrector:
-            if not self.module_ids or module.id in self.module_ids:
-                module.finish(self.foliadoc)
-
+        for module in job.modules(self.corrector):
+            module.finish(job.foliadoc)
 
+        if job.stream is not None:
+            return #chunks are written by the stream writer
 
         #Store FoLiA document
-        if self.outputfile:
-            self.corrector.log("Saving document " + self.outputfile + "....")
-            self.foliadoc.save(self.outputfile)
-        elif not self.dumpxml and not self.dumpjson:
-            self.corrector.log("Saving document " + self.foliadoc.filename + "....")
-            self.foliadoc.save()
+        if job.outputfile:
+            self.corrector.log("Saving document " + job.outputfile + "....")
+            job.foliadoc.save(job.outputfile)
+        elif not job.dumpxml and not job.dumpjson:
+            self.corrector.log("Saving document " + job.foliadoc.filename + "....")
+            job.foliadoc.save()
+
+        if job.connection is None: #jobs submitted to the daemon get their output in the reply instead
+            if job.dumpxml:
+                self.corrector.log("Dumping XML")
+                print(job.foliadoc)
+            if job.dumpjson:
+                self.corrector.log("Dumping JSON")
+                writejson(job.foliadoc, sys.stdout)
+                print()
+
+    def listen(self):
+        """Accepts jobs from clients (gecco submit) on a Unix domain socket, for the daemon"""
+        if os.path.exists(self.socketpath):
+            os.unlink(self.socketpath) #left behind by a daemon that didn't end properly
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socketpath)
+        listener.listen(16)
+        self.corrector.log("Accepting documents on " + self.socketpath)
+        while True:
+            connection, _ = listener.accept()
+            thread = Thread(target=self.receive, args=(connection,))
+            thread.daemon = True
+            thread.start()
 
-        if self.dumpxml:
-            self.corrector.log("Dumping XML")
-            print(self.foliadoc)
-        if self.dumpjson:
-            self.corrector.log("Dumping JSON")
-            print(json.dumps(folia2json(self.foliadoc)))
+    def receive(self, connection):
+        """Reads one request from a client, a line of JSON"""
+        try:
+            request = json.loads(str(connection.makefile('rb').readline(),'utf-8'))
+            if request.get('command') == 'shutdown':
+                self.corrector.log("Shutdown requested")
+                connection.sendall(json.dumps({'status': 'ok'}).encode('utf-8') + b"\n")
+                connection.close()
+                self.jobqueue.put(None)
+                return
+            if request.get('command') == 'metrics':
+                connection.sendall(json.dumps({'status': 'ok', 'metrics': self.corrector.metrics.render()}).encode('utf-8') + b"\n")
+                connection.close()
+                return
+            parameters = request.get('parameters',{})
+            if 'metadata' in request:
+                parameters['metadata'] = request['metadata']
+            self.jobqueue.put( Job(request['filename'], request.get('modules',[]), request.get('outputfile'), request.get('dumpxml',False), request.get('dumpjson',False), connection, **parameters) )
+        except Exception as e: #pylint: disable=broad-except
+            connection.sendall(json.dumps({'status': 'error', 'message': "Invalid request: " + str(e)}).encode('utf-8') + b"\n")
+            connection.close()
+
+    def reply(self, job):
+        if job.error is None:
+            response = {'status': 'ok', 'corrections': dict(job.corrections)}
+            if job.dumpxml:
+                response['xml'] = str(job.foliadoc)
+        else:
+            response = {'status': 'error', 'message': job.error}
+        try:
+            if job.error is None and job.dumpjson:
+                #the corrections are written to the client as they are serialised
+                f = job.connection.makefile('w', encoding='utf-8')
+                f.write(json.dumps(response)[:-1] + ", \"json\": ")
+                writejson(job.foliadoc, f)
+                f.write("}\n")
+                f.close()
+            else:
+                job.connection.sendall(json.dumps(response).encode('utf-8') + b"\n")
+            job.connection.close()
+        except OSError:
+            self.corrector.log("Client went away before its document was done")
 
+    def run(self):
+        self.jobs = {} #pylint: disable=attribute-defined-outside-init
+        self.slots = ThreadSemaphore(self.corrector.settings['maxdocuments']) #pylint: disable=attribute-defined-outside-init
+        self.jobqueue = ThreadQueue() #pylint: disable=attribute-defined-outside-init
+        self.finishing = ThreadQueue() #pylint: disable=attribute-defined-outside-init
+        self.correctionspermod = defaultdict(int) #pylint: disable=attribute-defined-outside-init
+        self.documentsdone = 0 #pylint: disable=attribute-defined-outside-init
+        if self.corrector.tracer is not None:
+            self.corrector.tracer.name(os.getpid(), "gecco data thread")
+        self.corrector.metrics.gauges.append(self.gauges)
+        if self.corrector.settings['metricsport']:
+            try:
+                servehttp(self.corrector.metrics, self.corrector.settings['metricsport'])
+                self.corrector.log("Serving metrics on http://127.0.0.1:" + str(self.corrector.settings['metricsport']) + "/metrics")
+            except OSError as e:
+                self.corrector.log("**ERROR** Unable to serve metrics on port " + str(self.corrector.settings['metricsport']) + ": " + str(e))
+        collector = Thread(target=self.collect)
+        collector.daemon = True
+        collector.start()
+        finisher = Thread(target=self.finish)
+        finisher.start()
+        if self.socketpath:
+            listener = Thread(target=self.listen)
+            listener.daemon = True
+            listener.start()
+        else:
+            for job in self.joblist:
+                self.jobqueue.put(job)
+            self.jobqueue.put(None)
+
+        self.nextindex = 0 #pylint: disable=attribute-defined-outside-init
+        while not self._stop:
+            job = self.jobqueue.get()
+            if job is None:
+                break
+            if self.corrector.settings['streaming'] and isinstance(job.foliadoc, str) and foliafilename(job.foliadoc) == job.foliadoc:
+                self.stream(job)
+            else:
+                self.slots.acquire() #don't load more documents while too many are still being processed
+                self.startjob(job)
+
+        for _ in range(self.corrector.settings['threads']):
+            self.inputqueue.put( (None,None,None,None,None) ) #signals the end of the queue, once for each thread
+            self.inputqueue.flush() #each end signal must go out in a chunk of its own
+        self.inputready.set()
+
+        collector.join() #all output is in once every processor has ended
+        self.finishing.put(None)
+        finisher.join()
+        self.infoqueue.put(dict(self.correctionspermod)) #the number of corrections per module, sent in one go at the end
+        if self.socketpath and os.path.exists(self.socketpath):
+            os.unlink(self.socketpath)
+
+    def gauges(self):
+        """Values of the data thread reported in the metrics of the master"""
+        gauges = []
+        queues = [ (name, queue.pending()) for name, queue in (('input', self.inputqueue), ('output', self.outputqueue)) ]
+        queues = [ ((('queue', name),), pending) for name, pending in queues if pending is not None ]
+        if queues:
+            gauges.append( ("_queue_pending_items", 'gauge', "Items put in the queue and not done yet", queues) )
+        gauges.append( ("_documents_in_progress", 'gauge', "Documents loaded and not finished yet", [ ((), len(self.jobs)) ]) )
+        gauges.append( ("_documents_total", 'counter', "Documents finished (chunks in streaming mode)", [ ((), self.documentsdone) ]) )
+        gauges.append( ("_memory_bytes", 'gauge', "Resident memory of the data thread, which holds the documents", [ ((('pid', os.getpid()),), memory()) ]) )
+        return gauges
 
     def stop(self):
         self._stop = True
 
 
 class ProcessorThread(Process):
-    def __init__(self, corrector,inputqueue, outputqueue, timequeue, **parameters):
+    def __init__(self, corrector,inputqueue, outputqueue, timequeue, inputready, **parameters):
         self.corrector = corrector
         self.inputqueue = inputqueue
+        self.inputready = inputready
         self.outputqueue = outputqueue
         self.timequeue = timequeue
+        self.durationpermod = defaultdict(float) #time spent per module, sent in one go to the timequeue at the end
+        self.callspermod = defaultdict(int)
         self._stop = False
         self.parameters = parameters
         self.debug  = 'debug' in parameters and parameters['debug']
+        self.batchsize = self.corrector.settings['batchsize']
+        self.pipeline = self.corrector.settings['pipeline']
         self.clients = {} #each thread keeps a bunch of clients open to the servers of the various modules so we don't have to reconnect constantly (= faster)
-        self.seqnr = {}
-        self.random = random.Random()
+        self.routers = {} #module_id => router, decides which server of the module gets the next request
+        self.random = random.Random() #for the routers, reseeded by the process itself, see setup()
+        self.resultstore = None #opened by the process itself, see openstore()
+        self.fingerprints = {} #module_id => fingerprint of the module, for the result store
+        self.storehits = 0 #number of units whose output came from the result store
+        self.traces = {} #(jobindex, module_id, unit_id) => (trace ID, time queued, time taken from the queue) for traced units that are not dispatched yet
         super().__init__()
 
 
+    def setup(self):
+        """Sets up what every processor needs of its own, called at the start of run(), in the processor itself"""
+        if self.corrector.tracer is not None:
+            self.corrector.tracer.name(os.getpid(), "gecco processor")
+        self.random.seed() #the generator was copied from the master when the processor was forked, reseed it so processors don't all route alike
+        self.openstore()
+
     def run(self):
         self.corrector.log("[" + str(self.pid) + "] Start of thread")
+        self.setup()
+        batches = OrderedDict() #module_id => [(job, unit_id, inputdata)], units queued for a module but not dispatched yet
         while not self._stop:
             try:
-                module_id, unit_id, inputdata = self.inputqueue.get(True,self.corrector.settings['timeout'])
+                if batches:
+                    #we have pending units, don't block on the queue but flush them as soon as it runs dry
+                    jobindex, module_id, unit_id, inputdata, trace = self.inputqueue.get(False)
+                else:
+                    jobindex, module_id, unit_id, inputdata, trace = self.inputqueue.get(True,self.corrector.settings['timeout'])
             except Empty:
+                if batches:
+                    self.flush(batches)
+                    continue
+                if not self.inputready.is_set():
+                    continue #input is still being prepared (e.g. a large document is being loaded), keep waiting
                 if self.debug: self.corrector.log(" (inputqueue timed out)")
                 self._stop = True
                 break
-            self.inputqueue.task_done()
             if module_id is None: #signals the last item (there will be one for each thread)
                 if self.debug: self.corrector.log(" (end of input queue)")
+                self.flush(batches)
+                self.done()
                 self._stop = True
                 break
             else:
                 module =  self.corrector.modules[module_id]
-                if not module.UNITFILTER or module.UNITFILTER(inputdata):
-                    if not module.submodule: #modules marked a submodule won't be called by the main process, but are invoked by other modules instead
-                        begintime = time.time()
-                        module.prepare() #will block until all dependencies are done
-                        if module.local:
-                            if self.debug:
-                                module.log("[" + str(self.pid) + "] (Running " + module.id + " on " + repr(inputdata) + " [local])")
-                            outputdata = module.runlocal(inputdata, unit_id, **self.parameters)
-                            if outputdata is not None:
-                                self.outputqueue.put( (module.id, unit_id, outputdata,inputdata) )
-                            if self.debug:
-                                duration = round(time.time() - begintime,4)
-                                module.log("[" + str(self.pid) + "] (...took " + str(duration) + "s)")
-                        else:
-                            connected = False
-                            if self.debug:
-                                module.log("[" + str(self.pid) + "]  (Running " + module.id + " on " + repr(inputdata) + " [remote]")
-                            if module.id not in self.seqnr:
-                                self.seqnr[module.id] = self.random.randint(0,len(module.servers)) #start with a random sequence nr
-                            try:
-                                startseqnr = self.seqnr[module.id]
-                                while not connected:
-                                    #get the server for this sequence nr, sequence numbers ensure rotation between servers
-                                    server,port,load = module.getserver(self.seqnr[module.id])   #pylint: disable=unused-variable
-                                    self.seqnr[module.id] += 1 #increase sequence number for this module
-                                    if self.seqnr[module.id] >= startseqnr + (10 * len(module.servers)):
-                                        break #max 10 retries over all servers
-                                    try:
-                                        if (server,port) not in self.clients:
-                                            self.clients[(server,port)] = module.CLIENT(server,port)
-                                        client = self.clients[(server,port)]
-                                        if self.debug:
-                                            module.log("[" + str(self.pid) + "] BEGIN (server=" + server + ", port=" + str(port) + ", client=" + str(client) + ", corrector=" + str(self.corrector) + ", module=" + str(module) + ", unit=" + unit_id + ")")
-                                        outputdata = module.runclient(client, unit_id, inputdata,  **self.parameters)
-                                        if self.debug:
-                                            module.log("[" + str(self.pid) + "] END (server=" + server + ", port=" + str(port) + ", client=" + str(client) + ", corrector=" + str(self.corrector) + ", module=" + str(module) + ", unit=" + unit_id + ")")
-                                        if outputdata is not None:
-                                            self.outputqueue.put( (module.id, unit_id, outputdata,inputdata) )
-                                        #will only be executed when connection succeeded:
-                                        connected = True
-                                    except ConnectionRefusedError:
-                                        module.log("[" + str(self.pid) + "] Server " + server+":" + str(port) + ", module " + module.id + " refused connection, moving on...")
-                                        del self.clients[(server,port)]
-                                    except Exception: #pylint: disable=broad-except
-                                        module.log("[" + str(self.pid) + "] Server communication failed for server " + server +":" + str(port) + ", module " + module.id + ", passed unit " + unit_id + " (traceback follows in debug), moving on...")
-                                        exc_type, exc_value, exc_traceback = sys.exc_info() #pylint: disable=unused-variable
-                                        traceback.print_tb(exc_traceback, limit=50, file=sys.stderr)
-                                        del self.clients[(server,port)]
-                            except IndexError:
-                                module.log("**ERROR** No servers started for " + module.id)
-                            if not connected:
-                                module.log("**ERROR** Unable to connect client to server! All servers for module " + module.id + " are down, skipping!")
-                            duration = time.time() - begintime
-                            self.timequeue.put((module.id, duration))
-                            if self.debug:
-                                module.log("[" + str(self.pid) + "] (...took " + str(round(duration,4)) + "s)")
+                if (not module.UNITFILTER or module.UNITFILTER(inputdata)) and not module.submodule: #modules marked a submodule won't be called by the main process, but are invoked by other modules instead
+                    if module.id not in batches:
+                        batches[module.id] = []
+                    batches[module.id].append( (jobindex, unit_id, inputdata) )
+                    if trace is not None:
+                        self.traces[(jobindex, module.id, unit_id)] = trace + (time.time(),)
+                    if len(batches[module.id]) >= self.batchsize:
+                        self.dispatch(module, batches.pop(module.id))
+                else:
+                    self.output(module, [jobindex], [unit_id], None, [inputdata])
+                    self.done()
 
+        self.outputqueue.put( (None,None,None,None,None) ) #signals the end of our output, comes after all our output as each process' items stay in order
+        self.outputqueue.flush()
+        self.timequeue.put( (dict(self.durationpermod), dict(self.callspermod)) )
+        self.closestore()
         self.corrector.log("[" + str(self.pid) + "] End of thread")
 
+    def flush(self, batches):
+        """Dispatch all pending batches, in order of the execution plan"""
+        for module in self.corrector:
+            if module.id in batches:
+                self.dispatch(module, batches.pop(module.id))
+
+    def openstore(self):
+        if self.corrector.settings['resultstore']:
+            try:
+                self.resultstore = ResultStore(self.corrector.settings['resultstore'])
+            except Exception as e: #pylint: disable=broad-except
+                self.corrector.log("[" + str(self.pid) + "] **ERROR** Unable to open result store " + self.corrector.settings['resultstore'] + ", continuing without: " + str(e))
+
+    def closestore(self):
+        if self.resultstore is not None:
+            if self.storehits:
+                self.corrector.log("[" + str(self.pid) + "] " + str(self.storehits) + " units answered from the result store")
+            self.resultstore.close()
+
+    def usestore(self, module):
+        if self.resultstore is None or not module.settings['storeresults']:
+            return False
+        if module.id not in self.fingerprints:
+            self.fingerprints[module.id] = module.fingerprint()
+        return True
+
+    def lookupbatch(self, module, batch, storing):
+        """Takes the traced units of the batch (see traced()) and, if storing, answers the units that have an output in the result store. Returns the units that remain to be dispatched and those of them that are traced"""
+        traced = self.traced(module, batch) if self.traces else []
+        if storing:
+            lookuptime = time.time()
+            batch = self.lookup(module, batch)
+            if traced:
+                self.tracerequest(module, traced, 'lookup', lookuptime, time.time())
+                remaining = set( (jobindex, unit_id) for jobindex, unit_id, _ in batch )
+                traced = [ (jobindex, unit_id, traceid) for jobindex, unit_id, traceid in traced if (jobindex, unit_id) in remaining ]
+        return batch, traced
+
+    def traced(self, module, batch):
+        """Takes the traced units of the batch from self.traces and records the time they spent in the input queue, and in the batch after that. Returns their (jobindex, unit_id, trace ID) tuples"""
+        traced = []
+        now = time.time()
+        for jobindex, unit_id, _ in batch:
+            trace = self.traces.pop((jobindex, module.id, unit_id), None)
+            if trace is not None:
+                traceid, queued, taken = trace
+                self.corrector.tracer.span('queue', traceid, queued, taken, module.id, unit=unit_id)
+                self.corrector.tracer.span('batch', traceid, taken, now, module.id, unit=unit_id)
+                traced.append( (jobindex, unit_id, traceid) )
+        return traced
+
+    def tracerequest(self, module, traced, name, begin, end, traces=(), **args):
+        """Records a span for each of the traced units, and the spans on the module server from the trace records it returned"""
+        for _, unit_id, traceid in traced:
+            self.corrector.tracer.span(name, traceid, begin, end, module.id, unit=unit_id, units=len(traced), **args)
+            for trace in traces:
+                self.corrector.tracer.serverspans(module.id, dict(trace, id=traceid)) #the request carried the ID of the first traced unit
+
+    def lookup(self, module, batch):
+        """Puts the output of the units of the batch that are in the result store in the output queue, returns the other units"""
+        keys = [ ResultStore.key(self.fingerprints[module.id], inputdata) for _, _, inputdata in batch ]
+        try:
+            found = self.resultstore.lookup(keys)
+        except Exception as e: #pylint: disable=broad-except
+            module.log("[" + str(self.pid) + "] Result store lookup failed: " + str(e))
+            return batch
+        if not found:
+            return batch
+        hits = [ (item, found[key]) for item, key in zip(batch, keys) if key in found ]
+        self.output(module, [ jobindex for (jobindex, _, _), _ in hits ], [ unit_id for (_, unit_id, _), _ in hits ], [ outputdata for _, outputdata in hits ], [ inputdata for (_, _, inputdata), _ in hits ])
+        self.done(len(hits))
+        self.storehits += len(hits)
+        self.corrector.metrics.add(module.id, 'stored', len(hits))
+        return [ item for item, key in zip(batch, keys) if key not in found ]
+
+    def store(self, module, inputs, outputs):
+        """Adds the outputs of a module for the inputs to the result store. Nothing is stored if processing failed"""
+        if outputs is None or len(outputs) != len(inputs):
+            return
+        try:
+            self.resultstore.store(module.id, [ (ResultStore.key(self.fingerprints[module.id], inputdata), outputdata) for inputdata, outputdata in zip(inputs, outputs) ])
+        except Exception as e: #pylint: disable=broad-except
+            module.log("[" + str(self.pid) + "] Unable to add to result store: " + str(e))
+
+    def dispatch(self, module, batch):
+        """Runs the module on a batch of (job, unit_id, inputdata) tuples, either locally or by contacting a server, and puts the results in the output queue. A batch of size one is processed as a single unit (no batch message). Units with an output in the result store are answered from there"""
+        storing = self.usestore(module)
+        batch, traced = self.lookupbatch(module, batch, storing)
+        if not batch:
+            return
+        module.prepare()
+        begintime = time.time()
+        self.corrector.metrics.begin(module.id, len(batch))
+        jobindices = [ jobindex for jobindex, _, _ in batch ]
+        unit_ids = [ unit_id for _, unit_id, _ in batch ]
+        inputs = [ inputdata for _, _, inputdata in batch ]
+        outputs = None
+        if module.local:
+            if self.debug:
+                module.log("[" + str(self.pid) + "] (Running " + module.id + " on " + repr(inputs) + " [local])")
+            try:
+                if len(batch) == 1:
+                    outputs = [ module.runlocal(unit_ids[0], inputs[0], **self.parameters) ]
+                else:
+                    outputs = module.runlocalbatch(unit_ids, inputs, **self.parameters)
+            except Exception: #pylint: disable=broad-except
+                module.log("[" + str(self.pid) + "] Processing failed for module " + module.id + ", units " + ",".join(unit_ids) + " (traceback follows), skipping...")
+                traceback.print_exc(file=sys.stderr)
+            if traced:
+                self.tracerequest(module, traced, 'run', begintime, time.time(), local=True)
+            if self.debug:
+                duration = round(time.time() - begintime,4)
+                module.log("[" + str(self.pid) + "] (...took " + str(duration) + "s)")
+        else:
+            connected = False
+            if self.debug:
+                module.log("[" + str(self.pid) + "]  (Running " + module.id + " on " + repr(inputs) + " [remote]")
+            if module.id not in self.routers:
+                self.routers[module.id] = getrouter(module, self.random)
+            router = self.routers[module.id]
+            try:
+                attempts = 0
+                while not connected:
+                    #the router picks the server, depending on the routing policy of the module
+                    index = router.select()
+                    server,port,load = module.getserver(index)   #pylint: disable=unused-variable
+                    attempts += 1
+                    if attempts > 10 * len(module.servers):
+                        break #max 10 retries over all servers
+                    router.begin(index, len(batch))
+                    requesttime = time.time()
+                    try:
+                        if (server,port) not in self.clients:
+                            self.clients[(server,port)] = module.CLIENT(server,port, unixsocket=module.unixsockets.get((server,port)))
+                        client = self.clients[(server,port)]
+                        client.traceid = traced[0][2] if traced else None #sent along with the request
+                        if self.debug:
+                            module.log("[" + str(self.pid) + "] BEGIN (server=" + server + ", port=" + str(port) + ", client=" + str(client) + ", corrector=" + str(self.corrector) + ", module=" + str(module) + ", units=" + ",".join(unit_ids) + ")")
+                        if len(batch) == 1:
+                            outputs = [ module.runclient(client, unit_ids[0], inputs[0],  **self.parameters) ]
+                        elif self.pipeline:
+                            outputs = module.runclientpipelined(client, unit_ids, inputs, **self.parameters)
+                        else:
+                            outputs = module.runclientbatch(client, unit_ids, inputs, **self.parameters)
+                        if self.debug:
+                            module.log("[" + str(self.pid) + "] END (server=" + server + ", port=" + str(port) + ", client=" + str(client) + ", corrector=" + str(self.corrector) + ", module=" + str(module) + ", units=" + ",".join(unit_ids) + ")")
+                        router.end(index, len(batch), time.time() - requesttime, True)
+                        if traced:
+                            self.tracerequest(module, traced, 'request', requesttime, time.time(), client.poptraces(client.traceid), server=server + ":" + str(port))
+                        #will only be executed when connection succeeded:
+                        connected = True
+                    except ConnectionRefusedError:
+                        router.end(index, len(batch), time.time() - requesttime, False)
+                        module.log("[" + str(self.pid) + "] Server " + server+":" + str(port) + ", module " + module.id + " refused connection, moving on...")
+                        del self.clients[(server,port)]
+                    except Exception: #pylint: disable=broad-except
+                        router.end(index, len(batch), time.time() - requesttime, False)
+                        module.log("[" + str(self.pid) + "] Server communication failed for server " + server +":" + str(port) + ", module " + module.id + ", passed units " + ",".join(unit_ids) + " (traceback follows in debug), moving on...")
+                        exc_type, exc_value, exc_traceback = sys.exc_info() #pylint: disable=unused-variable
+                        traceback.print_tb(exc_traceback, limit=50, file=sys.stderr)
+                        del self.clients[(server,port)]
+                        outputs = None
+            except IndexError:
+                module.log("**ERROR** No servers started for " + module.id)
+            if not connected:
+                module.log("**ERROR** Unable to connect client to server! All servers for module " + module.id + " are down, skipping!")
+            duration = time.time() - begintime
+            self.durationpermod[module.id] += duration
+            self.callspermod[module.id] += len(batch) #count units rather than requests, so the statistics remain comparable regardless of batch size
+            if self.debug:
+                module.log("[" + str(self.pid) + "] (...took " + str(round(duration,4)) + "s)")
+        self.corrector.metrics.end(module.id, len(batch), time.time() - begintime, outputs is not None)
+        if storing:
+            self.store(module, inputs, outputs)
+        self.output(module, jobindices, unit_ids, outputs, inputs)
+        self.done(len(batch))
+
+    def done(self, count=1):
+        """Marks units from the input queue as done. Makes sure their output is on its way first, the data thread waits for it to complete the documents"""
+        if not self.inputqueue.buffered():
+            self.outputqueue.flush()
+        for _ in range(count):
+            self.inputqueue.task_done()
+
+    def output(self, module, jobindices, unit_ids, outputs, inputs):
+        """Puts the output of the units in the output queue, units without output (or whose processing failed, outputs is None) are only counted as completed"""
+        if outputs is not None and len(outputs) != len(unit_ids):
+            module.log("**ERROR** Module " + module.id + " returned " + str(len(outputs)) + " outputs for a batch of " + str(len(unit_ids)) + " units, skipping...")
+            outputs = None
+        if outputs is None:
+            outputs = [None] * len(unit_ids)
+        completed = defaultdict(int) #job => number of units completed without output
+        for jobindex, unit_id, outputdata, inputdata in zip(jobindices, unit_ids, outputs, inputs):
+            if outputdata is not None:
+                self.outputqueue.put( (jobindex, module.id, unit_id, outputdata,inputdata) )
+            else:
+                completed[jobindex] += 1
+        for jobindex, count in completed.items():
+            self.outputqueue.put( (jobindex, module.id, None, count, None) )
+
 
     def stop(self):
         self._stop = True
 
+class AsyncProcessorThread(ProcessorThread):
+    """Processor that dispatches units from an asyncio event loop (setting ``dispatcher: asyncio``). Instead of one request at a time, it keeps up to ``concurrency`` requests to the module servers in progress, multiplexed over one connection per server. Local modules are run one at a time in a separate thread"""
+
+    def run(self):
+        self.corrector.log("[" + str(self.pid) + "] Start of thread (asyncio)")
+        self.setup()
+        self.loop = asyncio.new_event_loop() #pylint: disable=attribute-defined-outside-init
+        self.localexecutor = ThreadPoolExecutor(1) #pylint: disable=attribute-defined-outside-init
+        try:
+            self.loop.run_until_complete(self.main())
+        finally:
+            self.loop.close()
+            self.localexecutor.shutdown()
+        self.outputqueue.put( (None,None,None,None,None) ) #signals the end of our output, comes after all our output as each process' items stay in order
+        self.outputqueue.flush()
+        self.timequeue.put( (dict(self.durationpermod), dict(self.callspermod)) )
+        self.closestore()
+        self.corrector.log("[" + str(self.pid) + "] End of thread")
+
+    async def main(self):
+        self.inprogress = asyncio.Semaphore(self.corrector.settings['concurrency']) #pylint: disable=attribute-defined-outside-init
+        self.tasks = set() #pylint: disable=attribute-defined-outside-init
+        batches = OrderedDict() #module_id => [(job, unit_id, inputdata)], units queued for a module but not dispatched yet
+        delay = waited = 0.0
+        while not self._stop:
+            try:
+                #the queues are only ever accessed from the event loop's thread, we poll rather than block so the loop keeps running
+                jobindex, module_id, unit_id, inputdata, trace = self.inputqueue.get(False)
+            except Empty:
+                if batches:
+                    await self.flushasync(batches)
+                    continue
+                if self.inputready.is_set() and waited >= self.corrector.settings['timeout']:
+                    if self.debug: self.corrector.log(" (inputqueue timed out)")
+                    break
+                delay = min(max(delay * 2, 0.001), 0.05)
+                await asyncio.sleep(delay)
+                waited += delay
+                continue
+            delay = waited = 0.0
+            if module_id is None: #signals the last item (there will be one for each thread)
+                if self.debug: self.corrector.log(" (end of input queue)")
+                await self.flushasync(batches)
+                if self.tasks:
+                    await asyncio.wait(self.tasks)
+                self.done()
+                break
+            else:
+                module =  self.corrector.modules[module_id]
+                if (not module.UNITFILTER or module.UNITFILTER(inputdata)) and not module.submodule: #modules marked a submodule won't be called by the main process, but are invoked by other modules instead
+                    if module.id not in batches:
+                        batches[module.id] = []
+                    batches[module.id].append( (jobindex, unit_id, inputdata) )
+                    if trace is not None:
+                        self.traces[(jobindex, module.id, unit_id)] = trace + (time.time(),)
+                    if len(batches[module.id]) >= self.batchsize:
+                        await self.submit(module, batches.pop(module.id))
+                else:
+                    self.output(module, [jobindex], [unit_id], None, [inputdata])
+                    self.done()
+
+        if self.tasks:
+            await asyncio.wait(self.tasks)
+        for client in self.clients.values():
+            client.close()
+
+    async def flushasync(self, batches):
+        """Dispatch all pending batches, in order of the execution plan"""
+        for module in self.corrector:
+            if module.id in batches:
+                await self.submit(module, batches.pop(module.id))
+
+    async def submit(self, module, batch):
+        """Starts dispatching a batch in the background, waits first if the maximum number of requests is already in progress. Units with an output in the result store are answered right away"""
+        batch, traced = self.lookupbatch(module, batch, self.usestore(module))
+        if not batch:
+            return
+        await self.inprogress.acquire()
+        task = asyncio.ensure_future(self.dispatchasync(module, batch, traced))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def dispatchasync(self, module, batch, traced=()):
+        """Asynchronous counterpart of dispatch()"""
+        jobindices = [ jobindex for jobindex, _, _ in batch ]
+        unit_ids = [ unit_id for _, unit_id, _ in batch ]
+        inputs = [ inputdata for _, _, inputdata in batch ]
+        outputs = None
+        begintime = time.time()
+        self.corrector.metrics.begin(module.id, len(batch))
+        try:
+            module.prepare()
+            if module.local:
+                if len(batch) == 1:
+                    outputs = [ await self.loop.run_in_executor(self.localexecutor, lambda: module.runlocal(unit_ids[0], inputs[0], **self.parameters)) ]
+                else:
+                    outputs = await self.loop.run_in_executor(self.localexecutor, lambda: module.runlocalbatch(unit_ids, inputs, **self.parameters))
+                if traced:
+                    self.tracerequest(module, traced, 'run', begintime, time.time(), local=True)
+            else:
+                outputs = await self.dispatchremote(module, unit_ids, inputs, traced)
+                self.durationpermod[module.id] += time.time() - begintime
+                self.callspermod[module.id] += len(batch) #count units rather than requests, so the statistics remain comparable regardless of batch size
+            if self.debug:
+                module.log("[" + str(self.pid) + "] (...took " + str(round(time.time() - begintime,4)) + "s)")
+        except Exception: #pylint: disable=broad-except
+            module.log("[" + str(self.pid) + "] Processing failed for module " + module.id + ", units " + ",".join(unit_ids) + " (traceback follows), skipping...")
+            traceback.print_exc(file=sys.stderr)
+        finally:
+            self.corrector.metrics.end(module.id, len(batch), time.time() - begintime, outputs is not None)
+            if self.usestore(module):
+                self.store(module, inputs, outputs)
+            self.output(module, jobindices, unit_ids, outputs, inputs)
+            self.done(len(batch))
+            self.inprogress.release()
+
+    async def dispatchremote(self, module, unit_ids, inputs, traced=()):
+        """Sends the units to one of the servers of the module, returns their outputs (None if no server could process them)"""
+        traceid = traced[0][2] if traced else None #sent along with the requests
+        if module.id not in self.routers:
+            self.routers[module.id] = getrouter(module, self.random)
+        router = self.routers[module.id]
+        try:
+            attempts = 0
+            while True:
+                index = router.select()
+                server,port,load = module.getserver(index) #pylint: disable=unused-variable
+                attempts += 1
+                if attempts > 10 * len(module.servers):
+                    break #max 10 retries over all servers
+                router.begin(index, len(unit_ids))
+                requesttime = time.time()
+                try:
+                    if (server,port) not in self.clients:
+                        self.clients[(server,port)] = module.ASYNCCLIENT(server,port, self.corrector.settings['timeout'], unixsocket=module.unixsockets.get((server,port)))
+                    client = self.clients[(server,port)]
+                    if len(unit_ids) == 1:
+                        outputs = [ await client.request(inputs[0], traceid=traceid) ]
+                    elif self.pipeline:
+                        outputs = await asyncio.gather(*[ client.request(inputdata, traceid=traceid) for inputdata in inputs ])
+                    else:
+                        outputs = await client.request(inputs, batch=True, traceid=traceid)
+                    router.end(index, len(unit_ids), time.time() - requesttime, True)
+                    if traceid:
+                        self.tracerequest(module, traced, 'request', requesttime, time.time(), client.poptraces(traceid), server=server + ":" + str(port))
+                    return outputs
+                except Exception: #pylint: disable=broad-except
+                    router.end(index, len(unit_ids), time.time() - requesttime, False)
+                    module.log("[" + str(self.pid) + "] Server communication failed for server " + server +":" + str(port) + ", module " + module.id + ", passed units " + ",".join(unit_ids) + " (traceback follows in debug), moving on...")
+                    if self.debug:
+                        traceback.print_exc(file=sys.stderr)
+                    if (server,port) in self.clients and not self.clients[(server,port)].connected:
+                        del self.clients[(server,port)] #connection is broken, the next request will open a new one
+        except IndexError:
+            module.log("**ERROR** No servers started for " + module.id)
+        module.log("**ERROR** Unable to connect client to server! All servers for module " + module.id + " are down, skipping!")
+        return None
+
+
 
 
 
@@ -307,6 +1021,7 @@ class Corrector:
     def __init__(self, **settings):
         self.settings = settings
         self.modules = OrderedDict()
+        self.plan = None #execution plan, compiled from the module dependencies on first use
         self.verifysettings()
 
 
@@ -390,6 +1105,86 @@ class Corrector:
         if 'threads' not in self.settings:
             self.settings['threads'] = 1
 
+        if 'batchsize' in self.settings:
+            self.settings['batchsize'] = max(1,int(self.settings['batchsize']))
+        else:
+            self.settings['batchsize'] = 1 #number of units per module a processor groups together before sending them off in one go
+
+        if 'pipeline' in self.settings:
+            self.settings['pipeline'] = bool(self.settings['pipeline'])
+        else:
+            self.settings['pipeline'] = False #send batches as pipelined individual requests rather than as one batch request
+
+        if 'dispatcher' not in self.settings:
+            self.settings['dispatcher'] = 'processes' #processes (one request at a time per processor) or asyncio (many concurrent requests per processor)
+        elif self.settings['dispatcher'] not in ('processes','asyncio'):
+            raise Exception("Invalid dispatcher: " + self.settings['dispatcher'] + ", choose from processes, asyncio")
+
+        if 'concurrency' in self.settings:
+            self.settings['concurrency'] = max(1,int(self.settings['concurrency']))
+        else:
+            self.settings['concurrency'] = 100 #maximum number of requests in progress per processor with the asyncio dispatcher
+
+        if 'streaming' in self.settings:
+            self.settings['streaming'] = bool(self.settings['streaming'])
+        else:
+            self.settings['streaming'] = False #read and write FoLiA documents a chunk of paragraphs at a time, for documents that don't fit in memory
+
+        if 'streamchunk' in self.settings:
+            self.settings['streamchunk'] = max(1,int(self.settings['streamchunk']))
+        else:
+            self.settings['streamchunk'] = 10 #number of paragraphs per chunk in streaming mode
+
+        if 'streamcontext' in self.settings:
+            self.settings['streamcontext'] = max(0,int(self.settings['streamcontext']))
+        else:
+            self.settings['streamcontext'] = 1 #number of paragraphs before and after each chunk that modules get to see as context in streaming mode
+
+        if 'resultstore' not in self.settings or not self.settings['resultstore']:
+            self.settings['resultstore'] = None #no result store
+        elif self.settings['resultstore'] is True or str(self.settings['resultstore']).lower() in ('true','yes','1'):
+            self.settings['resultstore'] = self.root + "results.db" #SQLite database the master stores module outputs in, to reuse them for identical input in later documents and runs
+        elif self.settings['resultstore'][0] != '/':
+            self.settings['resultstore'] = self.root + self.settings['resultstore']
+
+        if 'tracefile' not in self.settings or not self.settings['tracefile']:
+            self.settings['tracefile'] = None #no tracing
+        elif self.settings['tracefile'][0] != '/':
+            self.settings['tracefile'] = self.root + self.settings['tracefile'] #file the master records the spans of sampled units in, Chrome trace format if it ends in .json, JSON lines otherwise
+
+        if 'tracesample' in self.settings:
+            self.settings['tracesample'] = min(1.0,max(0.0,float(self.settings['tracesample'])))
+        else:
+            self.settings['tracesample'] = 0.01 #fraction of the units that is traced
+
+        if 'metricsport' in self.settings:
+            self.settings['metricsport'] = int(self.settings['metricsport'])
+        else:
+            self.settings['metricsport'] = 0 #port on localhost where the master serves its metrics over HTTP while processing, 0 for none
+
+        if 'maxdocuments' in self.settings:
+            self.settings['maxdocuments'] = max(1,int(self.settings['maxdocuments']))
+        else:
+            self.settings['maxdocuments'] = 4 #maximum number of documents in memory at the same time when correcting multiple documents
+
+        if 'unixsockets' in self.settings:
+            self.settings['unixsockets'] = bool(self.settings['unixsockets'])
+        else:
+            self.settings['unixsockets'] = True #module servers also listen on a Unix domain socket, which clients on the same host use instead of TCP
+
+        if 'heartbeat' in self.settings:
+            self.settings['heartbeat'] = float(self.settings['heartbeat'])
+        else:
+            self.settings['heartbeat'] = 5.0 #interval (in seconds) at which module servers report their load to the server registry, 0 to disable
+
+        if 'registryttl' in self.settings:
+            self.settings['registryttl'] = float(self.settings['registryttl'])
+        else:
+            self.settings['registryttl'] = 3 * self.settings['heartbeat'] #servers that haven't reported for this long are probed again
+
+        if 'directedits' not in self.settings:
+            self.settings['directedits'] = True #apply edit records returned by modules directly through the FoLiA API rather than through FQL
+
         if 'minpollinterval' not in self.settings:
             self.settings['minpollinterval'] = 60 #60 sec
 
@@ -433,22 +1228,127 @@ class Corrector:
 
 
     def run(self,filename,modules,outputfile,dumpxml,dumpjson,**parameters):
+        """Corrects one or more documents. Filename may be a FoLiA document, a filename, a directory (all files in it are corrected) or a glob pattern, or a list of these. The documents are processed together, by the same processors.
+
+        When correcting multiple documents, outputfile is taken to be a directory (created if it doesn't exist)"""
+        if isinstance(filename, (str, folia.Document)):
+            filename = [filename]
+        documents = [ doc for doc in filename if not isinstance(doc, str) ] + expandfiles([ doc for doc in filename if isinstance(doc, str) ])
+        if not documents:
+            raise Exception("No input documents found")
+        if outputfile and (len(documents) > 1 or os.path.isdir(outputfile)):
+            if not os.path.exists(outputfile):
+                os.makedirs(outputfile)
+            elif not os.path.isdir(outputfile):
+                raise Exception("Output must be a directory when correcting multiple documents: " + outputfile)
+            jobs = []
+            for doc in documents:
+                if isinstance(doc, str):
+                    jobs.append( Job(doc, modules, os.path.join(outputfile, os.path.basename(foliafilename(doc))), dumpxml, dumpjson, **parameters) )
+                elif doc.filename:
+                    jobs.append( Job(doc, modules, os.path.join(outputfile, os.path.basename(doc.filename)), dumpxml, dumpjson, **parameters) )
+                else:
+                    jobs.append( Job(doc, modules, os.path.join(outputfile, doc.id + '.folia.xml'), dumpxml, dumpjson, **parameters) )
+        else:
+            jobs = [ Job(doc, modules, outputfile, dumpxml, dumpjson, **parameters) for doc in documents ]
+        self.log("Correcting " + str(len(jobs)) + " document(s)")
+        self.process(jobs, **parameters)
+
+    def serve(self, socketpath=None, **parameters):
+        """Runs the corrector as a daemon: the modules are loaded and the processors started once, documents are submitted over a Unix domain socket (gecco submit) until a client asks for a shutdown"""
+        if not socketpath:
+            socketpath = self.socketpath()
+        self.process(None, socketpath, **parameters)
+
+    def socketpath(self):
+        """Default path of the socket of the daemon"""
+        if not os.path.exists(self.root + "/run"):
+            os.mkdir(self.root + "/run")
+        return os.path.join(self.root, "run", self.settings['id'] + ".sock")
+
+    def submit(self, filename, modules, outputfile, dumpxml, dumpjson, socketpath=None, **parameters):
+        """Submits a document to a running daemon (see serve()) and waits for it to be corrected. Returns the response of the daemon"""
+        if not socketpath:
+            socketpath = self.socketpath()
+        request = {'filename': os.path.abspath(filename), 'modules': modules, 'dumpxml': bool(dumpxml), 'dumpjson': bool(dumpjson)} #the daemon may run in another directory
+        if outputfile:
+            request['outputfile'] = os.path.abspath(outputfile)
+        if 'metadata' in parameters:
+            request['metadata'] = parameters['metadata']
+            del parameters['metadata']
+        request['parameters'] = parameters
+        return self.request(request, socketpath)
+
+    def shutdown(self, socketpath=None):
+        """Asks a running daemon to shut down once all submitted documents are done"""
+        if not socketpath:
+            socketpath = self.socketpath()
+        return self.request({'command': 'shutdown'}, socketpath)
+
+    def getmetrics(self, socketpath=None):
+        """Collects the metrics of the running daemon (if any) and of all module servers, returns them as one text in the Prometheus format"""
+        if not socketpath:
+            socketpath = self.socketpath()
+        texts = []
+        if os.path.exists(socketpath):
+            response = self.request({'command': 'metrics'}, socketpath)
+            if response['status'] == 'ok':
+                texts.append(response['metrics'])
+        for module_id, host, port, _ in self.findservers():
+            client = LineByLineClient(host, port, 10)
+            try:
+                texts.append(json.loads(client.communicate("%METRICS%")))
+            except Exception as e: #pylint: disable=broad-except
+                self.log("Unable to get the metrics of " + module_id + "@" + host + ":" + str(port) + ": " + str(e))
+            finally:
+                client.close()
+        return mergemetrics(texts)
+
+    def request(self, request, socketpath):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socketpath)
+        except OSError:
+            raise Exception("Unable to connect to the daemon at " + socketpath + ", is gecco serve running?")
+        try:
+            sock.sendall(json.dumps(request).encode('utf-8') + b"\n")
+            response = sock.makefile('rb').readline()
+        finally:
+            sock.close()
+        if not response:
+            raise Exception("Daemon closed the connection without a response")
+        return json.loads(str(response,'utf-8'))
+
+    def process(self, jobs, socketpath=None, **parameters):
+        """Corrects the documents of the jobs, or those submitted to the socket if socketpath is set"""
         self.load()
-        inputqueue = Queue()
-        outputqueue = Queue()
-        timequeue = Queue()
-        infoqueue = Queue()
+        inputqueue = getqueue(self.settings)
+        outputqueue = getqueue(self.settings)
+        timequeue = Queue() #carries one summary per processor
+        infoqueue = Queue() #carries one summary from the data thread
         waitforprocessors = Lock()
         waitforprocessors.acquire(False)
-        datathread = DataThread(self,filename,modules, outputfile, inputqueue, outputqueue, infoqueue,waitforprocessors,dumpxml,dumpjson,**parameters) #fills inputqueue
-        datathread.start() #processes outputqueue
+        inputready = Event()
+        for module in self.modules.values():
+            if not module.local and module.servers and module.settings['routing'] == 'leastoutstanding':
+                module.outstanding = Array('i', len(module.servers)) #shared by all processors
+        self.metrics = Metrics('gecco_master', self.modules.keys(), fields=MASTERMETRICS) #shared by the data thread and the processors
+        self.tracer = None
+        if self.settings['tracefile']:
+            self.tracer = Tracer(self.settings['tracefile'], self.settings['tracesample'])
+            self.tracer.create()
+        datathread = DataThread(self,jobs,socketpath, inputqueue, outputqueue, infoqueue,waitforprocessors,inputready,**parameters)
+        datathread.start() #loads the documents, fills inputqueue and processes outputqueue
 
         begintime = time.time()
         self.log("Processing modules")
 
         threads = []
         for _ in range(self.settings['threads']):
-            thread = ProcessorThread(self, inputqueue, outputqueue, timequeue,**parameters)
+            if self.settings['dispatcher'] == 'asyncio':
+                thread = AsyncProcessorThread(self, inputqueue, outputqueue, timequeue, inputready,**parameters)
+            else:
+                thread = ProcessorThread(self, inputqueue, outputqueue, timequeue, inputready,**parameters)
             threads.append(thread)
         self.log(str(len(threads)) + " threads ready.")
 
@@ -459,32 +1359,29 @@ class Corrector:
         sys.stderr.flush()
 
         waitforprocessors.release()
-        inputqueue.join()
+        while True: #the data thread sends its summary once all documents are done
+            try:
+                infopermod = defaultdict(int, infoqueue.get(True, 1)) #read before joining, the data thread can't end before its summary is consumed
+                break
+            except Empty:
+                if not datathread.is_alive():
+                    raise Exception("Data thread ended before all documents were processed")
 
         inputduration = time.time() - begintime
         self.log("Input queue processed (" + str(inputduration) + "s)")
-        outputqueue.put( (None,None,None,None) ) #signals the end of the queue
         datathread.join()
-        infopermod = defaultdict(int)
-        while True:
-            module_id = infoqueue.get(True, self.settings['timeout'])
-            if module_id is None:
-                break
-            infopermod[module_id] += 1
         duration = time.time() - begintime
-        timequeue.put((None,None))
         virtualdurationpermod = defaultdict(float)
         callspermod = defaultdict(int)
 
         virtualduration = 0.0
-        while True:
-            modid, x = timequeue.get(True, self.settings['timeout'])
-            if modid is None:
-                break
-            else:
+        for _ in threads:
+            durations, calls = timequeue.get(True, self.settings['timeout'])
+            for modid, x in durations.items():
                 virtualdurationpermod[modid] += x
-                callspermod[modid] += 1
                 virtualduration += x
+            for modid, x in calls.items():
+                callspermod[modid] += x
         for modid, d in sorted(virtualdurationpermod.items(),key=lambda x: x[1] * -1):
             print("\t"+modid + "\t" + str(round(d,4)) + "s\t" + str(callspermod[modid]) + " calls\t" + str(infopermod[modid]) + " corrections",file=sys.stderr)
 
@@ -492,6 +1389,8 @@ class Corrector:
         self.log("Cleanup...")
         for thread in threads:
             thread.stop() #custom
+        if self.tracer is not None:
+            self.tracer.close()
         self.log("Processing done (real total " + str(round(duration,2)) + "s , virtual output " + str(virtualduration) + "s, real input " + str(inputduration) + "s)")
 
         if 'exit' in parameters and parameters['exit']:
@@ -506,29 +1405,18 @@ class Corrector:
 
     def __iter__(self):
         #iterate in proper dependency order:
-        done = set()
+        return iter(self.getplan())
 
-        modules = self.modules.values()
-        while modules:
-            postpone = []
-            for module in self.modules.values():
-                if module.settings['depends']:
-                    for dep in module.settings['depends']:
-                        if dep not in done:
-                            postpone.append(module)
-                            break
-                if module not in postpone:
-                    done.add(module.id)
-                    yield module
-
-            if modules == postpone:
-                raise Exception("There are unsolvable (circular?) dependencies in your module definitions")
-            else:
-                modules = postpone
+    def getplan(self):
+        if self.plan is None:
+            self.plan = ExecutionPlan(list(self.modules.values()))
+        return self.plan
 
     def append(self, module):
         assert isinstance(module, Module)
         self.modules[module.id] = module
+        self.units.add(module.UNIT)
+        self.plan = None #recompile on next use
 
     def train(self,module_ids=[], **parameters): #pylint: disable=dangerous-default-value
         for module in self:
@@ -539,6 +1427,16 @@ class Corrector:
                         if (isinstance(sourcefile, tuple) and not all([os.path.exists(f) for f in sourcefile])) or not os.path.exists(sourcefile):
                             raise Exception("[" + module.id + "] Source file not found: " + sourcefile)
                         module.train(sourcefile, modelfile, **parameters)
+                        self.purgeresults(module)
+
+    def purgeresults(self, module):
+        """Removes the outputs of the module from the result store, called when its models change"""
+        if self.settings['resultstore'] and os.path.exists(self.settings['resultstore']):
+            resultstore = ResultStore(self.settings['resultstore'])
+            count = resultstore.purge(module.id)
+            resultstore.close()
+            if count:
+                self.log("Purged " + str(count) + " stored results of module " + module.id)
 
     def evaluate(self, args):
         if args.parameters:
@@ -566,17 +1464,11 @@ class Corrector:
 
         inputfiles = []
         if args.inputfilename != '-':
-            if os.path.isdir(args.inputfilename):
-                for root, _, files in os.walk(args.inputfilename):
-                    for name in files:
-                        inputfiles.append(os.path.join(root,name))
-                        if outputdir:
-                            outputfiles.append(os.path.join(outputdir,name))
-
-            elif os.path.isfile(args.inputfilename):
-                inputfiles = [args.inputfilename]
-            else:
-                raise Exception("Input file not found", args.inputfilename)
+            inputfiles = expandfiles([args.inputfilename])
+            if outputdir:
+                outputfiles = [ os.path.join(outputdir,os.path.basename(inputfilename)) for inputfilename in inputfiles ]
+            elif len(inputfiles) > 1:
+                raise Exception("Output must be a directory when evaluating multiple input files", args.outputfilename)
         else:
             if os.path.isdir(args.outputfilename):
                 for root, _, files in os.walk(args.outputfilename):
@@ -590,8 +1482,9 @@ class Corrector:
 
         evaldata = gecco.helpers.evaluation.Evaldata()
         if inputfiles:
-            for inputfilename, outputfilename in zip(inputfiles, outputfiles):
-                self.run(inputfilename,modules,outputfilename, False,False,**parameters)
+            #all documents are corrected in one go, sharing the processors
+            self.process([ Job(inputfilename,modules,outputfilename, False,False,**parameters) for inputfilename, outputfilename in zip(inputfiles, outputfiles) ], **parameters)
+            for outputfilename in outputfiles:
                 if refdir:
                     referencefilename = os.path.join(refdir, os.path.basename(outputfilename))
                 else:
@@ -635,6 +1528,7 @@ class Corrector:
                                 if os.path.exists(modelfile):
                                     self.log("Deleting model " + modelfile + "...")
                                     module.reset(modelfile, sourcefile)
+                                    self.purgeresults(module)
 
 
 
@@ -703,6 +1597,11 @@ class Corrector:
                     except ProcessLookupError:
                         self.log("(process already dead)")
                     os.unlink(runpath + module.id + "." + host + "." + str(port) + ".pid")
+                    if os.path.exists(heartbeatfile(runpath, module.id, host, port)):
+                        os.unlink(heartbeatfile(runpath, module.id, host, port))
+                    socketpath = unixsocketpath(runpath, module.id, host, port)
+                    if socketpath is not None and os.path.exists(socketpath):
+                        os.unlink(socketpath)
 
 
 
@@ -713,11 +1612,13 @@ class Corrector:
         #reset servers for modules
         for module in self.modules.values():
             module.servers = []
+            module.unixsockets = {}
 
         servers = []
 
         runpath = self.root + "/run/"
         if os.path.exists(runpath):
+            candidates = [] #(module, host, port) for every pid file
             for filename in glob(runpath + "/*.pid"):
                 filename = os.path.basename(filename)
                 fields = filename.split('.')[:-1]
@@ -728,32 +1629,38 @@ class Corrector:
                     continue
                 host = ".".join(fields[1:-1])
                 port = int(fields[-1])
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(0.25) #module servers have to respond very quickly or we ignore them
-                try:
-                    sock.connect( (host,port) )
-                    sock.sendall(b"%GETLOAD%\n")
-                    load = float(sock.recv(1024))
+                candidates.append( (module, host, port) )
+
+            #servers with a recent heartbeat in the registry are trusted, the others are probed concurrently
+            loads = [ readheartbeat(heartbeatfile(runpath, module.id, host, port), self.settings['registryttl']) for module, host, port in candidates ]
+            unknown = [ i for i, load in enumerate(loads) if load is None ]
+            for i, load in zip(unknown, probeall([ candidates[i][1:] for i in unknown ])):
+                loads[i] = load
+
+            for (module, host, port), load in zip(candidates, loads):
+                if isinstance(load, socket.timeout):
+                    self.log("Connection to " + module.id + "@" +host+":" + str(port) + " timed out")
+                elif isinstance(load, ConnectionRefusedError):
+                    self.log("Connection to " + module.id + "@" +host+":" + str(port) + " refused")
+                elif isinstance(load, Exception):
+                    self.log("Connection to " + module.id + "@" +host+":" + str(port) + " failed")
+                else:
                     module.servers.append( (host,port,load) )
+                    socketpath = unixsocketpath(runpath, module.id, host, port)
+                    if self.settings['unixsockets'] and socketpath is not None and islocalhost(host) and os.path.exists(socketpath):
+                        module.unixsockets[(host,port)] = socketpath
                     if hasattr(module,'forcelocal') and  module.forcelocal:
                         module.local = True
                     servers.append( (module.id, host,port,load) )
-                except socket.timeout:
-                    self.log("Connection to " + module.id + "@" +host+":" + str(port) + " timed out")
-                    continue
-                except ConnectionRefusedError:
-                    self.log("Connection to " + module.id + "@" +host+":" + str(port) + " refused")
-                    continue
-                except ValueError:
-                    self.log("Connection to " + module.id + "@" +host+":" + str(port) + " failed")
-                    continue
 
         return servers
 
 
-    def startserver(self, module_id, host, port):
+    def startserver(self, module_id, host, port, workers=None):
         """Start one particular module's server. This method will be launched by server() in different processes"""
         module = self.modules[module_id]
+        if workers:
+            module.settings['workers'] = max(1,int(workers))
         self.log("Loading module")
         module.load()
         self.log("Running server " + module_id+"@"+host+":"+str(port) + " ...")
@@ -769,14 +1676,32 @@ class Corrector:
         subparsers = parser.add_subparsers(dest='command',title='Commands')
         parser_run = subparsers.add_parser('run', help="Run the spelling corrector on the specified input file")
         parser_run.add_argument('-o',dest="outputfile", help="Output filename (if not specified, the input file will be edited in-place",required=False,default="")
-        parser_run.add_argument('-O',dest="dumpxml", help="Print result document to stdout as FoLiA XML", required=False)
+        parser_run.add_argument('-O',dest="dumpxml", help="Print result document to stdout as FoLiA XML", action='store_true',default=False, required=False)
         parser_run.add_argument('--json',dest="dumpjson", help="Print result document to stdout as JSON", action='store_true',default=False, required=False)
-        parser_run.add_argument('filename', help="The file to correct, can be either a FoLiA XML file or a plain-text file which will be automatically tokenised and converted on-the-fly. The XML file will also be the output file. The XML file is edited in place, it will also be the output file unless -o is specified")
-        parser_run.add_argument('modules', help="Only run the modules with the specified IDs (comma-separated list) (if omitted, all modules are run)", nargs='?',default="")
+        parser_run.add_argument('filenames', help="The files to correct, can be either FoLiA XML files or plain-text files which will be automatically tokenised and converted on-the-fly. Directories (all files in them) and glob patterns are accepted as well. The XML file is edited in place, it will also be the output file unless -o is specified (a directory when correcting multiple documents). Optionally followed by the IDs of the modules to run (comma-separated list) (if omitted, all modules are run)", nargs='+')
         parser_run.add_argument('-p',dest='parameters', help="Custom parameters passed to the modules, specify as -p parameter=value. This option can be issued multiple times", required=False, action="append")
         parser_run.add_argument('-m',dest='metadata', help="Set extra metadata to be included in the resulting FoLiA document, specify as -m key=value. This options can be issued multiple times ", required=False, action="append")
         parser_run.add_argument('-s',dest='settings', help="Setting overrides, specify as -s setting=value. This option can be issues multiple times.", required=False, action="append")
         parser_run.add_argument('--local', help="Run all modules locally, ignore remote servers", required=False, action='store_true',default=False)
+        parser_run.add_argument('--stream', help="Read and write FoLiA documents a chunk of paragraphs at a time rather than loading them as a whole, for documents that don't fit in memory", required=False, action='store_true',default=False)
+        parser_serve = subparsers.add_parser('serve', help="Run the spelling corrector as a daemon that keeps all modules loaded, documents are submitted to it with 'submit'")
+        parser_serve.add_argument('--socket',dest="socketpath", help="Unix domain socket to accept documents on (default: run/<id>.sock in the root directory)", required=False,default="")
+        parser_serve.add_argument('-p',dest='parameters', help="Custom parameters passed to the modules, specify as -p parameter=value. This option can be issued multiple times", required=False, action="append")
+        parser_serve.add_argument('-s',dest='settings', help="Setting overrides, specify as -s setting=value. This option can be issues multiple times.", required=False, action="append")
+        parser_serve.add_argument('--local', help="Run all modules locally, ignore remote servers", required=False, action='store_true',default=False)
+        parser_submit = subparsers.add_parser('submit', help="Submit a document to a running daemon (see 'serve') and wait for it to be corrected")
+        parser_submit.add_argument('-o',dest="outputfile", help="Output filename (if not specified, the input file will be edited in-place",required=False,default="")
+        parser_submit.add_argument('-O',dest="dumpxml", help="Print result document to stdout as FoLiA XML", action='store_true',default=False, required=False)
+        parser_submit.add_argument('--json',dest="dumpjson", help="Print result document to stdout as JSON", action='store_true',default=False, required=False)
+        parser_submit.add_argument('--socket',dest="socketpath", help="Unix domain socket of the daemon (default: run/<id>.sock in the root directory)", required=False,default="")
+        parser_submit.add_argument('filename', help="The file to correct, can be either a FoLiA XML file or a plain-text file which will be automatically tokenised and converted on-the-fly")
+        parser_submit.add_argument('modules', help="Only run the modules with the specified IDs (comma-separated list) (if omitted, all modules are run)", nargs='?',default="")
+        parser_submit.add_argument('-p',dest='parameters', help="Custom parameters passed to the modules, specify as -p parameter=value. This option can be issued multiple times", required=False, action="append")
+        parser_submit.add_argument('-m',dest='metadata', help="Set extra metadata to be included in the resulting FoLiA document, specify as -m key=value. This options can be issued multiple times ", required=False, action="append")
+        parser_shutdown = subparsers.add_parser('shutdown', help="Shut down a running daemon, once the documents submitted to it are done")
+        parser_shutdown.add_argument('--socket',dest="socketpath", help="Unix domain socket of the daemon (default: run/<id>.sock in the root directory)", required=False,default="")
+        parser_metrics = subparsers.add_parser('metrics', help="Print the metrics of the running daemon and of all module servers, in the Prometheus text format")
+        parser_metrics.add_argument('--socket',dest="socketpath", help="Unix domain socket of the daemon (default: run/<id>.sock in the root directory)", required=False,default="")
         parser_startservers = subparsers.add_parser('startservers', help="Starts all the module servers, or the modules explicitly specified, on the current host. Issue once for each host.")
         parser_startservers.add_argument('modules', help="Only start server for modules with the specified IDs (comma-separated list) (if omitted, all modules are run)", nargs='?',default="")
         parser_stopservers = subparsers.add_parser('stopservers', help="Stops all the module servers, or the modules explicitly specified,  on the current host. Issue once for each host.")
@@ -786,6 +1711,7 @@ class Corrector:
         parser_startserver.add_argument('module', help="Module ID")
         parser_startserver.add_argument('host', help="Host/IP to bind to")
         parser_startserver.add_argument('port', type=int, help="Port")
+        parser_startserver.add_argument('-w','--workers', type=int, help="Number of worker processes, overrides the workers setting of the module", required=False)
         parser_train = subparsers.add_parser('train', help="Train modules")
         parser_train.add_argument('modules', help="Only train for modules with the specified IDs (comma-separated list) (if omitted, all modules are trained)", nargs='?',default="")
         parser_train.add_argument('-p',dest='parameters', help="Custom parameters passed to the modules, specify as -p parameter=value. This option can be issued multiple times", required=False, action="append")
@@ -830,8 +1756,38 @@ class Corrector:
             if args.parameters: parameters = dict(( tuple(p.split('=')) for p in args.parameters))
             if args.metadata: parameters['metadata'] = dict(( tuple(p.split('=')) for p in args.metadata))
             parameters['exit'] = True #force exit from run(), prevent stale processes
+            if args.stream: self.settings['streaming'] = True
+            filenames = args.filenames
+            if len(filenames) > 1 and not os.path.exists(filenames[-1]) and all( module_id in self.modules for module_id in filenames[-1].split(',') ):
+                #the last argument is the list of modules to run
+                modules = filenames[-1].split(',')
+                filenames = filenames[:-1]
+            self.run(filenames,modules,args.outputfile,args.dumpxml, args.dumpjson,**parameters)
+        elif args.command == 'serve':
+            for module in self.modules.values():
+                module.forcelocal = args.local
+            if args.parameters: parameters = dict(( tuple(p.split('=')) for p in args.parameters))
+            parameters['exit'] = True #force exit from serve(), prevent stale processes
+            self.serve(args.socketpath,**parameters)
+        elif args.command == 'submit':
+            if args.parameters: parameters = dict(( tuple(p.split('=')) for p in args.parameters))
+            if args.metadata: parameters['metadata'] = dict(( tuple(p.split('=')) for p in args.metadata))
             if args.modules: modules = args.modules.split(',')
-            self.run(args.filename,modules,args.outputfile,args.dumpxml, args.dumpjson,**parameters)
+            response = self.submit(args.filename,modules,args.outputfile,args.dumpxml,args.dumpjson,args.socketpath,**parameters)
+            if response['status'] != 'ok':
+                print("Daemon failed to process the document: " + response['message'],file=sys.stderr)
+                sys.exit(1)
+            for modid, count in sorted(response['corrections'].items()):
+                print("\t" + modid + "\t" + str(count) + " corrections",file=sys.stderr)
+            if 'xml' in response:
+                print(response['xml'])
+            if 'json' in response:
+                print(json.dumps(response['json']))
+        elif args.command == 'shutdown':
+            self.shutdown(args.socketpath)
+            self.log("Daemon is shutting down")
+        elif args.command == 'metrics':
+            print(self.getmetrics(args.socketpath), end="")
         elif args.command == 'startservers':
             if args.modules: modules = args.modules.split(',')
             self.startservers(modules)
@@ -839,7 +1795,7 @@ class Corrector:
             if args.modules: modules = args.modules.split(',')
             self.stopservers(modules)
         elif args.command == 'startserver':
-            self.startserver(args.module, args.host, args.port)
+            self.startserver(args.module, args.host, args.port, args.workers)
         elif args.command == 'listservers' or args.command == 'ls':
             servers = self.findservers()
             if not servers:
@@ -880,26 +1836,168 @@ class Corrector:
 
 
 class LineByLineClient:
-    """Simple communication protocol between client and server, newline-delimited"""
+    """Communication protocol between client and server. Negotiates the framed binary protocol (see gecco.helpers.protocol) on connect and falls back to newline-delimited JSON for servers that do not support it"""
 
-    def __init__(self, host, port,timeout=120):
+    def __init__(self, host, port,timeout=120, codecs=None, unixsocket=None):
         self.host = host
         self.port = port
         self.timeout = timeout
+        self.unixsocket = unixsocket #path of the server's Unix domain socket, used instead of TCP if set
         self.connected = False
+        self.requestid = 0 #last request ID issued for pipelined communication
+        if codecs is None:
+            codecs = list(protocol.CODECS.keys())
+        self.codecs = codecs #codecs to offer to the server, in order of preference, set to an empty list to use the line-based protocol only
+        self.codec = None #codec negotiated with the server, None when using the line-based protocol
+        self.traceid = None #trace ID sent along with requests, set by the processor while it sends a traced unit
+        self.traces = [] #trace records the server returned for traced requests, see poptraces()
 
     def connect(self):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM) #pylind: disable=attribute-defined-outside-init
-        self.socket.settimeout(self.timeout)
-        self.socket.connect( (self.host,self.port) )
+        if self.unixsocket:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) #pylint: disable=attribute-defined-outside-init
+            self.socket.settimeout(self.timeout)
+            try:
+                self.socket.connect(self.unixsocket)
+            except OSError:
+                #socket is gone, use TCP from now on
+                self.socket.close()
+                self.unixsocket = None
+        if not self.unixsocket:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM) #pylind: disable=attribute-defined-outside-init
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.socket.settimeout(self.timeout)
+            self.socket.connect( (self.host,self.port) )
+        self.reader = self.socket.makefile('rb') #pylint: disable=attribute-defined-outside-init
         self.connected = True
+        if self.codecs:
+            self.negotiate()
+
+    def negotiate(self):
+        """Offer the framed protocol to the server"""
+        self.socket.sendall(("%HELLO% " + str(protocol.PROTOCOL_VERSION) + " " + ",".join(self.codecs) + "\n").encode('utf-8'))
+        answer = str(self.reader.readline(),'utf-8').split()
+        if answer and answer[0] == "%HELLO%":
+            if int(answer[1]) >= 2 and len(answer) > 2:
+                self.codec = protocol.CODECS[answer[2]]
+        else:
+            #old server that closed the connection on the unknown greeting, reconnect and stick to the line-based protocol from now on
+            self.codecs = []
+            self.close()
+            self.connect()
+
+    def nextrequestid(self):
+        self.requestid = self.requestid % 0xffffffff + 1
+        return self.requestid
+
+    def request(self, inputdata, batch=False):
+        """Sends inputdata to the server and returns the outputdata, serialisation is handled by the negotiated codec"""
+        if not self.connected: self.connect()
+        if self.codec is None:
+            msg = ("%BATCH%" if batch else "") + json.dumps(inputdata)
+            if self.traceid:
+                msg = protocol.traceline(self.traceid, msg)
+            return json.loads(self.untrace(self.communicate(msg)))
+        protocol.writeframe(self.socket, *self.frame(protocol.BATCH if batch else protocol.REQUEST, self.codec.dumps(inputdata)))
+        return self.receiveframe()[1]
+
+    def requestmany(self, inputs):
+        """Pipelined version of request(): sends all inputs at once as separate requests, without waiting in between, returns the outputdata in the order of the inputs"""
+        if not self.connected: self.connect()
+        if self.codec is None:
+            msgs = [ json.dumps(x) for x in inputs ]
+            if self.traceid:
+                msgs = [ protocol.traceline(self.traceid, msg) for msg in msgs ]
+            return [ json.loads(self.untrace(response)) for response in self.communicatemany(msgs) ]
+        requestids = [ self.nextrequestid() for _ in inputs ]
+        self.socket.sendall(b"".join( protocol.packframe(*self.frame(protocol.REQUEST, self.codec.dumps(inputdata), requestid)) for requestid, inputdata in zip(requestids, inputs) ))
+        responses = {}
+        try:
+            while len(responses) < len(requestids):
+                requestid, outputdata = self.receiveframe()
+                responses[requestid] = outputdata
+        except Exception:
+            self.close() #responses to the other requests may still be underway, they must not be taken for answers to later requests
+            raise
+        return [ responses[requestid] for requestid in requestids ]
+
+    def receiveframe(self):
+        frame = protocol.readframe(self.reader)
+        if frame is None:
+            raise ConnectionError("Connection closed by server")
+        frametype, requestid, payload = frame
+        if frametype == protocol.ERROR:
+            raise Exception("Server failed on request " + str(requestid) + ": " + str(payload,'utf-8'))
+        if frametype & protocol.TRACED:
+            trace, payload = protocol.unpacktrace(payload)
+            self.traces.append(json.loads(trace))
+        return requestid, self.codec.loads(payload)
+
+    def frame(self, frametype, payload, requestid=0):
+        """Returns the arguments for protocol.writeframe() (after the socket) for a request, with the trace ID if one is set"""
+        if self.traceid:
+            return frametype | protocol.TRACED, requestid, protocol.packtrace(self.traceid, payload)
+        return frametype, requestid, payload
+
+    def untrace(self, answer):
+        """Strips the trace record from a line-based response, keeping it in self.traces"""
+        trace, answer = protocol.untraceline(answer)
+        if trace is not None:
+            self.traces.append(json.loads(trace))
+        return answer
+
+    def poptraces(self, traceid):
+        """Returns and forgets the trace records the server returned for requests with the trace ID"""
+        traces = [ trace for trace in self.traces if trace.get('id') == traceid ]
+        self.traces = [ trace for trace in self.traces if trace.get('id') != traceid ]
+        return traces
 
     def communicate(self, msg):
+        if not self.connected: self.connect()
+        if self.codec is not None:
+            #framed connection, translate the raw JSON message for callers that talk to the client directly
+            if isinstance(msg, bytes): msg = str(msg,'utf-8')
+            msg = msg.strip()
+            if msg == "%GETLOAD%":
+                protocol.writeframe(self.socket, protocol.GETLOAD, 0, b"")
+                return str(self.receiveframe()[1])
+            elif msg == "%METRICS%":
+                protocol.writeframe(self.socket, protocol.METRICS, 0, b"")
+                return json.dumps(self.receiveframe()[1])
+            elif msg.startswith("%BATCH%"):
+                return json.dumps(self.request(json.loads(msg[7:]), True))
+            else:
+                return json.dumps(self.request(json.loads(msg)))
         self.send(msg)
         answer = self.receive()
         #print("Output: [" + msg + "], Response: [" + answer + "]",file=sys.stderr)
         return answer
 
+    def communicatemany(self, msgs):
+        """Pipelined communication: sends all messages at once, each tagged with a request ID, without waiting for any response in between. The server may answer in any order, responses are matched by their ID and returned in the order of the messages."""
+        if not self.connected: self.connect()
+        if self.codec is not None:
+            return [ json.dumps(outputdata) for outputdata in self.requestmany([ json.loads(msg) for msg in msgs ]) ]
+        requestids = []
+        buffer = []
+        for msg in msgs:
+            requestids.append(str(self.nextrequestid()))
+            if isinstance(msg, bytes): msg = str(msg,'utf-8')
+            buffer.append("%REQ%" + requestids[-1] + " " + msg.rstrip("\n") + "\n")
+        self.socket.sendall("".join(buffer).encode('utf-8'))
+        responses = {}
+        while len(responses) < len(requestids):
+            answer = self.receive()
+            if answer.startswith("%RES%"):
+                requestid, _, response = answer[5:].partition(" ")
+                responses[requestid] = response
+            elif answer.startswith("%ERR%"):
+                requestid, _, error = answer[5:].partition(" ")
+                self.close() #responses to the other requests may still be underway, they must not be taken for answers to later requests
+                raise Exception("Server failed on request " + requestid + ": " + error)
+            else:
+                raise Exception("Unexpected response from server, does it support pipelining? " + answer[:100])
+        return [ responses[requestid] for requestid in requestids ]
+
     def send(self, msg):
         if not self.connected: self.connect()
         if isinstance(msg, str): msg = msg.encode('utf-8')
@@ -908,48 +2006,272 @@ class LineByLineClient:
 
     def receive(self):
         if not self.connected: self.connect()
-        buffer = b''
-        cont_recv = True
-        while cont_recv:
-            chunk = self.socket.recv(1024)
-            if not chunk or chunk[-1] == 10: #newline
-                cont_recv = False
-            buffer += chunk
-        return str(buffer,'utf-8').strip()
+        return str(self.reader.readline(),'utf-8').strip()
 
     def close(self):
         if self.connected:
+            self.reader.close()
             self.socket.close()
             self.connected = False
+            self.codec = None
+
+class AsyncClient:
+    """Client used by the asyncio dispatcher. Any number of requests may be in progress at the same time over its single connection, responses are matched to requests by their request ID. Uses the framed protocol if the server supports it, otherwise pipelined line-based requests"""
+
+    def __init__(self, host, port, timeout=120, codecs=None, unixsocket=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.unixsocket = unixsocket #path of the server's Unix domain socket, used instead of TCP if set
+        self.connected = False
+        self.connecting = None #future of a connection attempt in progress
+        self.requestid = 0
+        if codecs is None:
+            codecs = list(protocol.CODECS.keys())
+        self.codecs = codecs
+        self.codec = None
+        self.waiting = {} #request ID => future of the response
+        self.traces = [] #trace records the server returned for traced requests, see poptraces()
+
+    async def connect(self):
+        if self.connecting is None:
+            self.connecting = asyncio.ensure_future(self.open())
+        try:
+            await asyncio.shield(self.connecting)
+        finally:
+            if self.connecting is not None and self.connecting.done():
+                self.connecting = None
+
+    async def open(self):
+        if self.unixsocket:
+            try:
+                self.reader, self.writer = await asyncio.wait_for(asyncio.open_unix_connection(self.unixsocket, limit=2**31-1), self.timeout) #pylint: disable=attribute-defined-outside-init
+            except OSError:
+                self.unixsocket = None #socket is gone, use TCP from now on
+        if not self.unixsocket:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port, limit=2**31-1), self.timeout) #pylint: disable=attribute-defined-outside-init
+        sock = self.writer.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.codec = None
+        if self.codecs:
+            self.writer.write(("%HELLO% " + str(protocol.PROTOCOL_VERSION) + " " + ",".join(self.codecs) + "\n").encode('utf-8'))
+            answer = str(await asyncio.wait_for(self.reader.readline(), self.timeout),'utf-8').split()
+            if answer and answer[0] == "%HELLO%":
+                if int(answer[1]) >= 2 and len(answer) > 2:
+                    self.codec = protocol.CODECS[answer[2]]
+            else:
+                #old server that closed the connection on the unknown greeting, reconnect and stick to the line-based protocol from now on
+                self.writer.close()
+                self.codecs = []
+                await self.open()
+                return
+        self.sendlock = asyncio.Lock() #pylint: disable=attribute-defined-outside-init
+        self.receiver = asyncio.ensure_future(self.receive()) #pylint: disable=attribute-defined-outside-init
+        self.connected = True
+
+    async def receive(self):
+        """Reads responses as they come in and hands them to the requests waiting for them"""
+        try:
+            while True:
+                if self.codec is not None:
+                    frametype, requestid, length = protocol.HEADER.unpack(await self.reader.readexactly(protocol.HEADER.size))
+                    payload = await self.reader.readexactly(length)
+                    if frametype == protocol.ERROR:
+                        result = Exception("Server failed on request " + str(requestid) + ": " + str(payload,'utf-8'))
+                    else:
+                        if frametype & protocol.TRACED:
+                            trace, payload = protocol.unpacktrace(payload)
+                            self.traces.append(json.loads(trace))
+                        result = self.codec.loads(payload)
+                else:
+                    line = await self.reader.readline()
+                    if not line:
+                        raise ConnectionError("Connection closed by server")
+                    answer = str(line,'utf-8').rstrip("\n")
+                    if answer.startswith("%RES%"):
+                        requestid, _, response = answer[5:].partition(" ")
+                        trace, response = protocol.untraceline(response)
+                        if trace is not None:
+                            self.traces.append(json.loads(trace))
+                        result = json.loads(response)
+                    elif answer.startswith("%ERR%"):
+                        requestid, _, error = answer[5:].partition(" ")
+                        result = Exception("Server failed on request " + requestid + ": " + error)
+                    else:
+                        raise Exception("Unexpected response from server, does it support pipelining? " + answer[:100])
+                    requestid = int(requestid)
+                future = self.waiting.pop(requestid, None)
+                if future is not None and not future.done():
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        except Exception as e: #pylint: disable=broad-except
+            self.connected = False
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to " + self.host + ":" + str(self.port) + " lost: " + str(e)))
+            self.waiting = {}
+
+    async def request(self, inputdata, batch=False, traceid=None):
+        """Sends one request (a batch if batch is set) and returns its outputdata once the response is in. With a trace ID, the trace record of the server ends up in self.traces"""
+        if not self.connected:
+            await self.connect()
+        self.requestid = self.requestid % 0xffffffff + 1
+        requestid = self.requestid
+        future = asyncio.get_event_loop().create_future()
+        self.waiting[requestid] = future
+        try:
+            async with self.sendlock:
+                if self.codec is not None:
+                    frametype, payload = protocol.BATCH if batch else protocol.REQUEST, self.codec.dumps(inputdata)
+                    if traceid:
+                        frametype, payload = frametype | protocol.TRACED, protocol.packtrace(traceid, payload)
+                    self.writer.write(protocol.packframe(frametype, requestid, payload))
+                else:
+                    msg = ("%BATCH%" if batch else "") + json.dumps(inputdata)
+                    if traceid:
+                        msg = protocol.traceline(traceid, msg)
+                    self.writer.write(("%REQ%" + str(requestid) + " " + msg + "\n").encode('utf-8'))
+                await self.writer.drain()
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self.waiting.pop(requestid, None)
+
+    def poptraces(self, traceid):
+        """Returns and forgets the trace records the server returned for requests with the trace ID"""
+        traces = [ trace for trace in self.traces if trace.get('id') == traceid ]
+        self.traces = [ trace for trace in self.traces if trace.get('id') != traceid ]
+        return traces
+
+    def close(self):
+        if self.connected:
+            self.receiver.cancel()
+            self.writer.close()
+        self.connected = False
+
 
 class LineByLineServerHandler(socketserver.BaseRequestHandler):
     """
     The generic RequestHandler class for our server. Instantiated once per connection to the server, invokes the module's run()
+
+    Connections start in the newline-delimited JSON protocol and switch to the framed protocol (see gecco.helpers.protocol) if the client greets with ``%HELLO%``.
+
+    Requests with a request ID (``%REQ%<id>`` in the line-based protocol, a non-zero ID in the framed protocol) are pipelined: they are handed to the server's thread pool as soon as they are read, so multiple requests from one connection are processed concurrently. Their responses carry the same ID and are sent back in order of completion. Other requests are answered synchronously.
     """
 
+    def setup(self):
+        if self.request.family in (socket.AF_INET, socket.AF_INET6):
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
     def handle(self):
+        reader = self.request.makefile('rb')
+        self.sendlock = ThreadLock() #pylint: disable=attribute-defined-outside-init
+        self.codec = None #pylint: disable=attribute-defined-outside-init
+        pending = set()
         while True: #We have to loop so the connection is not closed after one request
             # self.request is the TCP socket connected to the client, self.server is the server
-            cont_recv = True
-            buffer = b''
-            while cont_recv:
-                chunk = self.request.recv(1024)
-                if not chunk or chunk[-1] == 10: #newline
-                    cont_recv = False
-                buffer += chunk
-            if not chunk: #connection broken
+            if self.codec is not None:
+                frame = protocol.readframe(reader)
+                if frame is None: #connection broken
+                    break
+                frametype, requestid, payload = frame
+                if requestid:
+                    pending = set( future for future in pending if not future.done() )
+                    pending.add( self.server.executor.submit(self.respondframe, frametype, requestid, payload) )
+                else:
+                    self.respondframe(frametype, requestid, payload)
+                continue
+
+            line = reader.readline()
+            if not line: #connection broken
                 break
-            msg = str(buffer,'utf-8').strip()
-            if msg == "%GETLOAD%":
-                response = str(self.server.module.server_load())
+            msg = str(line,'utf-8').strip()
+            if msg.startswith("%HELLO%"):
+                self.negotiate(msg)
+            elif msg.startswith("%REQ%"):
+                requestid, _, msg = msg[5:].partition(" ")
+                pending = set( future for future in pending if not future.done() )
+                pending.add( self.server.executor.submit(self.respond, msg, requestid) )
             else:
-                response = json.dumps(self.server.module.run(json.loads(msg)))
-            #print("Input: [" + msg + "], Response: [" + response + "]",file=sys.stderr)
-            if isinstance(response,str):
-                response = response.encode('utf-8')
-            if response[-1] != 10: response += b"\n"
+                self.respond(msg)
+        wait(pending) #don't let the connection be closed while requests are still being processed
+
+    def negotiate(self, msg):
+        fields = msg.split()
+        try:
+            version = min(int(fields[1]), protocol.PROTOCOL_VERSION)
+        except (IndexError, ValueError):
+            version = 1
+        codec = None
+        if version >= 2 and len(fields) > 2:
+            codec = protocol.negotiate(fields[2].split(','))
+        if codec is None:
+            response = "%HELLO% 1\n" #stay with the line-based protocol
+        else:
+            response = "%HELLO% " + str(version) + " " + codec.name + "\n"
+        self.request.sendall(response.encode('utf-8'))
+        self.codec = codec #pylint: disable=attribute-defined-outside-init
+
+    def process(self, msg):
+        if msg == "%GETLOAD%":
+            return str(self.server.module.server_load())
+        elif msg == "%METRICS%":
+            return json.dumps(self.server.module.metrics.render()) #a JSON string, so the response stays on one line
+        traceid, msg = protocol.untraceline(msg)
+        trace = servertrace(traceid) if traceid else None
+        if msg.startswith("%BATCH%"):
+            response = self.server.module.handlerequest(msg[7:], json.loads, json.dumps, True, trace)
+        else:
+            response = self.server.module.handlerequest(msg, json.loads, json.dumps, False, trace)
+        if trace is not None:
+            response = protocol.traceline(json.dumps(trace, separators=(',',':')), response)
+        return response
+
+    def respond(self, msg, requestid=None):
+        if requestid is None:
+            response = self.process(msg)
+        else:
+            try:
+                response = "%RES%" + requestid + " " + self.process(msg)
+            except Exception as e: #pylint: disable=broad-except
+                #errors in pool threads would otherwise go unnoticed and leave the client waiting
+                self.server.handle_error(self.request, self.client_address)
+                response = "%ERR%" + requestid + " " + e.__class__.__name__ + ": " + str(e).replace("\n"," ")
+        #print("Input: [" + msg + "], Response: [" + response + "]",file=sys.stderr)
+        if isinstance(response,str):
+            response = response.encode('utf-8')
+        if response[-1] != 10: response += b"\n"
+        with self.sendlock:
             self.request.sendall(response)
 
+    def respondframe(self, frametype, requestid, payload):
+        try:
+            trace = None
+            if frametype & protocol.TRACED:
+                traceid, payload = protocol.unpacktrace(payload)
+                trace = servertrace(traceid)
+                frametype ^= protocol.TRACED
+            if frametype == protocol.GETLOAD:
+                payload = self.codec.dumps(self.server.module.server_load())
+            elif frametype == protocol.METRICS:
+                payload = self.codec.dumps(self.server.module.metrics.render())
+            elif frametype == protocol.BATCH:
+                payload = self.server.module.handlerequest(payload, self.codec.loads, self.codec.dumps, True, trace)
+            elif frametype == protocol.REQUEST:
+                payload = self.server.module.handlerequest(payload, self.codec.loads, self.codec.dumps, False, trace)
+            else:
+                raise ValueError("Unknown frame type: " + str(frametype))
+            frametype = protocol.RESPONSE
+            if trace is not None:
+                frametype, payload = protocol.RESPONSE | protocol.TRACED, protocol.packtrace(json.dumps(trace, separators=(',',':')), payload)
+        except Exception as e: #pylint: disable=broad-except
+            self.server.handle_error(self.request, self.client_address)
+            frametype, payload = protocol.ERROR, (e.__class__.__name__ + ": " + str(e)).encode('utf-8')
+        with self.sendlock:
+            protocol.writeframe(self.request, frametype, requestid, payload)
+
 class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
 
     def handle_error(self,request,client_address):
@@ -958,11 +2280,198 @@ class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
         print(exc_type, exc_value,file=sys.stderr)
         traceback.print_tb(exc_traceback, limit=50, file=sys.stderr)
 
+class ThreadedUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    handle_error = ThreadedTCPServer.handle_error
+
+
+class AsyncServer:
+    """
+    Module server based on asyncio, an alternative to ThreadedTCPServer (select with the module setting ``server: asyncio``). All connections are handled in a single thread, so many idle or keep-alive connections are cheap. The module's run() is invoked in the thread pool of the server, with at most twice as many requests in progress as there are threads; further requests are not read until there is room.
+
+    Speaks the same protocols as LineByLineServerHandler.
+    """
+
+    def __init__(self, server_address, module, reuseport=False, family=socket.AF_INET):
+        self.module = module
+        self.executor = None #set by Module.serve()
+        self.loop = None
+        self.stopped = None
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuseport:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1) #pylint: disable=no-member
+        try:
+            self.socket.bind(server_address)
+            self.socket.listen(128)
+        except OSError:
+            self.socket.close()
+            raise
+        self.server_address = self.socket.getsockname()
+
+    def serve_forever(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.main())
+        finally:
+            self.loop.close()
+
+    def shutdown(self):
+        if self.loop is not None and self.stopped is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    def server_close(self):
+        self.socket.close()
+
+    async def main(self):
+        self.stopped = asyncio.Event()
+        self.inprogress = asyncio.Semaphore(2 * self.module.settings['serverthreads']) #pylint: disable=attribute-defined-outside-init
+        if self.socket.family == socket.AF_UNIX:
+            server = await asyncio.start_unix_server(self.handle, sock=self.socket, limit=2**31-1)
+        else:
+            server = await asyncio.start_server(self.handle, sock=self.socket, limit=2**31-1) #no limit on the length of a line, inputs may be entire documents
+        await self.stopped.wait()
+        server.close()
+        await server.wait_closed()
+
+    async def handle(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = { 'writer': writer, 'lock': asyncio.Lock(), 'codec': None }
+        pending = set()
+        try:
+            while True: #We have to loop so the connection is not closed after one request
+                if connection['codec'] is not None:
+                    try:
+                        frametype, requestid, length = protocol.HEADER.unpack(await reader.readexactly(protocol.HEADER.size))
+                        payload = await reader.readexactly(length)
+                    except asyncio.IncompleteReadError: #connection broken
+                        break
+                    await self.inprogress.acquire()
+                    task = asyncio.ensure_future(self.respondframe(connection, frametype, requestid, payload))
+                    if not requestid:
+                        await task
+                        continue
+                else:
+                    line = await reader.readline()
+                    if not line: #connection broken
+                        break
+                    msg = str(line,'utf-8').strip()
+                    if msg.startswith("%HELLO%"):
+                        await self.negotiate(connection, msg)
+                        continue
+                    await self.inprogress.acquire()
+                    if msg.startswith("%REQ%"):
+                        requestid, _, msg = msg[5:].partition(" ")
+                        task = asyncio.ensure_future(self.respond(connection, msg, requestid))
+                    else:
+                        await self.respond(connection, msg)
+                        continue
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.wait(pending) #don't let the connection be closed while requests are still being processed
+        except Exception: #pylint: disable=broad-except
+            self.handle_error()
+        finally:
+            writer.close()
+
+    async def negotiate(self, connection, msg):
+        fields = msg.split()
+        try:
+            version = min(int(fields[1]), protocol.PROTOCOL_VERSION)
+        except (IndexError, ValueError):
+            version = 1
+        codec = None
+        if version >= 2 and len(fields) > 2:
+            codec = protocol.negotiate(fields[2].split(','))
+        if codec is None:
+            response = "%HELLO% 1\n" #stay with the line-based protocol
+        else:
+            response = "%HELLO% " + str(version) + " " + codec.name + "\n"
+        await self.send(connection, response.encode('utf-8'))
+        connection['codec'] = codec
+
+    def process(self, msg):
+        if msg == "%GETLOAD%":
+            return str(self.module.server_load())
+        elif msg == "%METRICS%":
+            return json.dumps(self.module.metrics.render())
+        traceid, msg = protocol.untraceline(msg)
+        trace = servertrace(traceid) if traceid else None
+        if msg.startswith("%BATCH%"):
+            response = self.module.handlerequest(msg[7:], json.loads, json.dumps, True, trace)
+        else:
+            response = self.module.handlerequest(msg, json.loads, json.dumps, False, trace)
+        if trace is not None:
+            response = protocol.traceline(json.dumps(trace, separators=(',',':')), response)
+        return response
+
+    def processframe(self, codec, frametype, payload):
+        """Returns the type and the serialised payload of the response"""
+        trace = None
+        if frametype & protocol.TRACED:
+            traceid, payload = protocol.unpacktrace(payload)
+            trace = servertrace(traceid)
+            frametype ^= protocol.TRACED
+        if frametype == protocol.GETLOAD:
+            payload = codec.dumps(self.module.server_load())
+        elif frametype == protocol.METRICS:
+            payload = codec.dumps(self.module.metrics.render())
+        elif frametype == protocol.BATCH:
+            payload = self.module.handlerequest(payload, codec.loads, codec.dumps, True, trace)
+        elif frametype == protocol.REQUEST:
+            payload = self.module.handlerequest(payload, codec.loads, codec.dumps, False, trace)
+        else:
+            raise ValueError("Unknown frame type: " + str(frametype))
+        if trace is not None:
+            return protocol.RESPONSE | protocol.TRACED, protocol.packtrace(json.dumps(trace, separators=(',',':')), payload)
+        return protocol.RESPONSE, payload
+
+    async def respond(self, connection, msg, requestid=None):
+        try:
+            try:
+                response = await self.loop.run_in_executor(self.executor, self.process, msg)
+                if requestid is not None:
+                    response = "%RES%" + requestid + " " + response
+            except Exception as e: #pylint: disable=broad-except
+                if requestid is None:
+                    raise #no way to tell the client, the connection will be closed
+                self.handle_error()
+                response = "%ERR%" + requestid + " " + e.__class__.__name__ + ": " + str(e).replace("\n"," ")
+            await self.send(connection, response.encode('utf-8') + b"\n")
+        finally:
+            self.inprogress.release()
+
+    async def respondframe(self, connection, frametype, requestid, payload):
+        try:
+            try:
+                frametype, payload = await self.loop.run_in_executor(self.executor, self.processframe, connection['codec'], frametype, payload)
+            except Exception as e: #pylint: disable=broad-except
+                self.handle_error()
+                frametype, payload = protocol.ERROR, (e.__class__.__name__ + ": " + str(e)).encode('utf-8')
+            await self.send(connection, protocol.packframe(frametype, requestid, payload))
+        finally:
+            self.inprogress.release()
+
+    async def send(self, connection, data):
+        async with connection['lock']:
+            connection['writer'].write(data)
+            await connection['writer'].drain()
+
+    def handle_error(self):
+        print("An error occurred in the server for module " + self.module.id, file=sys.stderr)
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        print(exc_type, exc_value,file=sys.stderr)
+        traceback.print_tb(exc_traceback, limit=50, file=sys.stderr)
+
 
 class Module:
     UNIT = folia.Document #Specifies on type of input tbe module gets. An entire FoLiA document is the default, any smaller structure element can be assigned, such as folia.Sentence or folia.Word . More fine-grained levels usually increase efficiency.
     UNITFILTER = None #Can be a function that takes a unit and return True if it has to be processed
     CLIENT = LineByLineClient
+    ASYNCCLIENT = AsyncClient #client used by the asyncio dispatcher
     SERVER = LineByLineServerHandler
 
     def __init__(self, parent,**settings):
@@ -970,6 +2479,9 @@ class Module:
         self.settings = settings
         self.submodclients = {} #each module keeps a bunch of clients open to the servers of the various submodules so we don't have to reconnect constantly (= faster)
         self.servers = [] #only for the master process, will be populated by it later
+        self.unixsockets = {} #(host,port) => path of the Unix domain socket, for servers on this host. Populated by the master process
+        self.outstanding = None #number of units outstanding per server, shared between the processors of the master if needed by the routing policy
+        self.metrics = Metrics('gecco_server', []) #request metrics of the module server, replaced by runserver() (this one counts nothing)
         self.verifysettings()
 
     def getfilename(self, filename):
@@ -1061,6 +2573,34 @@ class Module:
         if self.submodule and self.local:
             raise Exception("Module " + self.id + " is a submodule, but no servers are defined, submodules can not be local only")
 
+        if 'serverthreads' not in self.settings:
+            self.settings['serverthreads'] = psutil.cpu_count() #number of threads processing pipelined requests in the module server
+
+        if 'server' not in self.settings:
+            self.settings['server'] = 'threaded' #threaded (one thread per connection) or asyncio
+        elif self.settings['server'] not in ('threaded','asyncio'):
+            raise Exception("Invalid server type for module " + self.id + ": " + self.settings['server'] + ", choose from threaded, asyncio")
+
+        if 'workers' in self.settings:
+            self.settings['workers'] = max(1,int(self.settings['workers']))
+        else:
+            self.settings['workers'] = 1 #number of processes the module server forks into
+
+        if 'deduplicate' in self.settings:
+            self.settings['deduplicate'] = bool(self.settings['deduplicate'])
+        else:
+            self.settings['deduplicate'] = True #units of a document with the same input are only processed once, disable if the output depends on more than the input
+
+        if 'storeresults' in self.settings:
+            self.settings['storeresults'] = bool(self.settings['storeresults'])
+        else:
+            self.settings['storeresults'] = True #use the result store of the master, if it has one. Disable for modules whose output is not determined by their input, models and settings alone
+
+        if 'routing' not in self.settings:
+            self.settings['routing'] = 'roundrobin' #how the master distributes requests over the servers of this module
+        elif self.settings['routing'] not in ROUTINGPOLICIES:
+            raise Exception("Invalid routing policy for module " + self.id + ": " + self.settings['routing'] + ", choose from " + ", ".join(ROUTINGPOLICIES))
+
 
     def getserver(self, index):
         if not self.servers:
@@ -1077,17 +2617,13 @@ class Module:
         #raise Exception("Could not find server for submodule " + submodule.id)
         raise NotImplementedError #may be obsolete
 
+    def fingerprint(self):
+        """Returns a string that identifies the models and settings of the module, outputs in the result store are only reused for the same fingerprint. May be extended by modules whose output depends on other files"""
+        return fingerprint(self)
+
     def prepare(self):
-        """Executed prior to running the module, waits until all dependencies have completed"""
-        waiting = True
-        while waiting:
-            waiting = False
-            for dep in self.settings['depends']:
-                if dep not in self.parent.done:
-                    waiting = True
-                    break
-            if waiting:
-                time.sleep(0.05)
+        """Executed prior to running the module on a batch of units. Dependencies need no waiting here: the data thread only queues the units of a module once all modules it depends on have completed on the document"""
+        pass
 
     ####################### CALLBACKS ###########################
 
@@ -1102,24 +2638,175 @@ class Module:
         return True
 
     def runserver(self, host, port):
-        """Runs the server. Invoked by the Corrector on start. """
-        server = ThreadedTCPServer((host, port), self.SERVER)
+        """Runs the server. Invoked by the Corrector on start. With more than one worker (the workers setting), the server forks into multiple processes that share the loaded model and all accept connections on the same port"""
+        self.metrics = Metrics('gecco_server', [self.id], [('server', host + ":" + str(port))], SERVERMETRICS) #created before the workers are forked, so they all count in it
+        self.metrics.gauges.append(self.servergauges)
+        self.metrics.gauges.append(cachegauges([self]))
+        if self.settings['workers'] <= 1:
+            server = self.makeserver(host, port)
+        unixserver = None
+        if self.parent.settings['unixsockets'] and os.path.isdir(self.parent.root + "run"):
+            #also listen on a Unix domain socket, for clients on this host
+            socketpath = unixsocketpath(self.parent.root + "run", self.id, host, port)
+            if socketpath is None:
+                self.log("Path of Unix domain socket would be too long, only listening on TCP")
+            else:
+                unixserver = self.makeunixserver(socketpath)
+        heartbeat = None
+        if self.parent.settings['heartbeat'] > 0 and os.path.isdir(self.parent.root + "run"):
+            #register in the server registry, so clients find us without probing
+            heartbeat = Heartbeat(heartbeatfile(self.parent.root + "run", self.id, host, port), self, self.parent.settings['heartbeat'])
+            heartbeat.start()
+        try:
+            if self.settings['workers'] > 1:
+                self.runworkers(host, port, unixserver)
+            else:
+                self.serve(server, unixserver)
+        finally:
+            if heartbeat is not None:
+                heartbeat.stop()
+            if unixserver is not None:
+                unixserver.server_close()
+                if os.path.exists(socketpath):
+                    os.unlink(socketpath)
+
+    def makeserver(self, host, port, reuseport=False):
+        """Creates a server bound to the specified host and port. With reuseport, multiple servers (in different processes) can be bound to the same port, the kernel distributes the connections over them"""
+        if self.settings['server'] == 'asyncio':
+            return AsyncServer((host, port), self, reuseport)
+        server = ThreadedTCPServer((host, port), self.SERVER, bind_and_activate=False)
         server.allow_reuse_address = True #pylint: disable=attribute-defined-outside-init
+        if reuseport:
+            server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1) #pylint: disable=no-member
+        try:
+            server.server_bind()
+            server.server_activate()
+        except OSError:
+            server.server_close()
+            raise
+        server.module = self #pylint: disable=attribute-defined-outside-init
+        return server
+
+    def makeunixserver(self, path):
+        """Creates a server listening on a Unix domain socket"""
+        if os.path.exists(path):
+            os.unlink(path) #left behind by a server that didn't end properly
+        if self.settings['server'] == 'asyncio':
+            return AsyncServer(path, self, family=socket.AF_UNIX)
+        server = ThreadedUnixServer(path, self.SERVER)
         server.module = self #pylint: disable=attribute-defined-outside-init
+        return server
+
+    def serve(self, server, unixserver=None):
+        """Serves requests until the process ends"""
+        server.executor = ThreadPoolExecutor(self.settings['serverthreads']) #pylint: disable=attribute-defined-outside-init
         # Start a thread with the server -- that thread will then fork for each request
         server_thread = Thread(target=server.serve_forever)
         # Exit the server thread when the main thread terminates
         server_thread.setDaemon(True)
         server_thread.start()
+        if unixserver is not None:
+            unixserver.executor = server.executor #requests on both sockets share the threads
+            unixserver_thread = Thread(target=unixserver.serve_forever)
+            unixserver_thread.setDaemon(True)
+            unixserver_thread.start()
 
         server_thread.join() #block until done
 
         server.shutdown()
+        if unixserver is not None:
+            unixserver.shutdown()
+        server.executor.shutdown()
+
+    def runworkers(self, host, port, unixserver=None):
+        """Forks the worker processes and supervises them, workers that crash are replaced. Terminating this process terminates all workers. The workers all accept connections on the Unix domain socket of the unixserver, if given"""
+        reuseport = hasattr(socket, 'SO_REUSEPORT')
+        if reuseport:
+            #every worker binds its own socket, we hold on to one without listening on it so we fail early if the port is taken
+            server = None
+            reserved = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            reserved.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            reserved.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1) #pylint: disable=no-member
+            reserved.bind((host, port))
+        else:
+            #all workers accept on the listening socket they inherit
+            server = self.makeserver(host, port)
+
+        workers = set()
+        stopping = []
+
+        def spawn():
+            pid = os.fork()
+            if pid == 0:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                try:
+                    self.serve(server if server is not None else self.makeserver(host, port, True), unixserver)
+                except Exception: #pylint: disable=broad-except
+                    traceback.print_exc(file=sys.stderr)
+                    os._exit(1)
+                os._exit(0)
+            workers.add(pid)
+
+        def terminate(signum, frame): #pylint: disable=unused-argument
+            stopping.append(signum)
+            for pid in workers:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+        signal.signal(signal.SIGTERM, terminate)
+        for _ in range(self.settings['workers']):
+            spawn()
+        self.log("Started " + str(len(workers)) + " workers")
+        try:
+            while workers:
+                pid, status = os.wait()
+                workers.discard(pid)
+                if not stopping and os.WIFSIGNALED(status):
+                    self.log("Worker " + str(pid) + " was killed by signal " + str(os.WTERMSIG(status)) + ", starting a new one")
+                    spawn()
+                elif not stopping:
+                    self.log("Worker " + str(pid) + " ended with exit status " + str(os.WEXITSTATUS(status)))
+        finally:
+            if not stopping:
+                terminate(None, None)
+            if server is not None:
+                server.server_close()
+            else:
+                reserved.close()
 
     def server_load(self):
         """Returns a float indicating the load of this server. 0 = idle, 1 = max load, >1 overloaded. Returns normalised system load by default, buy may be overriden for module-specific behaviour."""
         return os.getloadavg()[0] / psutil.cpu_count()
 
+    def handlerequest(self, payload, loads, dumps, batch=False, trace=None):
+        """Handles a request received by the server: deserialises the payload, runs the module on it and returns the serialised output. Keeps the metrics of the server. For traced requests, the times it started decoding, running and encoding, and the time it was done, are added to the trace record"""
+        begintime = time.time()
+        inputdata = loads(payload)
+        units = len(inputdata) if batch else 1
+        self.metrics.begin(self.id, units)
+        runtime = time.time()
+        try:
+            outputdata = self.runbatch(inputdata) if batch else self.run(inputdata)
+        except Exception:
+            self.metrics.end(self.id, units, time.time() - begintime, False, len(payload))
+            raise
+        encodetime = time.time()
+        response = dumps(outputdata)
+        endtime = time.time()
+        self.metrics.end(self.id, units, endtime - begintime, True, len(payload), len(response))
+        if trace is not None:
+            trace.update(begin=begintime, run=runtime, encode=encodetime, end=endtime)
+        return response
+
+    def servergauges(self):
+        """Values reported in the metrics of the module server besides the request counters (see gecco.helpers.metrics). May be extended by modules that have more to tell"""
+        return [
+            ("_load", 'gauge', "Load of the server, as used for routing", [ ((('module', self.id),), self.server_load()) ]),
+            ("_memory_bytes", 'gauge', "Resident memory of the server process answering, including the loaded models", [ ((('module', self.id), ('pid', os.getpid())), memory()) ]),
+        ]
+
 
     def runlocal(self, unit_id, inputdata, **parameters):
         """This method gets invoked by the Corrector when the module is run locally."""
@@ -1128,7 +2815,19 @@ class Module:
 
     def runclient(self, client, unit_id, inputdata, **parameters):
         """This method gets invoked by the Corrector when it should connect to a remote server, the client instance is passed and already available (will connect on first communication). """
-        return json.loads(client.communicate(json.dumps(inputdata)))
+        return client.request(inputdata)
+
+    def runlocalbatch(self, unit_ids, inputdata, **parameters):
+        """This method gets invoked by the Corrector when the module is run locally on a batch of units. Inputdata is a list, returns a list of outputdata of the same length."""
+        return self.runbatch(inputdata)
+
+    def runclientbatch(self, client, unit_ids, inputdata, **parameters):
+        """This method gets invoked by the Corrector when it should send a batch of units to a remote server in one go. Inputdata is a list, returns a list of outputdata of the same length."""
+        return client.request(inputdata, batch=True)
+
+    def runclientpipelined(self, client, unit_ids, inputdata, **parameters):
+        """This method gets invoked by the Corrector when it should send a batch of units to a remote server as separate pipelined requests, allowing the server to process them concurrently. Inputdata is a list, returns a list of outputdata of the same length."""
+        return client.requestmany(inputdata)
 
     ##### Optional callbacks invoked by the Corrector (defaults may suffice)
 
@@ -1170,10 +2869,17 @@ class Module:
         raise NotImplementedError
 
     def processoutput(self,outputdata,inputdata,unit_id,**parameters):
-        """Processes low-level output data and returns a an FQL query (string) or list/tuple of FQL queries to perform on the data. Executed concurrently. May return None if no query is needed."""
+        """Processes low-level output data and returns an edit (as returned by the FoLiA editing methods such as addsuggestions()) or FQL query (string), or a list/tuple of those, to perform on the data. Executed concurrently. May return None if no edit is needed."""
         raise NotImplementedError
 
 
+    ##### Optional callbacks that may be overloaded for efficiency:
+
+    def runbatch(self, inputdata):
+        """Turns a list of inputdata into a list of outputdata (in the same order). Gets called instead of run() when units are processed in batches (see the batchsize setting). Loops over run() by default, may be overloaded if the module can process multiple units more efficiently at once."""
+        return [ self.run(x) for x in inputdata ]
+
+
     #### Callback invoked by the module itself, MUST be implemented if any loading is done:
 
     def load(self):
@@ -1187,7 +2893,8 @@ class Module:
     ######################### FOLIA EDITING ##############################
     #
     # These methods are *NOT* available to module.run(), only to
-    # module.processoutput()
+    # module.processoutput(). They return edit records (see
+    # gecco.helpers.editing), which the data thread applies to the document.
 
     def addsuggestions(self, element_id, suggestions, **kwargs):
         self.log("Adding correction for " + element_id)
@@ -1200,106 +2907,34 @@ class Module:
         if isinstance(suggestions,str):
             suggestions = [suggestions]
 
-        q = "EDIT t (AS CORRECTION OF " + self.settings['set'] + " WITH class \"" + cls + "\" annotator \"" + self.settings['annotator'] + "\" annotatortype \"auto\" datetime now"
-        for suggestion in suggestions:
-            if isinstance(suggestion, tuple) or isinstance(suggestion, list):
-                suggestion, confidence = suggestion
-            else:
-                confidence = None
-            q += " SUGGESTION text \"" + suggestion.replace('"','\\"') + "\""
-            if confidence is not None:
-                q += " WITH confidence " + str(confidence)
-
-        q += ") FOR ID \"" + element_id + "\" RETURN nothing"
-        return q
+        return SuggestionsEdit(element_id, suggestions, self.settings['set'], cls, self.settings['annotator'])
 
 
     def adderrordetection(self, element_id):
         self.log("Adding correction for " + element_id )
 
         #add the correction
-        return "ADD errordetection OF " + self.settings['set'] + " WITH class \"" + self.settings['class'] + "\" annotator \"" + self.settings['annotator'] + "\" annotatortype \"auto\" datetime now FOR ID \"" + element_id + "\" RETURN nothing"
+        return ErrorDetectionEdit(element_id, self.settings['set'], self.settings['class'], self.settings['annotator'])
 
     def splitcorrection(self, word_id, suggestions):
         #split one word into multiple
 
         #suggestions is a list of  ([word], confidence) tuples
-        q = "SUBSTITUTE (AS CORRECTION OF " + self.settings['set'] + " WITH class \"" + self.settings['class'] + "\" annotator \"" + self.settings['annotator'] + "\" annotatortype \"auto\" datetime now"
-        for suggestion, confidence in suggestions:
-            q += " SUGGESTION ("
-            for i, newword in enumerate(suggestion):
-                if i > 0: q += " "
-                q += "SUBSTITUTE w WITH text \"" + newword.replace('"','\\"') + "\""
-            q += ") WITH confidence " + str(confidence)
-        q += ") FOR SPAN ID \"" + word_id + "\""
-        q += " RETURN nothing"
-        return q
+        return SplitEdit(word_id, suggestions, self.settings['set'], self.settings['class'], self.settings['annotator'])
 
     def mergecorrection(self, newword, originalwords):
         #merge multiple words into one
-
-        q = "SUBSTITUTE (AS CORRECTION OF " + self.settings['set'] + " WITH class \"" + self.settings['class'] + "\" annotator \"" + self.settings['annotator'] + "\" annotatortype \"auto\" datetime now"
-        q += " SUGGESTION"
-        q += " (SUBSTITUTE w WITH text \"" + newword.replace('"','\\"') + "\")"
-        #q += " WITH confidence " + str(confidence)
-        q += ") FOR SPAN"
-        for i, ow in enumerate(originalwords):
-            if i > 0: q += " &"
-            q += " ID \"" + ow + "\""
-        q += " RETURN nothing"
-        return q
+        return MergeEdit(newword, originalwords, self.settings['set'], self.settings['class'], self.settings['annotator'])
 
     def suggestdeletion(self, word_id,merge=False, **kwargs):
         if 'cls' in kwargs:
             cls = kwargs['cls']
         else:
             cls = self.settings['class']
-        q = "SUBSTITUTE (AS CORRECTION OF " + self.settings['set'] + " WITH class \"" + cls + "\" annotator \"" + self.settings['annotator'] + "\" annotatortype \"auto\" datetime now"
-        if merge:
-            q += " SUGGESTION MERGE DELETION "
-        else:
-            q += " SUGGESTION DELETION "
-        q += ") FOR SPAN ID \"" + word_id + "\""
-        q += " RETURN nothing"
-        return q
-
-        #----------- OLD (TODO: REMOVE) -----------
-        #parent = word.parent
-        #index = parent.getindex(word,False)
-        #if 'cls' in kwargs:
-        #    cls = kwargs['cls']
-        #else:
-        #    cls = self.settings['class']
-        #if index != -1:
-        #    self.log(" Suggesting deletion of " + str(word.id))
-        #    sugkwargs = {}
-        #    if merge:
-        #        sugkwargs['merge'] = word.ancestor(folia.StructureElement).id
-        #    parent.data[index] = folia.Correction(word.doc, folia.Suggestion(word.doc, **sugkwargs), folia.Current(word.doc, word), set=self.settings['set'],cls=cls, annotator=self.settings['annotator'],annotatortype=folia.AnnotatorType.AUTO, datetime=datetime.datetime.now())
-        #else:
-        #   self.log(" ERROR: Unable to suggest deletion of " + str(word.id) + ", item index not found")
+        return DeletionEdit(word_id, merge, self.settings['set'], cls, self.settings['annotator'])
 
     def suggestinsertion(self,pivotword_id, text,split=False,mode='PREPEND'):
-        q = mode + " (AS CORRECTION OF " + self.settings['set'] + " WITH class \"" + self.settings['class'] + "\" annotator \"" + self.settings['annotator'] + "\" annotatortype \"auto\" datetime now"
-        if split:
-            q += " SUGGESTION SPLIT (ADD w WITH text \"" + text.replace('"','\\"') + "\") "
-        else:
-            q += " SUGGESTION (ADD w WITH text \"" + text.replace('"','\\"') + "\") "
-        q += ") FOR ID \"" + pivotword_id + "\""
-        q += " RETURN nothing"
-        return q
-
-        #----------- OLD (TODO: REMOVE) -----------
-        #index = pivotword.parent.getindex(pivotword)
-        #if index != -1:
-        #    self.log(" Suggesting insertion before " + str(pivotword.id))
-        #    sugkwargs = {}
-        #    if split:
-        #        sugkwargs['split'] = pivotword.ancestor(folia.StructureElement).id
-        #    doc = pivotword.doc
-        #    pivotword.parent.insert(index,folia.Correction(doc, folia.Suggestion(doc, folia.Word(doc,text,generate_id_in=pivotword.parent)), folia.Current(doc), set=self.settings['set'],cls=self.settings['class'], annotator=self.settings['annotator'],annotatortype=folia.AnnotatorType.AUTO, datetime=datetime.datetime.now(), generate_id_in=pivotword.parent))
-        #else:
-        #    self.log(" ERROR: Unable to suggest insertion before " + str(pivotword.id) + ", item index not found")
+        return InsertionEdit(pivotword_id, text, split, mode, self.settings['set'], self.settings['class'], self.settings['annotator'])
 
 def helpmodules():
     #Bit hacky, but it works
@@ -1325,6 +2960,11 @@ def helpmodules():
     print("=================================")
     print("The following settings can be added to any module that supports hapaxing:")
     print(Hapaxer.__doc__)
+    from gecco.helpers.caching import getcache
+    print("Caching")
+    print("=================================")
+    print("The following settings can be added to any module that supports caching:")
+    print(getcache.__doc__)
 
 
 
@@ -10,28 +10,315 @@
 #
 #=======================================================================
 
+#Caches for the results of expensive lookups within modules (cachetype setting):
+#
+# - fifo: evicts the oldest entry
+# - lru: evicts the least recently used entry
+# - lfu: evicts the least recently used entry too, but only admits a new
+#   entry if its key is requested more often than that of the entry it would
+#   evict (TinyLFU). Request frequencies are estimated with a count-min sketch
+#   that is halved every so often, so they follow the changing input.
+# - shared: a hash table in shared memory, used by all processes forked from
+#   the one that created it: the processors of the master for local modules,
+#   the workers of a module server. Entries added by one process are seen by
+#   the others right away.
+#
+#The first three are private to the process, and split over a number of
+#shards that each have their own lock, so threads of a module server can use
+#them concurrently.
+
+import sys
+import mmap
+import time
+import struct
+import pickle
+import hashlib
+from threading import Lock as ThreadLock
+from multiprocessing import Lock
 from collections import OrderedDict
 
+HALVE = bytes( i >> 1 for i in range(256) ) #translation table that halves every byte
+
 def getcache(settings, cachesize=1000):
+    """Returns the cache configured in the settings of a module, the second argument is the default cache size of the module
+
+    Settings:
+        * ``cachetype``      - The cache policy: fifo, lru, lfu (TinyLFU admission) or shared (in shared memory, for all processes of a master or module server) (default: fifo)
+        * ``cachesize``      - The maximum number of entries in the cache, 0 disables the cache unless cachebytes is set (default depends on the module)
+        * ``cachebytes``     - The maximum size of the cache in bytes, estimated from the size of the entries (default: 0, unlimited)
+        * ``cachettl``       - Time in seconds after which an entry expires (default: 0, never)
+        * ``cacheshards``    - The number of parts the cache is split in, each with its own lock, so concurrent threads don't have to wait for each other (default: 8)
+        * ``cacheslotsize``  - Bytes per entry for the shared cache, larger entries are not cached (default: 1024)
+    """
     if 'cachesize' not in settings:
         settings['cachesize'] = cachesize
     if 'cachetype' not in settings:
         settings['cachetype'] = 'fifo'
+    if 'cachebytes' not in settings:
+        settings['cachebytes'] = 0
+    if 'cachettl' not in settings:
+        settings['cachettl'] = 0
+    if 'cacheshards' not in settings:
+        settings['cacheshards'] = 8
+    if 'cacheslotsize' not in settings:
+        settings['cacheslotsize'] = 1024 #bytes per entry, for the shared cache
 
+    size = int(settings['cachesize'])
+    maxbytes = int(settings['cachebytes'])
+    ttl = float(settings['cachettl'])
+    shards = max(1,int(settings['cacheshards']))
     if settings['cachetype'] == 'fifo':
-        return FIFOCache(cachesize)
+        return FIFOCache(size, maxbytes, ttl, shards)
+    elif settings['cachetype'] == 'lru':
+        return LRUCache(size, maxbytes, ttl, shards)
+    elif settings['cachetype'] == 'lfu':
+        return LFUCache(size, maxbytes, ttl, shards)
+    elif settings['cachetype'] == 'shared':
+        slotsize = int(settings['cacheslotsize'])
+        if maxbytes > 0:
+            size = min(size, maxbytes // slotsize) if size > 0 else maxbytes // slotsize
+        return SharedCache(size, slotsize, ttl)
     else:
         raise Exception("invalid cache type: " + settings['cachetype'])
 
-class FIFOCache(OrderedDict):
-    def __init__(self, size):
+def sizeof(obj):
+    """Estimates the memory used by an object, including the objects in it if it is a container"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum( sizeof(key) + sizeof(value) for key, value in obj.items() )
+    elif isinstance(obj, (tuple, list, set, frozenset)):
+        size += sum( sizeof(item) for item in obj )
+    return size
+
+
+class Shard:
+    def __init__(self, size, maxbytes):
+        self.size = size #maximum number of entries, 0 for no limit
+        self.maxbytes = maxbytes #maximum size, 0 for no limit
+        self.entries = OrderedDict() #key => (value, size, expiry time), in order of eviction
+        self.bytes = 0
+        self.lock = ThreadLock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def full(self, extra=0):
+        return (self.size > 0 and len(self.entries) >= self.size) or (self.maxbytes > 0 and self.bytes + extra > self.maxbytes)
+
+
+class FIFOCache:
+    """Evicts the oldest entry when full. Entries are looked up with cache[key] (raises KeyError if not cached) and added with cache.append(key, value)"""
+
+    def __init__(self, size, maxbytes=0, ttl=0, shards=1):
         self.size = size
-        super().__init__()
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        if size > 0:
+            shards = min(shards, size)
+        self.shards = [ Shard(-(-size // shards), -(-maxbytes // shards)) for _ in range(shards) ] #capacity is divided over the shards, rounded up
+
+    def __bool__(self):
+        """A cache is true if it is enabled, regardless of whether it is empty"""
+        return self.size > 0 or self.maxbytes > 0
+
+    def __len__(self):
+        return sum( len(shard.entries) for shard in self.shards )
+
+    def __contains__(self, key):
+        """Checks whether an unexpired entry is cached, without counting it as a lookup"""
+        shard = self.shards[hash(key) % len(self.shards)]
+        with shard.lock:
+            try:
+                _, _, expires = shard.entries[key]
+            except KeyError:
+                return False
+            return not expires or expires >= time.time()
+
+    def __getitem__(self, key):
+        shard = self.shards[hash(key) % len(self.shards)]
+        with shard.lock:
+            self.requested(shard, key)
+            try:
+                value, _, expires = shard.entries[key]
+            except KeyError:
+                shard.misses += 1
+                raise
+            if expires and expires < time.time():
+                self.remove(shard, key)
+                shard.expirations += 1
+                shard.misses += 1
+                raise KeyError(key)
+            shard.hits += 1
+            self.used(shard, key)
+            return value
 
     def append(self, key, value):
-        if self.size > 0:
-            if len(self) == self.size:
-                self.popitem(False)
-            self[key] = value
+        if not self:
+            return
+        size = sizeof(key) + sizeof(value) if self.maxbytes > 0 else 0
+        expires = time.time() + self.ttl if self.ttl > 0 else 0
+        shard = self.shards[hash(key) % len(self.shards)]
+        with shard.lock:
+            if key in shard.entries:
+                self.remove(shard, key)
+            elif not self.admit(shard, key, size):
+                return
+            if shard.maxbytes > 0 and size > shard.maxbytes:
+                return #would never fit
+            while shard.entries and shard.full(size):
+                self.remove(shard, next(iter(shard.entries)))
+                shard.evictions += 1
+            shard.entries[key] = (value, size, expires)
+            shard.bytes += size
+
+    def remove(self, shard, key):
+        _, size, _ = shard.entries.pop(key)
+        shard.bytes -= size
+
+    def clear(self):
+        for shard in self.shards:
+            with shard.lock:
+                shard.entries.clear()
+                shard.bytes = 0
+
+    def stats(self):
+        """Returns the counters of the cache"""
+        stats = {'entries': len(self), 'bytes': sum( shard.bytes for shard in self.shards )}
+        for counter in ('hits','misses','evictions','expirations'):
+            stats[counter] = sum( getattr(shard, counter) for shard in self.shards )
+        return stats
+
+    ##### Policy hooks, called with the lock of the shard held
+
+    def requested(self, shard, key):
+        """Called on every lookup"""
+        pass
+
+    def used(self, shard, key):
+        """Called when a lookup finds the entry"""
+        pass
+
+    def admit(self, shard, key, size): #pylint: disable=unused-argument
+        """Decides whether a new entry is added to the shard"""
+        return True
+
 
+class LRUCache(FIFOCache):
+    """Evicts the least recently used entry when full"""
+
+    def used(self, shard, key):
+        shard.entries.move_to_end(key)
+
+
+class FrequencySketch:
+    """Count-min sketch of how often keys are requested, with four rows of small counters. All counters are halved after a number of increments, so old requests count less"""
+
+    DEPTH = 4
+    MAXCOUNT = 15
+
+    def __init__(self, size):
+        width = 16
+        while width < max(size, 1):
+            width *= 2
+        self.mask = width - 1
+        self.rows = [ bytearray(width) for _ in range(self.DEPTH) ]
+        self.increments = 0
+        self.resetafter = 10 * width
+
+    def indices(self, key):
+        h = hash(key)
+        for i in range(self.DEPTH):
+            h = (h * 0x9E3779B1 + i) & 0xFFFFFFFFFFFF #a different hash per row
+            yield h >> 16 & self.mask
+
+    def increment(self, key):
+        for row, index in zip(self.rows, self.indices(key)):
+            if row[index] < self.MAXCOUNT:
+                row[index] += 1
+        self.increments += 1
+        if self.increments >= self.resetafter:
+            for row in self.rows:
+                row[:] = row.translate(HALVE)
+            self.increments //= 2
+
+    def frequency(self, key):
+        return min( row[index] for row, index in zip(self.rows, self.indices(key)) )
+
+
+class LFUCache(LRUCache):
+    """Least recently used cache with TinyLFU admission: when the cache is full, a new entry is only added if its key has been requested more often than the key of the entry that would be evicted. Keeps frequently requested entries in the cache when there are many rare keys, as with the words of a text"""
+
+    def __init__(self, size, maxbytes=0, ttl=0, shards=1):
+        super().__init__(size, maxbytes, ttl, shards)
+        for shard in self.shards:
+            shard.sketch = FrequencySketch(shard.size if shard.size > 0 else 1024)
+
+    def requested(self, shard, key):
+        shard.sketch.increment(key)
+
+    def admit(self, shard, key, size):
+        if not shard.entries or not shard.full(size):
+            return True
+        victim = next(iter(shard.entries))
+        return shard.sketch.frequency(key) > shard.sketch.frequency(victim)
+
+
+class SharedCache:
+    """Hash table of size slots of slotsize bytes, in anonymous shared memory. Must be created before the processes that share it are forked. Every entry goes in the slot its key hashes to, replacing whatever was there; entries that don't fit in a slot are not cached. The counters are per process"""
+
+    HEADER = struct.Struct("<8sIId") #digest of the key, length of the pickled key, length of the pickled value, expiry time
+    LOCKS = 64 #slots are guarded by this many locks
+
+    def __init__(self, size, slotsize=1024, ttl=0):
+        self.size = size
+        self.slotsize = slotsize
+        self.ttl = ttl
+        self.memory = mmap.mmap(-1, max(1, size) * slotsize) #shared with child processes, pages are only allocated once written to
+        self.locks = [ Lock() for _ in range(max(1, min(self.LOCKS, size))) ]
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __bool__(self):
+        return self.size > 0
+
+    def locate(self, key):
+        """Returns the pickled key, its digest and the offset of its slot"""
+        data = pickle.dumps(key, pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha1(data).digest()[:8]
+        slot = int.from_bytes(digest, 'little') % self.size
+        return data, digest, slot
+
+    def __getitem__(self, key):
+        if self.size <= 0:
+            raise KeyError(key)
+        data, digest, slot = self.locate(key)
+        offset = slot * self.slotsize
+        with self.locks[slot % len(self.locks)]:
+            storeddigest, keylength, valuelength, expires = self.HEADER.unpack_from(self.memory, offset)
+            begin = offset + self.HEADER.size
+            if storeddigest != digest or keylength != len(data) or self.memory[begin:begin+keylength] != data:
+                self.misses += 1
+                raise KeyError(key)
+            if expires and expires < time.time():
+                self.expirations += 1
+                self.misses += 1
+                raise KeyError(key)
+            value = self.memory[begin+keylength:begin+keylength+valuelength]
+        self.hits += 1
+        return pickle.loads(value)
+
+    def append(self, key, value):
+        if self.size <= 0:
+            return
+        data, digest, slot = self.locate(key)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if self.HEADER.size + len(data) + len(value) > self.slotsize:
+            return #too large to cache
+        offset = slot * self.slotsize
+        with self.locks[slot % len(self.locks)]:
+            storeddigest, _, _, _ = self.HEADER.unpack_from(self.memory, offset)
+            if storeddigest != digest and storeddigest != bytes(8):
+                self.evictions += 1
+            self.HEADER.pack_into(self.memory, offset, digest, len(data), len(value), time.time() + self.ttl if self.ttl > 0 else 0)
+            begin = offset + self.HEADER.size
+            self.memory[begin:begin+len(data)+len(value)] = data + value
 
+    def stats(self):
+        return {'entries': None, 'bytes': len(self.memory), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'expirations': self.expirations}
@@ -1,12 +1,90 @@
+import os
+import re
+import json
+import importlib
+from glob import glob
 from pynlpl.formats import folia
 
+class LazyModule:
+    """Stands in for a module that is only imported once one of its attributes is used, see lazyimport()"""
+
+    def __init__(self, name):
+        self.__dict__['_lazyname'] = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._lazyname), attr)
+        self.__dict__[attr] = value #next time it's found without calling __getattr__
+        return value
+
+def lazyimport(name):
+    """Returns the module of the given name, imported only when first used. Used for the heavy backends (colibricore, timbl, etc), so commands and masters that never load a model start quickly"""
+    return LazyModule(name)
+
 def stripsourceextensions(filename):
     #strip some common source extensions
     return filename.replace('.txt','').replace('.bz2','').replace('.gz','').replace('.tok','')
 
 
-def folia2json(doc):
-    data = []
+def foliafilename(filename):
+    """Returns the name of the FoLiA document for an input file, plain text files are tokenised to a .folia.xml file next to them"""
+    ext = filename.split('.')[-1].lower()
+    if ext in ('xml','folia','gz','bz2'):
+        return filename
+    elif ext == 'txt':
+        return '.'.join(filename.split('.')[:-1]) + '.folia.xml'
+    else:
+        return filename + '.folia.xml'
+
+def text2folia(tokenizer, text, tokenset, docid='untitled'):
+    """Tokenises plain text with ucto and builds the FoLiA document directly from the tokens, rather than having ucto write FoLiA XML that is parsed again. Paragraphs are separated by blank lines, each is passed to the tokenizer separately. As with ucto's own FoLiA output, the document ID is untitled unless given and the token set is the ucto configuration file"""
+    doc = folia.Document(id=docid)
+    doc.declare(folia.Word, tokenset, annotator='ucto', annotatortype=folia.AnnotatorType.AUTO)
+    body = doc.append(folia.Text(doc, id=docid + '.text'))
+    for paragraphtext in re.split(r'\n\s*\n', text):
+        paragraphtext = ' '.join(paragraphtext.split())
+        if not paragraphtext:
+            continue
+        paragraph = body.append(folia.Paragraph(doc, id=docid + '.p.' + str(len(body) + 1)))
+        sentence = None
+        tokenizer.process(paragraphtext)
+        for token in tokenizer:
+            if sentence is None:
+                sentence = paragraph.append(folia.Sentence(doc, id=paragraph.id + '.s.' + str(len(paragraph) + 1)))
+            sentence.append(folia.Word(doc, text=str(token), id=sentence.id + '.w.' + str(len(sentence) + 1), cls=token.type(), space=not token.nospace()))
+            if token.isendofsentence():
+                sentence = None
+    return doc
+
+def expandfiles(patterns):
+    """Expands a list of filenames, directories and glob patterns into a list of files. Directories are searched recursively"""
+    files = []
+    for pattern in patterns:
+        if os.path.isfile(pattern):
+            files.append(pattern)
+        elif os.path.isdir(pattern):
+            for root, _, names in sorted(os.walk(pattern)):
+                for name in sorted(names):
+                    files.append(os.path.join(root,name))
+        else:
+            matches = sorted(glob(pattern))
+            if not matches:
+                raise Exception("Input file not found: " + pattern)
+            files += expandfiles(matches)
+    return files
+
+def inputkey(inputdata):
+    """Returns a hashable key for the input a module prepared for a unit, equal for equal inputs, or None if there is none"""
+    if isinstance(inputdata, str):
+        return inputdata
+    try:
+        return (json.dumps(inputdata, sort_keys=True),) #in a tuple, so it never equals a string input
+    except (TypeError, ValueError):
+        return None
+
+def foliajsonitems(doc):
+    """Yields a JSON-serialisable dictionary for every correction in the document, in document order"""
+    wordindex = {} #id of sentence => {id of word: index of the word in the sentence}, built once per sentence
+    childindex = {} #id of sentence => {id of child: number of words preceding the child}
     for correction in doc.data[0].select(folia.Correction):
         suggestions = []
         for suggestion in correction.suggestions():
@@ -16,21 +94,35 @@ def folia2json(doc):
         index = None
         if isinstance(ancestor, folia.Sentence):
             text = correction.current().text()
-            index = 0
-            for i, item in enumerate(ancestor):
-                if isinstance(item, folia.Word):
-                    index += 1
-                if item is correction:
-                    break
+            if id(ancestor) not in childindex:
+                childindex[id(ancestor)] = {}
+                count = 0
+                for item in ancestor:
+                    if isinstance(item, folia.Word):
+                        count += 1
+                    childindex[id(ancestor)][id(item)] = count
+            index = childindex[id(ancestor)].get(id(correction))
         elif isinstance(ancestor, folia.Word):
             text = ancestor.text()
             sentence = ancestor.ancestor(folia.Sentence)
-            for i, word in enumerate(sentence.words()):
-                if word is ancestor:
-                    index = i
-                    break
+            if id(sentence) not in wordindex:
+                wordindex[id(sentence)] = { id(word): i for i, word in enumerate(sentence.words()) }
+            index = wordindex[id(sentence)].get(id(ancestor))
         if index is None:
             raise Exception("index not found")
 
-        data.append( {'index': index, 'text': text, 'suggestions': suggestions, 'annotator': correction.annotator  } )
-    return data
+        yield {'index': index, 'text': text, 'suggestions': suggestions, 'annotator': correction.annotator  }
+
+def folia2json(doc):
+    return list(foliajsonitems(doc))
+
+def writejson(doc, f):
+    """Writes the corrections in the document to a file object as a JSON list, one correction at a time (same output as json.dumps(folia2json(doc)))"""
+    f.write("[")
+    first = True
+    for item in foliajsonitems(doc):
+        if not first:
+            f.write(", ")
+        f.write(json.dumps(item))
+        first = False
+    f.write("]")
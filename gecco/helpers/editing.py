@@ -0,0 +1,169 @@
+#========================================================================
+#GECCO - Generic Enviroment for Context-Aware Correction of Orthography
+# Maarten van Gompel, Wessel Stoop, Antal van den Bosch
+# Centre for Language and Speech Technology
+# Radboud University Nijmegen
+#
+# Sponsored by Revisely (http://revise.ly)
+#
+# Licensed under the GNU Public License v3
+#
+#=======================================================================
+
+#Edit records, returned by the FoLiA editing methods of Module and in turn by
+#Module.processoutput(). The data thread applies them to the document. Edits
+#that implement apply() are performed directly through the FoLiA API, the
+#others (and plain FQL strings returned by modules) are executed as FQL queries.
+
+import datetime
+from pynlpl.formats import folia, fql #pylint: disable=import-error,no-name-in-module
+
+def quote(text):
+    return "\"" + text.replace('"','\\"') + "\""
+
+class Edit:
+    """Base class for edits, an edit can always be expressed as an FQL query"""
+
+    def __init__(self, foliaset, cls, annotator):
+        self.set = foliaset
+        self.cls = cls
+        self.annotator = annotator
+
+    def correctionfql(self):
+        return "AS CORRECTION OF " + self.set + " WITH class " + quote(self.cls) + " annotator " + quote(self.annotator) + " annotatortype \"auto\" datetime now"
+
+    def fql(self):
+        raise NotImplementedError
+
+    def __str__(self):
+        return self.fql()
+
+    def apply(self, doc):
+        """Applies the edit to the document, executes the FQL query unless overloaded"""
+        fql.Query(self.fql())(doc)
+
+
+class SuggestionsEdit(Edit):
+    """Suggestions for correction of the text of an element"""
+
+    def __init__(self, element_id, suggestions, foliaset, cls, annotator):
+        super().__init__(foliaset, cls, annotator)
+        self.element_id = element_id
+        self.suggestions = [] #(text, confidence) tuples, confidence may be None
+        for suggestion in suggestions:
+            if isinstance(suggestion, tuple) or isinstance(suggestion, list):
+                suggestion, confidence = suggestion
+            else:
+                confidence = None
+            self.suggestions.append( (suggestion, confidence) )
+
+    def fql(self):
+        q = "EDIT t (" + self.correctionfql()
+        for suggestion, confidence in self.suggestions:
+            q += " SUGGESTION text " + quote(suggestion)
+            if confidence is not None:
+                q += " WITH confidence " + str(confidence)
+        q += ") FOR ID " + quote(self.element_id) + " RETURN nothing"
+        return q
+
+    def apply(self, doc):
+        element = doc[self.element_id]
+        suggestions = []
+        for suggestion, confidence in self.suggestions:
+            if confidence is None:
+                suggestions.append( folia.Suggestion(doc, folia.TextContent(doc, value=suggestion)) )
+            else:
+                suggestions.append( folia.Suggestion(doc, folia.TextContent(doc, value=suggestion), confidence=confidence) )
+        element.correct(suggestions=suggestions, set=self.set, cls=self.cls, annotator=self.annotator, annotatortype=folia.AnnotatorType.AUTO, datetime=datetime.datetime.now())
+
+
+class ErrorDetectionEdit(Edit):
+    """Marks an element as erroneous without suggesting a correction"""
+
+    def __init__(self, element_id, foliaset, cls, annotator):
+        super().__init__(foliaset, cls, annotator)
+        self.element_id = element_id
+
+    def fql(self):
+        return "ADD errordetection OF " + self.set + " WITH class " + quote(self.cls) + " annotator " + quote(self.annotator) + " annotatortype \"auto\" datetime now FOR ID " + quote(self.element_id) + " RETURN nothing"
+
+
+class SplitEdit(Edit):
+    """Suggests splitting one word into multiple"""
+
+    def __init__(self, word_id, suggestions, foliaset, cls, annotator):
+        super().__init__(foliaset, cls, annotator)
+        self.word_id = word_id
+        self.suggestions = suggestions #list of ([word], confidence) tuples
+
+    def fql(self):
+        q = "SUBSTITUTE (" + self.correctionfql()
+        for suggestion, confidence in self.suggestions:
+            q += " SUGGESTION ("
+            for i, newword in enumerate(suggestion):
+                if i > 0: q += " "
+                q += "SUBSTITUTE w WITH text " + quote(newword)
+            q += ") WITH confidence " + str(confidence)
+        q += ") FOR SPAN ID " + quote(self.word_id)
+        q += " RETURN nothing"
+        return q
+
+
+class MergeEdit(Edit):
+    """Suggests merging multiple words into one"""
+
+    def __init__(self, newword, originalwords, foliaset, cls, annotator):
+        super().__init__(foliaset, cls, annotator)
+        self.newword = newword
+        self.originalwords = originalwords #IDs of the words to merge
+
+    def fql(self):
+        q = "SUBSTITUTE (" + self.correctionfql()
+        q += " SUGGESTION"
+        q += " (SUBSTITUTE w WITH text " + quote(self.newword) + ")"
+        q += ") FOR SPAN"
+        for i, ow in enumerate(self.originalwords):
+            if i > 0: q += " &"
+            q += " ID " + quote(ow)
+        q += " RETURN nothing"
+        return q
+
+
+class DeletionEdit(Edit):
+    """Suggests deleting a word"""
+
+    def __init__(self, word_id, merge, foliaset, cls, annotator):
+        super().__init__(foliaset, cls, annotator)
+        self.word_id = word_id
+        self.merge = merge
+
+    def fql(self):
+        q = "SUBSTITUTE (" + self.correctionfql()
+        if self.merge:
+            q += " SUGGESTION MERGE DELETION "
+        else:
+            q += " SUGGESTION DELETION "
+        q += ") FOR SPAN ID " + quote(self.word_id)
+        q += " RETURN nothing"
+        return q
+
+
+class InsertionEdit(Edit):
+    """Suggests inserting a word before (mode PREPEND) or after (mode APPEND) a pivot word"""
+
+    def __init__(self, pivotword_id, text, split, mode, foliaset, cls, annotator):
+        super().__init__(foliaset, cls, annotator)
+        self.pivotword_id = pivotword_id
+        self.text = text
+        self.split = split
+        self.mode = mode
+
+    def fql(self):
+        q = self.mode + " (" + self.correctionfql()
+        if self.split:
+            q += " SUGGESTION SPLIT (ADD w WITH text " + quote(self.text) + ") "
+        else:
+            q += " SUGGESTION (ADD w WITH text " + quote(self.text) + ") "
+        q += ") FOR ID " + quote(self.pivotword_id)
+        q += " RETURN nothing"
+        return q
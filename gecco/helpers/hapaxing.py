@@ -10,10 +10,11 @@
 #
 #=======================================================================
 
-import colibricore #pylint: disable=import-error
 import os.path
 
-from gecco.helpers.common import stripsourceextensions
+from gecco.helpers.common import stripsourceextensions, lazyimport
+
+colibricore = lazyimport('colibricore')
 
 def gethapaxer(module, settings):
     hapaxer = None
@@ -0,0 +1,191 @@
+#========================================================================
+#GECCO - Generic Enviroment for Context-Aware Correction of Orthography
+# Maarten van Gompel, Wessel Stoop, Antal van den Bosch
+# Centre for Language and Speech Technology
+# Radboud University Nijmegen
+#
+# Sponsored by Revisely (http://revise.ly)
+#
+# Licensed under the GNU Public License v3
+#
+#=======================================================================
+
+#Live metrics in the Prometheus text format. Module servers answer them to
+#%METRICS% (a METRICS frame in the framed protocol), the master daemon to a
+#metrics request on its socket and, if the metricsport setting is set, over
+#HTTP. The request counters are kept in shared memory, so all processes forked
+#after the metrics are created add to the same counters: the processors of
+#the master, the workers of a module server. Other values (queue depths,
+#memory, caches) are collected by the process that renders the metrics, at
+#the time it does.
+
+import os
+from collections import OrderedDict
+from threading import Thread
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from multiprocessing import Array
+import psutil
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) #upper bounds of the latency histogram buckets, in seconds
+
+#counters kept per module: (field, metric name suffix, type, help)
+FIELDS = (
+    ('requests', '_requests_total', 'counter', "Requests handled (a batch counts as one request)"),
+    ('units', '_units_total', 'counter', "Units processed"),
+    ('errors', '_errors_total', 'counter', "Requests that failed"),
+    ('inflight', '_inflight_units', 'gauge', "Units being processed right now"),
+    ('stored', '_stored_units_total', 'counter', "Units answered from the result store"),
+    ('duplicates', '_duplicate_units_total', 'counter', "Units not processed because another unit of the document had the same input"),
+    ('received', '_received_bytes_total', 'counter', "Size of the requests received, in bytes (characters with the line-based protocol)"),
+    ('sent', '_sent_bytes_total', 'counter', "Size of the responses sent, in bytes (characters with the line-based protocol)"),
+    ('duration', '_request_duration_seconds_sum', None, None),
+    ('observed', '_request_duration_seconds_count', None, None),
+)
+FIELDINDEX = { field: i for i, (field, _, _, _) in enumerate(FIELDS) }
+MASTERMETRICS = ('requests','units','errors','inflight','stored','duplicates') #counters kept by the master, the size of what goes over the wire is counted by the servers
+SERVERMETRICS = ('requests','units','errors','inflight','received','sent')
+
+def labelstring(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join( key + "=\"" + str(value).replace("\\","\\\\").replace("\"","\\\"") + "\"" for key, value in labels ) + "}"
+
+def number(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+def memory(pid=None):
+    """Resident memory of a process in bytes"""
+    try:
+        return psutil.Process(pid if pid is not None else os.getpid()).memory_info().rss
+    except psutil.Error:
+        return 0
+
+
+class Metrics:
+    """Request metrics per module, in shared memory, rendered in the Prometheus text format. Extra values are added by gauge functions, called when the metrics are rendered"""
+
+    def __init__(self, prefix, module_ids, labels=(), fields=None):
+        self.prefix = prefix
+        self.labels = tuple(labels) #added to all samples
+        self.fields = fields #the counters to report (all if None), others are not kept by the process using the metrics
+        self.module_ids = list(module_ids)
+        self.width = len(FIELDS) + len(BUCKETS) + 1 #the counters, followed by the buckets of the histogram (the last for durations beyond the largest bound)
+        self.values = Array('d', max(1, len(self.module_ids) * self.width))
+        self.offsets = { module_id: i * self.width for i, module_id in enumerate(self.module_ids) }
+        self.gauges = [] #functions returning a list of (name, type, help, [(labels, value)]) tuples
+
+    def add(self, module_id, field, value=1):
+        if module_id in self.offsets:
+            with self.values.get_lock():
+                self.values[self.offsets[module_id] + FIELDINDEX[field]] += value
+
+    def begin(self, module_id, units):
+        """Called when units are sent to a module"""
+        self.add(module_id, 'inflight', units)
+
+    def end(self, module_id, units, duration, success=True, received=0, sent=0):
+        """Called when a request has completed (or failed)"""
+        if module_id not in self.offsets:
+            return
+        offset = self.offsets[module_id]
+        bucket = len(BUCKETS)
+        for i, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                bucket = i
+                break
+        with self.values.get_lock():
+            self.values[offset + FIELDINDEX['inflight']] -= units
+            self.values[offset + FIELDINDEX['requests']] += 1
+            self.values[offset + FIELDINDEX['units']] += units
+            if not success:
+                self.values[offset + FIELDINDEX['errors']] += 1
+            self.values[offset + FIELDINDEX['received']] += received
+            self.values[offset + FIELDINDEX['sent']] += sent
+            self.values[offset + FIELDINDEX['duration']] += duration
+            self.values[offset + FIELDINDEX['observed']] += 1
+            self.values[offset + len(FIELDS) + bucket] += 1
+
+    def render(self):
+        """Returns the metrics in the Prometheus text format"""
+        with self.values.get_lock():
+            values = list(self.values)
+        lines = []
+        for i, (field, suffix, metrictype, helptext) in enumerate(FIELDS):
+            if metrictype is None:
+                continue #part of the histogram
+            if self.fields is not None and field not in self.fields:
+                continue
+            lines.append("# HELP " + self.prefix + suffix + " " + helptext)
+            lines.append("# TYPE " + self.prefix + suffix + " " + metrictype)
+            for module_id, offset in self.offsets.items():
+                lines.append(self.prefix + suffix + labelstring(self.labels + (('module', module_id),)) + " " + number(values[offset + i]))
+        name = self.prefix + "_request_duration_seconds"
+        lines.append("# HELP " + name + " Time it took to handle requests")
+        lines.append("# TYPE " + name + " histogram")
+        for module_id, offset in self.offsets.items():
+            labels = self.labels + (('module', module_id),)
+            count = 0
+            for i, bound in enumerate(BUCKETS + (float('inf'),)):
+                count += values[offset + len(FIELDS) + i]
+                lines.append(name + "_bucket" + labelstring(labels + (('le', "+Inf" if bound == float('inf') else repr(bound)),)) + " " + number(count))
+            lines.append(name + "_sum" + labelstring(labels) + " " + number(values[offset + FIELDINDEX['duration']]))
+            lines.append(name + "_count" + labelstring(labels) + " " + number(values[offset + FIELDINDEX['observed']]))
+        for gauge in self.gauges:
+            for name, metrictype, helptext, samples in gauge():
+                lines.append("# HELP " + self.prefix + name + " " + helptext)
+                lines.append("# TYPE " + self.prefix + name + " " + metrictype)
+                for labels, value in samples:
+                    lines.append(self.prefix + name + labelstring(self.labels + tuple(labels)) + " " + number(value))
+        return "\n".join(lines) + "\n"
+
+
+def cachegauges(modules):
+    """Gauge function for the counters of the caches of modules (those with a cache that has stats())"""
+    def gauge():
+        stats = [ (module.id, module.cache.stats()) for module in modules if hasattr(getattr(module, 'cache', None), 'stats') ]
+        if not stats:
+            return []
+        return [ ("_cache_" + counter + "_total", 'counter', "Cache " + counter + " of the module (in the process answering)", [ ((('module', module_id),), s[counter]) for module_id, s in stats ]) for counter in ('hits','misses','evictions','expirations') ]
+    return gauge
+
+
+def mergemetrics(texts):
+    """Combines the metrics of several sources into one text, the samples of each metric are grouped under a single HELP and TYPE line"""
+    families = OrderedDict() #name => [HELP line, TYPE line, samples]
+    for text in texts:
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                family = families.setdefault(line.split()[2], [None, None, []])
+                family[0 if line.startswith("# HELP ") else 1] = line
+            elif line and family is not None:
+                family[2].append(line)
+    return "".join( "\n".join( [ line for line in (helpline, typeline) if line ] + samples ) + "\n" for helpline, typeline, samples in families.values() )
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self): #pylint: disable=invalid-name
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): #pylint: disable=redefined-builtin
+        pass #scrapes are not worth logging
+
+
+def servehttp(metrics, port, host='127.0.0.1'):
+    """Serves the metrics over HTTP (GET /metrics) in a background thread, returns the server"""
+    server = HTTPServer((host, port), MetricsHandler)
+    server.metrics = metrics
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
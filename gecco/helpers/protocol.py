@@ -0,0 +1,123 @@
+#========================================================================
+#GECCO - Generic Enviroment for Context-Aware Correction of Orthography
+# Maarten van Gompel, Wessel Stoop, Antal van den Bosch
+# Centre for Language and Speech Technology
+# Radboud University Nijmegen
+#
+# Sponsored by Revisely (http://revise.ly)
+#
+# Licensed under the GNU Public License v3
+#
+#=======================================================================
+
+#Framed protocol between module clients and module servers (protocol version 2)
+#
+#A client starts by sending the line "%HELLO% <version> <codec>,<codec>,..." listing
+#the codecs it supports in order of preference. A server that understands this
+#answers "%HELLO% 2 <codec>" and from then on both sides exchange length-prefixed
+#frames serialised with the chosen codec. A server that answers "%HELLO% 1" (or
+#doesn't understand the greeting at all) keeps the connection newline-delimited
+#JSON (protocol version 1).
+
+import json
+import struct
+from collections import OrderedDict
+
+try:
+    import msgpack #pylint: disable=import-error
+except ImportError:
+    msgpack = None
+
+PROTOCOL_VERSION = 2
+
+#Frame types
+REQUEST = 1
+BATCH = 2
+RESPONSE = 3
+ERROR = 4
+GETLOAD = 5
+METRICS = 6 #payload of the response is the metrics text (see gecco.helpers.metrics)
+TRACED = 0x80 #flag on REQUEST, BATCH and RESPONSE frames, their payload starts with a trace record (see packtrace())
+
+HEADER = struct.Struct(">BII") #frame type, request ID (0 if not pipelined), payload length in bytes
+TRACEHEADER = struct.Struct(">H") #length of the trace record in bytes
+
+#Traced requests (see gecco.helpers.tracing) carry their trace ID, the response
+#to them carries the trace record of the server (JSON). In the line-based
+#protocol both are prefixed to the message as %TRACE%<trace> (the trace
+#record contains no spaces), in the framed protocol they are prefixed to the
+#payload, and the frame type gets the TRACED flag.
+
+class JSONCodec:
+    name = 'json'
+
+    @staticmethod
+    def dumps(data):
+        return json.dumps(data).encode('utf-8')
+
+    @staticmethod
+    def loads(payload):
+        return json.loads(str(payload,'utf-8'))
+
+class MsgPackCodec:
+    """Compact binary serialisation, only available if the msgpack package is installed"""
+    name = 'msgpack'
+
+    @staticmethod
+    def dumps(data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    @staticmethod
+    def loads(payload):
+        return msgpack.unpackb(payload, raw=False)
+
+CODECS = OrderedDict() #available codecs, in order of preference
+if msgpack is not None:
+    CODECS[MsgPackCodec.name] = MsgPackCodec
+CODECS[JSONCodec.name] = JSONCodec
+
+
+def negotiate(offered):
+    """Returns the first of the offered codec names that we support, or None"""
+    for name in offered:
+        if name in CODECS:
+            return CODECS[name]
+    return None
+
+def readframe(reader):
+    """Reads one frame from a buffered reader, returns a (type, requestid, payload) tuple, or None if the connection was closed"""
+    header = reader.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    frametype, requestid, length = HEADER.unpack(header)
+    payload = reader.read(length)
+    if len(payload) < length:
+        return None
+    return frametype, requestid, payload
+
+def packframe(frametype, requestid, payload):
+    return HEADER.pack(frametype, requestid, len(payload)) + payload
+
+def writeframe(sock, frametype, requestid, payload):
+    sock.sendall(packframe(frametype, requestid, payload))
+
+def packtrace(trace, payload):
+    """Prefixes the trace ID or record (a string) to the payload of a frame"""
+    trace = trace.encode('utf-8')
+    return TRACEHEADER.pack(len(trace)) + trace + payload
+
+def unpacktrace(payload):
+    """Splits the payload of a TRACED frame into the trace ID or record and the actual payload"""
+    length = TRACEHEADER.unpack_from(payload)[0]
+    return str(payload[TRACEHEADER.size:TRACEHEADER.size+length],'utf-8'), payload[TRACEHEADER.size+length:]
+
+def traceline(trace, msg):
+    """Prefixes the trace ID or record to a message of the line-based protocol"""
+    return "%TRACE%" + trace + " " + msg
+
+def untraceline(msg):
+    """Splits a message of the line-based protocol into the trace ID or record (None if there is none) and the actual message"""
+    if msg.startswith("%TRACE%"):
+        trace, _, msg = msg[7:].partition(" ")
+        return trace, msg
+    return None, msg
@@ -0,0 +1,202 @@
+#========================================================================
+#GECCO - Generic Enviroment for Context-Aware Correction of Orthography
+# Maarten van Gompel, Wessel Stoop, Antal van den Bosch
+# Centre for Language and Speech Technology
+# Radboud University Nijmegen
+#
+# Sponsored by Revisely (http://revise.ly)
+#
+# Licensed under the GNU Public License v3
+#
+#=======================================================================
+
+import time
+import pickle
+import struct
+import multiprocessing
+import multiprocessing.queues
+from multiprocessing.sharedctypes import RawArray, RawValue #pylint: disable=no-name-in-module
+from collections import deque
+from queue import Empty
+
+HEADER = struct.Struct(">I") #length of a pickled chunk
+
+def getqueue(settings):
+    """Returns a queue for communication between the master's processes, using the transport configured in the settings"""
+    if 'transport' not in settings:
+        settings['transport'] = 'queue'
+    if 'chunksize' not in settings:
+        settings['chunksize'] = 100
+    if 'queuebuffer' not in settings:
+        settings['queuebuffer'] = 16 * 1024 * 1024 #16MB
+
+    if settings['transport'] == 'queue':
+        return JoinableQueue()
+    elif settings['transport'] == 'sharedmemory':
+        return ChunkedQueue(int(settings['chunksize']), int(settings['queuebuffer']))
+    else:
+        raise Exception("invalid transport: " + settings['transport'])
+
+
+class JoinableQueue(multiprocessing.queues.JoinableQueue): #pylint: disable=abstract-method
+    """The default transport, passes every item individually through a pipe. Adds no-op versions of the extra methods of ChunkedQueue"""
+
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize, ctx=multiprocessing.get_context())
+
+    def flush(self):
+        pass
+
+    def buffered(self):
+        return 0
+
+    def pending(self):
+        """Returns the number of items put in the queue that have not been marked done yet, None if the platform can't tell"""
+        try:
+            return self._unfinished_tasks.get_value()
+        except NotImplementedError: #macOS
+            return None
+
+
+class ChunkedQueue:
+    """Multi-producer/multi-consumer queue that moves chunks of items through a ring buffer in shared memory.
+
+    Items put by a process are collected until ``chunksize`` of them are available (or flush() is called), the chunk is then pickled and written to the ring buffer as a whole. A consumer takes a whole chunk at a time and hands out its items locally.
+
+    Completion accounting for join() is done in shared counters: task_done() only counts locally, the count is published once the consumer has no more items of its chunk left. Chunks larger than the buffer are streamed through it, so ``buffersize`` only bounds the memory, not the size of the items.
+    """
+
+    def __init__(self, chunksize=100, buffersize=16*1024*1024):
+        self.chunksize = max(1,chunksize)
+        self.buffersize = buffersize
+        self.ring = RawArray('B', buffersize)
+        self.head = RawValue('Q', 0) #total number of bytes read
+        self.tail = RawValue('Q', 0) #total number of bytes written
+        self.produced = RawValue('Q', 0) #total number of items written
+        self.completed = RawValue('Q', 0) #total number of items marked done
+        self.lock = multiprocessing.Lock()
+        self.changed = multiprocessing.Condition(self.lock)
+        self.readlock = multiprocessing.Lock() #held for reading an entire chunk
+        self.writelock = multiprocessing.Lock() #held for writing an entire chunk
+        self.resetlocal()
+
+    def resetlocal(self):
+        self.view = None
+        self.putbuffer = [] #items put by this process that have not been written yet
+        self.getbuffer = deque() #items of the last chunk read by this process that have not been handed out yet
+        self.done = 0 #items marked done by this process that have not been published yet
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('view','putbuffer','getbuffer','done'):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.resetlocal()
+
+    def getview(self):
+        if self.view is None:
+            self.view = memoryview(self.ring).cast('B')
+        return self.view
+
+    def available(self):
+        return self.tail.value - self.head.value
+
+    def put(self, item):
+        self.putbuffer.append(item)
+        if len(self.putbuffer) >= self.chunksize:
+            self.flush()
+
+    def flush(self):
+        """Write all items put by this process so far to the shared buffer"""
+        if self.putbuffer:
+            data = pickle.dumps(self.putbuffer, pickle.HIGHEST_PROTOCOL)
+            with self.changed:
+                self.produced.value += len(self.putbuffer) #account before writing, consumers may complete items as soon as they are written
+            self.putbuffer = []
+            with self.writelock:
+                self.write(HEADER.pack(len(data)))
+                self.write(data)
+
+    def write(self, data):
+        view = self.getview()
+        data = memoryview(data)
+        pos = 0
+        while pos < len(data):
+            with self.changed:
+                self.changed.wait_for(lambda: self.available() < self.buffersize)
+                n = min(self.buffersize - self.available(), len(data) - pos)
+                start = self.tail.value % self.buffersize
+                first = min(n, self.buffersize - start)
+                view[start:start+first] = data[pos:pos+first]
+                if first < n: #wrap around
+                    view[0:n-first] = data[pos+first:pos+n]
+                self.tail.value += n
+                self.changed.notify_all()
+            pos += n
+
+    def read(self, size):
+        view = self.getview()
+        data = bytearray(size)
+        pos = 0
+        while pos < size:
+            with self.changed:
+                self.changed.wait_for(lambda: self.available() > 0)
+                n = min(self.available(), size - pos)
+                start = self.head.value % self.buffersize
+                first = min(n, self.buffersize - start)
+                data[pos:pos+first] = view[start:start+first]
+                if first < n: #wrap around
+                    data[pos+first:pos+n] = view[0:n-first]
+                self.head.value += n
+                self.changed.notify_all()
+            pos += n
+        return data
+
+    def get(self, block=True, timeout=None):
+        if not self.getbuffer:
+            self.publish() #we're out of items, let everybody know how far we got before waiting for more
+            deadline = time.time() + timeout if block and timeout is not None else None #the timeout covers both waits
+            if not self.readlock.acquire(block, timeout if block else None):
+                raise Empty
+            try:
+                with self.changed:
+                    if block:
+                        ready = self.changed.wait_for(lambda: self.available() >= HEADER.size, None if deadline is None else max(0, deadline - time.time()))
+                    else:
+                        ready = self.available() >= HEADER.size
+                if not ready:
+                    raise Empty
+                #once the header is in, the writer is busy writing the chunk, so we can wait for the rest
+                size = HEADER.unpack(self.read(HEADER.size))[0]
+                self.getbuffer.extend(pickle.loads(self.read(size)))
+            finally:
+                self.readlock.release()
+        return self.getbuffer.popleft()
+
+    def buffered(self):
+        """Returns the number of items this process has read from the shared buffer but not handed out yet"""
+        return len(self.getbuffer)
+
+    def pending(self):
+        """Returns the number of items written to the queue that have not been marked done yet (as published by the consumers)"""
+        return self.produced.value - self.completed.value
+
+    def task_done(self):
+        self.done += 1
+        if not self.getbuffer:
+            self.publish()
+
+    def publish(self):
+        if self.done:
+            with self.changed:
+                self.completed.value += self.done
+                self.changed.notify_all()
+            self.done = 0
+
+    def join(self):
+        """Blocks until all items written so far have been marked done"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.completed.value >= self.produced.value)
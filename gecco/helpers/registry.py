@@ -0,0 +1,102 @@
+#========================================================================
+#GECCO - Generic Enviroment for Context-Aware Correction of Orthography
+# Maarten van Gompel, Wessel Stoop, Antal van den Bosch
+# Centre for Language and Speech Technology
+# Radboud University Nijmegen
+#
+# Sponsored by Revisely (http://revise.ly)
+#
+# Licensed under the GNU Public License v3
+#
+#=======================================================================
+
+#Server registry, kept in the run/ directory next to the pid files. Every
+#running module server periodically writes its load to a heartbeat file
+#(<module>.<host>.<port>.load). Servers with a recent heartbeat are taken as
+#alive without contacting them, only the others are probed (concurrently).
+#
+#Servers also listen on a Unix domain socket in the same directory
+#(<module>.<host>.<port>.sock), clients on the same host use it instead of TCP.
+
+import os
+import time
+import socket
+from threading import Thread, Event
+from concurrent.futures import ThreadPoolExecutor
+
+def heartbeatfile(runpath, module_id, host, port):
+    return os.path.join(runpath, module_id + "." + host + "." + str(port) + ".load")
+
+def unixsocketpath(runpath, module_id, host, port):
+    """Returns the path of the Unix domain socket of a server, or None if the path would be too long for a socket address"""
+    path = os.path.join(runpath, module_id + "." + host + "." + str(port) + ".sock")
+    if len(path.encode('utf-8')) > 100: #the limit is 104 or 108 bytes depending on the platform
+        return None
+    return path
+
+def islocalhost(host):
+    return host in ('127.0.0.1', 'localhost', socket.getfqdn(), socket.gethostname()) or host == socket.gethostbyname(socket.gethostname())
+
+def readheartbeat(filename, ttl):
+    """Returns the load recorded in a heartbeat file, or None if there is no heartbeat or it is older than ttl seconds"""
+    try:
+        if time.time() - os.path.getmtime(filename) > ttl:
+            return None
+        with open(filename,'r') as f:
+            return float(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def probe(host, port, timeout=0.25):
+    """Asks a module server for its load, raises an exception if it doesn't respond in time"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(timeout) #module servers have to respond very quickly or we ignore them
+    try:
+        sock.connect( (host,port) )
+        sock.sendall(b"%GETLOAD%\n")
+        return float(sock.recv(1024))
+    finally:
+        sock.close()
+
+def probeall(servers, timeout=0.25):
+    """Probes a list of (host, port) tuples concurrently, returns a list of loads or exceptions in the same order"""
+    def safeprobe(server):
+        try:
+            return probe(server[0], server[1], timeout)
+        except Exception as e: #pylint: disable=broad-except
+            return e
+    if not servers:
+        return []
+    with ThreadPoolExecutor(min(32, len(servers))) as executor:
+        return list(executor.map(safeprobe, servers))
+
+
+class Heartbeat(Thread):
+    """Runs alongside a module server and writes its load to the heartbeat file every interval seconds"""
+
+    def __init__(self, filename, module, interval):
+        super().__init__()
+        self.daemon = True
+        self.filename = filename
+        self.module = module
+        self.interval = interval
+        self.stopped = Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                tmpfilename = self.filename + ".tmp"
+                with open(tmpfilename,'w') as f:
+                    f.write(str(self.module.server_load()))
+                os.replace(tmpfilename, self.filename) #readers never see a partially written file
+            except OSError:
+                pass #run directory may be gone, try again next time
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        try:
+            os.unlink(self.filename)
+        except OSError:
+            pass
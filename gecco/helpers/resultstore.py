@@ -0,0 +1,98 @@
+#========================================================================
+#GECCO - Generic Enviroment for Context-Aware Correction of Orthography
+# Maarten van Gompel, Wessel Stoop, Antal van den Bosch
+# Centre for Language and Speech Technology
+# Radboud University Nijmegen
+#
+# Sponsored by Revisely (http://revise.ly)
+#
+# Licensed under the GNU Public License v3
+#
+#=======================================================================
+
+#Persistent result store (setting resultstore), kept by the master. The
+#output of a module for some input is stored under a key made of the
+#fingerprint of the module (see Module.fingerprint(), covers its model files
+#and settings) and the input itself, so documents processed later, in this
+#run or another one, get the output without contacting the module. When a
+#model is retrained its fingerprint changes, and the stored outputs of the
+#module are purged as well.
+
+import os
+import json
+import pickle
+import sqlite3
+import hashlib
+
+MAXVARIABLES = 500 #number of keys looked up per query, stays below the limit of older SQLite versions
+
+RUNTIMESETTINGS = ('logfunction','local','servers','server','serverthreads','workers','routing','depends','submodule','storeresults','set','class','annotator','cachetype','cachesize','cachebytes','cachettl','cacheshards','cacheslotsize','deduplicate') #module settings that don't affect the output of run()
+
+def settingvalue(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str) #sets have no fixed order
+    return str(value)
+
+def fingerprint(module):
+    """Identifies the model files (by size and modification time) and the settings of a module"""
+    h = hashlib.sha1()
+    h.update((module.__class__.__module__ + "." + module.__class__.__name__ + "\n").encode('utf-8'))
+    settings = { key: value for key, value in module.settings.items() if key not in RUNTIMESETTINGS and not callable(value) }
+    h.update(json.dumps(settings, sort_keys=True, default=settingvalue).encode('utf-8'))
+    for modelfile in module.models:
+        for filename in (modelfile if isinstance(modelfile, tuple) else (modelfile,)):
+            try:
+                st = os.stat(filename)
+                h.update(("\n" + filename + " " + str(st.st_size) + " " + str(st.st_mtime_ns)).encode('utf-8'))
+            except OSError:
+                h.update(("\n" + filename + " missing").encode('utf-8'))
+    for submodule in module.submodules.values():
+        h.update(("\n" + submodule.fingerprint()).encode('utf-8'))
+    return module.id + ":" + h.hexdigest()
+
+
+class ResultStore:
+    """Stores module outputs in an SQLite database. Every process opens its own store, they can share the same file"""
+
+    def __init__(self, filename, timeout=60):
+        self.filename = filename
+        self.db = sqlite3.connect(filename, timeout=timeout)
+        self.db.execute("PRAGMA journal_mode=WAL") #readers don't block the writer and vice versa
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, module TEXT NOT NULL, output BLOB NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_module ON results (module)")
+        self.db.commit()
+
+    @staticmethod
+    def key(fingerprint, inputdata):
+        """Returns the key of the output for the input, or None if the input can't be serialised"""
+        try:
+            serialised = json.dumps(inputdata, sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha1((fingerprint + "\n" + serialised).encode('utf-8')).hexdigest()
+
+    def lookup(self, keys):
+        """Returns a dictionary of key => output for all keys that have a stored output"""
+        found = {}
+        keys = [ key for key in set(keys) if key is not None ]
+        for i in range(0, len(keys), MAXVARIABLES):
+            part = keys[i:i+MAXVARIABLES]
+            for key, output in self.db.execute("SELECT key, output FROM results WHERE key IN (" + ",".join("?" * len(part)) + ")", part):
+                found[key] = pickle.loads(output)
+        return found
+
+    def store(self, module_id, items):
+        """Stores a list of (key, output) tuples for a module"""
+        items = [ (key, module_id, pickle.dumps(output)) for key, output in items if key is not None ]
+        if items:
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO results (key, module, output) VALUES (?,?,?)", items)
+
+    def purge(self, module_id):
+        """Removes all stored outputs of a module, returns how many there were"""
+        with self.db:
+            return self.db.execute("DELETE FROM results WHERE module=?", (module_id,)).rowcount
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,150 @@
+#========================================================================
+#GECCO - Generic Enviroment for Context-Aware Correction of Orthography
+# Maarten van Gompel, Wessel Stoop, Antal van den Bosch
+# Centre for Language and Speech Technology
+# Radboud University Nijmegen
+#
+# Sponsored by Revisely (http://revise.ly)
+#
+# Licensed under the GNU Public License v3
+#
+#=======================================================================
+
+#Routing policies decide which of the servers of a module a processor sends
+#its next request to. Each processor has its own router per module; the
+#number of outstanding units per server is shared between the processors of
+#the master (module.outstanding, set up by Corrector.run()).
+
+import time
+from gecco.helpers.registry import heartbeatfile, readheartbeat
+
+ROUTINGPOLICIES = ('roundrobin','leastoutstanding','poweroftwo','latency')
+
+RETRYAFTER = 10 #seconds during which a server that failed is avoided (unless all servers failed)
+MINREFRESH = 1 #minimum number of seconds between reads of the load of a server from the registry, even if heartbeats are more frequent (or disabled)
+
+def getrouter(module, rng):
+    """Returns a router for the module, using the routing policy configured in its settings"""
+    if module.settings['routing'] == 'roundrobin':
+        return RoundRobinRouter(module, rng)
+    elif module.settings['routing'] == 'leastoutstanding':
+        return LeastOutstandingRouter(module, rng)
+    elif module.settings['routing'] == 'poweroftwo':
+        return PowerOfTwoRouter(module, rng)
+    elif module.settings['routing'] == 'latency':
+        return LatencyRouter(module, rng)
+    else:
+        raise Exception("invalid routing policy for module " + module.id + ": " + module.settings['routing'])
+
+
+class RoundRobinRouter:
+    """Rotates over all servers, starting at a random one"""
+
+    def __init__(self, module, rng):
+        self.module = module
+        self.random = rng
+        self.failed = {} #server index => time of last failure
+        self.seqnr = rng.randint(0,len(module.servers)) #start with a random sequence nr
+
+    def candidates(self):
+        """Returns the indices of all servers that haven't failed recently (or of all servers if they all did)"""
+        if not self.module.servers:
+            raise IndexError("No servers")
+        now = time.time()
+        candidates = [ i for i in range(len(self.module.servers)) if now - self.failed.get(i,0) > RETRYAFTER ]
+        if not candidates:
+            candidates = list(range(len(self.module.servers)))
+        return candidates
+
+    def select(self):
+        """Returns the index of the server to send the next request to"""
+        candidates = self.candidates()
+        self.seqnr += 1
+        return candidates[self.seqnr % len(candidates)]
+
+    def begin(self, index, count):
+        """Called when a request for count units is sent to a server"""
+        if self.module.outstanding is not None:
+            with self.module.outstanding.get_lock():
+                self.module.outstanding[index] += count
+
+    def end(self, index, count, duration, success):
+        """Called when a request sent to a server has completed (or failed)"""
+        if self.module.outstanding is not None:
+            with self.module.outstanding.get_lock():
+                self.module.outstanding[index] -= count
+        if success:
+            if index in self.failed:
+                del self.failed[index]
+        else:
+            self.failed[index] = time.time()
+
+
+class LeastOutstandingRouter(RoundRobinRouter):
+    """Picks the server with the fewest units outstanding from the master, ties are broken randomly"""
+
+    def select(self):
+        candidates = self.candidates()
+        if self.module.outstanding is None:
+            return self.random.choice(candidates)
+        fewest = min( self.module.outstanding[i] for i in candidates )
+        return self.random.choice([ i for i in candidates if self.module.outstanding[i] == fewest ])
+
+
+class PowerOfTwoRouter(RoundRobinRouter):
+    """Picks two servers at random and sends the request to the one with the lower load. Loads are refreshed from the server registry as servers report them"""
+
+    def __init__(self, module, rng):
+        super().__init__(module, rng)
+        self.loads = [ load for _,_,load in module.servers ]
+        self.refreshed = [ time.time() ] * len(module.servers)
+
+    def getload(self, index):
+        if time.time() - self.refreshed[index] > max(self.module.parent.settings['heartbeat'], MINREFRESH):
+            host, port, _ = self.module.servers[index]
+            load = readheartbeat(heartbeatfile(self.module.parent.root + "run", self.module.id, host, port), self.module.parent.settings['registryttl'])
+            if load is not None:
+                self.loads[index] = load
+            self.refreshed[index] = time.time()
+        return self.loads[index]
+
+    def select(self):
+        candidates = self.candidates()
+        if len(candidates) == 1:
+            return candidates[0]
+        a, b = self.random.sample(candidates, 2)
+        if self.getload(b) < self.getload(a):
+            return b
+        return a
+
+
+class LatencyRouter(RoundRobinRouter):
+    """Picks a server at random, weighted by the inverse of its measured latency per unit. Servers that have not been measured yet are assumed to be as fast as the fastest one"""
+
+    ALPHA = 0.3 #weight of the latest measurement in the moving average
+
+    def __init__(self, module, rng):
+        super().__init__(module, rng)
+        self.latency = {} #server index => moving average of the latency per unit
+
+    def select(self):
+        candidates = self.candidates()
+        if self.latency:
+            fastest = min(self.latency.values())
+        else:
+            fastest = 1.0
+        weights = [ 1.0 / max(self.latency.get(i, fastest), 1e-6) for i in candidates ]
+        threshold = self.random.random() * sum(weights)
+        for candidate, weight in zip(candidates, weights):
+            threshold -= weight
+            if threshold < 0:
+                return candidate
+        return candidates[-1] #rounding
+
+    def end(self, index, count, duration, success):
+        super().end(index, count, duration, success)
+        if success and count:
+            if index in self.latency:
+                self.latency[index] = self.ALPHA * (duration / count) + (1 - self.ALPHA) * self.latency[index]
+            else:
+                self.latency[index] = duration / count
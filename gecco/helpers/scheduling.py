@@ -0,0 +1,48 @@
+#========================================================================
+#GECCO - Generic Enviroment for Context-Aware Correction of Orthography
+# Maarten van Gompel, Wessel Stoop, Antal van den Bosch
+# Centre for Language and Speech Technology
+# Radboud University Nijmegen
+#
+# Sponsored by Revisely (http://revise.ly)
+#
+# Licensed under the GNU Public License v3
+#
+#=======================================================================
+
+class ExecutionPlan:
+    """The order in which modules are run, compiled once from the ``depends`` setting of the modules.
+
+    Modules are grouped in levels: the first level holds all modules without dependencies, every next level the modules whose dependencies are all in earlier levels. Within a level, modules keep the order in which they were defined.
+    """
+
+    def __init__(self, modules):
+        self.levels = []
+        self.prerequisites = {} #module id => set of ids of all modules it depends on, directly or indirectly
+        for module in modules:
+            for dep in module.settings['depends']:
+                if not any( m.id == dep for m in modules ):
+                    raise Exception("Module " + module.id + " depends on " + dep + ", which is not defined")
+
+        done = set()
+        remaining = list(modules)
+        while remaining:
+            level = [ module for module in remaining if all( dep in done for dep in module.settings['depends'] ) ]
+            if not level:
+                raise Exception("There are unsolvable (circular?) dependencies in your module definitions")
+            for module in level:
+                self.prerequisites[module.id] = set()
+                for dep in module.settings['depends']:
+                    self.prerequisites[module.id].add(dep)
+                    self.prerequisites[module.id] |= self.prerequisites[dep]
+            done |= set( module.id for module in level )
+            remaining = [ module for module in remaining if module.id not in done ]
+            self.levels.append(level)
+
+    def __iter__(self):
+        for level in self.levels:
+            for module in level:
+                yield module
+
+    def hasdependencies(self):
+        return len(self.levels) > 1
@@ -0,0 +1,247 @@
+#========================================================================
+#GECCO - Generic Enviroment for Context-Aware Correction of Orthography
+# Maarten van Gompel, Wessel Stoop, Antal van den Bosch
+# Centre for Language and Speech Technology
+# Radboud University Nijmegen
+#
+# Sponsored by Revisely (http://revise.ly)
+#
+# Licensed under the GNU Public License v3
+#
+#=======================================================================
+
+#Streaming mode (setting streaming: true) for documents too large to hold in
+#memory. The reader cuts the text of a FoLiA document into chunks of a number
+#of paragraphs (or other elements directly under the text or a division),
+#each chunk is turned into a small document of its own, together with a few
+#neighbouring paragraphs as context. The data thread processes the chunk
+#documents like any other document, but only queues the units in the
+#chunk's own paragraphs. The writer then writes those paragraphs to the
+#output, in order, as soon as they are done.
+
+import os
+import io
+import bz2
+import gzip
+from threading import Lock
+from collections import deque
+from xml.sax.saxutils import quoteattr
+from lxml import etree #pylint: disable=import-error
+from pynlpl.formats import folia #pylint: disable=import-error,no-name-in-module
+
+NSFOLIA = "http://ilk.uvt.nl/folia"
+NSXML = "http://www.w3.org/XML/1998/namespace"
+NSXLINK = "http://www.w3.org/1999/xlink"
+
+def openstream(filename, mode, compression=None):
+    """Opens a file, compressed with gzip or bzip2 if the filename (or compression) says so"""
+    if compression is None:
+        compression = filename.split('.')[-1].lower()
+    binarymode = mode.replace('t','')
+    if 'b' not in binarymode:
+        binarymode += 'b'
+    if compression == 'gz':
+        f = gzip.open(filename, binarymode)
+    elif compression == 'bz2':
+        f = bz2.open(filename, binarymode)
+    else:
+        f = io.open(filename, binarymode)
+    if 'b' in mode:
+        return f
+    return io.TextIOWrapper(f, encoding='utf-8')
+
+def starttag(tag, attrib, namespaces=""):
+    """Serialises the start tag of an element from its attributes"""
+    s = "<" + tag + namespaces
+    for key, value in attrib.items():
+        if key.startswith('{' + NSXML + '}'):
+            key = 'xml:' + key[len(NSXML) + 2:]
+        elif key.startswith('{' + NSXLINK + '}'):
+            key = 'xlink:' + key[len(NSXLINK) + 2:]
+        elif key.startswith('{'):
+            continue #attributes in other namespaces are not supported
+        s += " " + key + "=" + quoteattr(value)
+    return s + ">"
+
+def serialise(node):
+    s = etree.tostring(node, encoding='unicode', with_tail=False)
+    return s.replace('ns0:','').replace(':ns0','') #same patch as in folia.Document.xmlstring()
+
+
+class Chunk:
+    """A number of consecutive elements of the text of a document (the targets), along with the division tags around them (markup) and the elements just before and after them (context)"""
+
+    def __init__(self, reader, index, before, events):
+        self.reader = reader
+        self.index = index
+        self.before = before #XML of the elements preceding the chunk
+        self.events = events #('open'|'close', markup) or ('unit', XML) tuples, in document order
+        self.after = [] #XML of the elements following the chunk
+        self.doc = None
+        self.targets = None
+
+    def document(self):
+        """Builds the FoLiA document for the chunk: the metadata of the original document and a text holding the context and the targets. Sets self.targets to the target elements in it"""
+        units = [ xml for kind, xml in self.events if kind == 'unit' ]
+        textid = self.reader.textattrib.get('{' + NSXML + '}id', 'text')
+        xml = "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n" + starttag('FoLiA', self.reader.rootattrib, " xmlns=\"" + NSFOLIA + "\" xmlns:xlink=\"" + NSXLINK + "\"")
+        xml += self.reader.metadata
+        xml += starttag('text', self.reader.textattrib) + "<div xml:id=" + quoteattr(textid + ".stream." + str(self.index)) + ">"
+        xml += "".join(self.before) + "".join(units) + "".join(self.after)
+        xml += "</div></text></FoLiA>"
+        self.doc = folia.Document(string=xml)
+        division = self.doc.data[0].data[0]
+        self.targets = division.data[len(self.before):len(self.before) + len(units)]
+        return self.doc
+
+
+class FoLiAStreamReader:
+    """Reads the text of a FoLiA document element by element, without building the whole tree. Yields chunks"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.rootattrib = {}
+        self.textattrib = {}
+        self.metadata = ""
+
+    def events(self):
+        """Yields ('open', markup), ('close', markup) and ('unit', XML) tuples for the content of the text element. Units are the elements directly under the text or under a division, divisions themselves are passed as markup"""
+        f = openstream(self.filename, 'rb')
+        try:
+            unit = None #element we are in, we only look at its end
+            intext = False
+            for action, node in etree.iterparse(f, events=('start','end')):
+                if not isinstance(node.tag, str) or not node.tag.startswith('{' + NSFOLIA + '}'):
+                    continue #comments, processing instructions, foreign elements
+                tag = node.tag[len(NSFOLIA) + 2:]
+                if unit is not None:
+                    if action == 'end' and node is unit:
+                        yield ('unit', serialise(node))
+                        unit = None
+                        node.clear()
+                        while node.getprevious() is not None:
+                            del node.getparent()[0] #free what we have seen already
+                elif action == 'start':
+                    if tag == 'FoLiA':
+                        self.rootattrib = dict(node.attrib)
+                    elif tag == 'text' and not intext:
+                        self.textattrib = dict(node.attrib)
+                        intext = True
+                    elif intext and tag == 'div':
+                        yield ('open', starttag('div', node.attrib))
+                    elif intext:
+                        unit = node
+                else:
+                    if tag == 'metadata' and not intext:
+                        self.metadata = serialise(node)
+                    elif intext and tag == 'div':
+                        yield ('close', "</div>")
+                    elif tag == 'text':
+                        intext = False
+        finally:
+            f.close()
+
+    def chunks(self, size, context):
+        """Yields chunks of size units, each with up to context units before and after it. There is always at least one chunk, it may be empty"""
+        before = deque(maxlen=context if context > 0 else None) #units preceding the chunk being collected
+        events = []
+        count = 0
+        index = 0
+        waiting = [] #chunks that are complete but still need the units following them
+        for kind, xml in self.events():
+            if kind == 'unit':
+                for chunk in waiting:
+                    if len(chunk.after) < context:
+                        chunk.after.append(xml)
+                while waiting and len(waiting[0].after) >= context:
+                    yield waiting.pop(0)
+                count += 1
+            events.append( (kind, xml) )
+            if count >= size:
+                waiting.append( Chunk(self, index, list(before) if context > 0 else [], events) )
+                index += 1
+                if context > 0:
+                    for k, x in events:
+                        if k == 'unit':
+                            before.append(x)
+                events = []
+                count = 0
+                while waiting and len(waiting[0].after) >= context:
+                    yield waiting.pop(0)
+        if events or index == 0:
+            waiting.append( Chunk(self, index, list(before) if context > 0 else [], events) )
+        for chunk in waiting:
+            yield chunk
+
+
+class FoLiAStreamWriter:
+    """Writes the chunks of a document, in order, as they come in. Output goes to a temporary file that replaces the output file once all chunks are written, so the input can be the output too. Compressed with gzip or bzip2 if the filename ends in .gz or .bz2"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.tmpfilename = filename + ".tmp"
+        self.file = openstream(self.tmpfilename, 'wt', filename.split('.')[-1].lower())
+        self.pending = {} #index => chunk, chunks that are done but wait for earlier ones
+        self.next = 0 #index of the next chunk to write
+        self.total = None #number of chunks, known once the reader is done
+        self.failed = False
+        self.error = None
+        self.closed = False
+        self.lock = Lock()
+
+    def add(self, chunk):
+        """Adds a chunk whose document is done, returns the number of chunks written to the output (zero if it has to wait for earlier chunks)"""
+        with self.lock:
+            self.pending[chunk.index] = chunk
+            written = 0
+            while self.next in self.pending:
+                chunk = self.pending.pop(self.next)
+                if not self.failed:
+                    try:
+                        self.write(chunk)
+                    except Exception as e: #pylint: disable=broad-except
+                        self.failed = True #the remaining chunks are skipped, the output file is left alone
+                        self.error = str(e)
+                chunk.doc = chunk.targets = None #done with it, free the memory
+                self.next += 1
+                written += 1
+            self.checkclosed()
+            return written
+
+    def settotal(self, total, failed=False):
+        """Called once the reader is done, with the total number of chunks. Returns True if this completed the output"""
+        with self.lock:
+            self.total = total
+            self.failed = self.failed or failed
+            return self.checkclosed()
+
+    def write(self, chunk):
+        if chunk.index == 0:
+            #the header is taken from the first chunk, which has the declarations added by the modules
+            root = chunk.doc.xml()
+            for node in root:
+                if node.tag == '{' + NSFOLIA + '}text':
+                    for child in list(node):
+                        node.remove(child)
+                    node.text = "" #forces a separate end tag
+            header = serialise(root)
+            self.file.write("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n" + header[:header.rfind("</text>")] + "\n")
+        targets = iter(chunk.targets)
+        for kind, xml in chunk.events:
+            if kind == 'unit':
+                self.file.write(serialise(next(targets).xml()).replace(" xmlns=\"" + NSFOLIA + "\"", "", 1) + "\n") #already declared on the root
+            else:
+                self.file.write(xml + "\n")
+
+    def checkclosed(self):
+        if not self.closed and self.total is not None and self.next >= self.total:
+            self.closed = True
+            if self.failed:
+                self.file.close()
+                os.unlink(self.tmpfilename) #leave the original alone
+            else:
+                self.file.write("</text>\n</FoLiA>\n")
+                self.file.close()
+                os.replace(self.tmpfilename, self.filename)
+            return True
+        return False
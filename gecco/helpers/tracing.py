@@ -0,0 +1,103 @@
+#========================================================================
+#GECCO - Generic Enviroment for Context-Aware Correction of Orthography
+# Maarten van Gompel, Wessel Stoop, Antal van den Bosch
+# Centre for Language and Speech Technology
+# Radboud University Nijmegen
+#
+# Sponsored by Revisely (http://revise.ly)
+#
+# Licensed under the GNU Public License v3
+#
+#=======================================================================
+
+#Tracing (setting tracefile) of where the time goes for individual units. A
+#sample of the units (setting tracesample) gets a trace ID when the data
+#thread queues it, and every step of the unit is recorded as a span with that
+#ID: prepareinput, the wait in the input queue, the request to the module
+#server (or the local run), processoutput and the application of its edits.
+#The ID goes along with the request to the module server, which answers with
+#the times it spent decoding, running and encoding, so these are recorded
+#too (under the process ID of the server, its clock may differ from ours).
+#
+#All processes of the master append to the same file, one event per write.
+#Files ending in .json are in the Chrome trace event format (open them in
+#chrome://tracing or Perfetto), other files get the same events as JSON lines.
+
+import os
+import json
+import random
+import socket
+import threading
+
+HOSTNAME = socket.gethostname()
+
+class Tracer:
+    """Writes spans of sampled units to a trace file, shared by all processes forked after create() is called"""
+
+    def __init__(self, filename, sample=0.01, traceformat=None):
+        self.filename = filename
+        self.sample = sample #fraction of units traced
+        if traceformat is None:
+            traceformat = 'chrome' if filename.endswith('.json') else 'jsonl'
+        self.format = traceformat
+        self.fd = None
+        self.pid = None #process that opened self.fd
+        self.named = set() #process IDs whose name has been written by this process
+        self.random = random.Random()
+
+    def create(self):
+        """Starts a new trace file"""
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            if self.format == 'chrome':
+                f.write("[\n")
+
+    def traceid(self):
+        """Decides whether a unit is traced, returns its trace ID if so and None otherwise"""
+        if self.sample > 0 and self.random.random() < self.sample:
+            return os.urandom(8).hex()
+        return None
+
+    def write(self, event):
+        if self.pid != os.getpid():
+            #every process opens the file itself, writes in append mode end up at the end of the file as a whole
+            self.fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+            self.pid = os.getpid()
+            self.named = set()
+        line = json.dumps(event, separators=(',',':'))
+        os.write(self.fd, (line + (",\n" if self.format == 'chrome' else "\n")).encode('utf-8'))
+
+    def name(self, pid, name):
+        """Names a process in the trace"""
+        if pid not in self.named:
+            self.named.add(pid)
+            self.write({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': name}})
+
+    def span(self, name, traceid, begin, end, category="", pid=None, **args):
+        """Records a span from begin to end (times in seconds since the epoch) for the unit or request with the trace ID"""
+        args['id'] = traceid
+        self.write({'name': name, 'cat': category, 'ph': 'X', 'ts': round(begin * 1000000), 'dur': round((end - begin) * 1000000), 'pid': os.getpid() if pid is None else pid, 'tid': threading.get_ident() if pid is None else 0, 'args': args})
+
+    def serverspans(self, module_id, trace):
+        """Records the spans of a request on the module server, from the trace record it returned (see Module.handlerequest())"""
+        pid = trace.get('pid', 0)
+        self.name(pid, "gecco server " + module_id + " (" + str(trace.get('host')) + ")")
+        for name, begin, end in (('decode', 'begin', 'run'), ('run', 'run', 'encode'), ('encode', 'encode', 'end')):
+            if begin in trace and end in trace:
+                self.span(name, trace['id'], trace[begin], trace[end], module_id, pid, host=trace.get('host'))
+
+    def close(self):
+        """Ends the trace file, called by the master once all processes are done with it"""
+        if self.format == 'chrome':
+            #every event is followed by a comma, the last one closes the array instead
+            with open(self.filename, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': "gecco master"}}, separators=(',',':')) + "\n]\n")
+        if self.fd is not None and self.pid == os.getpid():
+            os.close(self.fd)
+            self.fd = None
+
+
+def servertrace(traceid, **times):
+    """The trace record a module server returns for a traced request"""
+    trace = {'id': traceid, 'host': HOSTNAME, 'pid': os.getpid()}
+    trace.update(times)
+    return trace
@@ -20,13 +20,14 @@ import sys
 import datetime
 from pynlpl.formats import folia
 from pynlpl.textprocessors import Windower
-from timbl import TimblClassifier #pylint: disable=import-error
-import colibricore #pylint: disable=import-error
 from gecco.gecco import Module
 from gecco.helpers.hapaxing import gethapaxer
-from gecco.helpers.common import stripsourceextensions
+from gecco.helpers.common import stripsourceextensions, lazyimport
 from gecco.helpers.filters import nonumbers
 
+timbl = lazyimport('timbl')
+colibricore = lazyimport('colibricore')
+
 
 class TIMBLWordConfusibleModule(Module):
     """The Word Confusible module is capable of disambiguating two or more words that are often confused, by looking at their context.
@@ -106,7 +107,7 @@ class TIMBLWordConfusibleModule(Module):
             raise IOError("Missing expected model file: " + modelfile + ". Did you forget to train the system?")
         self.log("Loading model file " + modelfile + "...")
         fileprefix = modelfile.replace(".ibase","") #has been verified earlier
-        self.classifier = TimblClassifier(fileprefix, self.gettimbloptions(), normalize=False) #pylint: disable=attribute-defined-outside-init
+        self.classifier = timbl.TimblClassifier(fileprefix, self.gettimbloptions(), normalize=False) #pylint: disable=attribute-defined-outside-init
         self.classifier.load()
 
     def train(self, sourcefile, modelfile, **parameters):
@@ -120,7 +121,7 @@ class TIMBLWordConfusibleModule(Module):
 
         self.log("Generating training instances...")
         fileprefix = modelfile.replace(".ibase","") #has been verified earlier
-        classifier = TimblClassifier(fileprefix, self.gettimbloptions())
+        classifier = timbl.TimblClassifier(fileprefix, self.gettimbloptions())
         if sourcefile.endswith(".bz2"):
             iomodule = bz2
         elif sourcefile.endswith(".gz"):
@@ -294,7 +295,7 @@ class TIMBLSuffixConfusibleModule(Module):
             raise IOError("Missing expected model file: " + self.modelfile + ". Did you forget to train the system?")
         self.log("Loading Timbl model file " + self.modelfile + "...")
         fileprefix = self.modelfile.replace(".ibase","") #has been verified earlier
-        self.classifier = TimblClassifier(fileprefix, self.gettimbloptions(), normalize=False) #pylint: disable=attribute-defined-outside-init
+        self.classifier = timbl.TimblClassifier(fileprefix, self.gettimbloptions(), normalize=False) #pylint: disable=attribute-defined-outside-init
         self.classifier.load()
 
     def clientload(self):
@@ -396,7 +397,7 @@ class TIMBLSuffixConfusibleModule(Module):
 
             self.log("Generating training instances...")
             fileprefix = modelfile.replace(".ibase","") #has been verified earlier
-            classifier = TimblClassifier(fileprefix, self.gettimbloptions())
+            classifier = timbl.TimblClassifier(fileprefix, self.gettimbloptions())
             if sourcefile.endswith(".bz2"):
                 iomodule = bz2
             elif sourcefile.endswith(".gz"):
@@ -15,14 +15,15 @@
 import os
 from pynlpl.formats import folia
 #from pynlpl.statistics import levenshtein
-import Levenshtein #pylint: disable=import-error
 from gecco.gecco import Module
 from gecco.helpers.caching import getcache
 from gecco.helpers.filters import hasalpha
-from gecco.helpers.common import stripsourceextensions
-import colibricore #pylint: disable=import-error
-import aspell #pylint: disable=import-error
-import hunspell #pylint: disable=import-error
+from gecco.helpers.common import stripsourceextensions, lazyimport
+
+colibricore = lazyimport('colibricore')
+Levenshtein = lazyimport('Levenshtein')
+aspell = lazyimport('aspell')
+hunspell = lazyimport('hunspell')
 
 
 class LexiconModule(Module):
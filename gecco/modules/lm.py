@@ -21,14 +21,15 @@ import itertools
 from collections import defaultdict
 from pynlpl.formats import folia
 from pynlpl.textprocessors import Windower
-from timbl import TimblClassifier #pylint: disable=import-error
 from gecco.gecco import Module
 from gecco.helpers.hapaxing import gethapaxer
 from gecco.helpers.caching import getcache
-from gecco.helpers.common import stripsourceextensions
+from gecco.helpers.common import stripsourceextensions, lazyimport
 from gecco.helpers.filters import nonumbers
-import colibricore #pylint: disable=import-error
-import Levenshtein #pylint: disable=import-error
+
+timbl = lazyimport('timbl')
+colibricore = lazyimport('colibricore')
+Levenshtein = lazyimport('Levenshtein')
 
 #pylint: disable=too-many-nested-blocks,attribute-defined-outside-init
 
@@ -143,7 +144,7 @@ class TIMBLLMModule(Module):
             raise IOError("Missing expected lexicon model file: " + lexiconfile + ". Did you forget to train the system?")
         self.log("Loading model file " + modelfile + "...")
         fileprefix = modelfile.replace(".ibase","") #has been verified earlier
-        self.classifier = TimblClassifier(fileprefix, self.gettimbloptions(),threading=True, debug=self.debug)
+        self.classifier = timbl.TimblClassifier(fileprefix, self.gettimbloptions(),threading=True, debug=self.debug)
         self.classifier.load()
 
         if lexiconfile:
@@ -164,7 +165,7 @@ class TIMBLLMModule(Module):
 
             self.log("Generating training instances...")
             fileprefix = modelfile.replace(".ibase","") #has been verified earlier
-            classifier = TimblClassifier(fileprefix, self.gettimbloptions())
+            classifier = timbl.TimblClassifier(fileprefix, self.gettimbloptions())
             if sourcefile.endswith(".bz2"):
                 iomodule = bz2
             elif sourcefile.endswith(".gz"):
@@ -20,12 +20,13 @@ import gzip
 import datetime
 from pynlpl.textprocessors import Windower
 from pynlpl.formats import folia #pylint: disable=import-error
-import colibricore #pylint: disable=import-error
-from timbl import TimblClassifier #pylint: disable=import-error
 from gecco.gecco import Module
 from gecco.helpers.hapaxing import gethapaxer
 from gecco.helpers.filters import nonumbers
-from gecco.helpers.common import stripsourceextensions
+from gecco.helpers.common import stripsourceextensions, lazyimport
+
+timbl = lazyimport('timbl')
+colibricore = lazyimport('colibricore')
 
 
 
@@ -452,7 +453,7 @@ class TIMBLPuncRecaseModule(Module):
             raise IOError("Missing expected model file: " + modelfile + ". Did you forget to train the system?")
         self.log("Loading model file " + modelfile + "...")
         fileprefix = modelfile.replace(".ibase","") #has been verified earlier
-        self.classifier = TimblClassifier(fileprefix, self.gettimbloptions())
+        self.classifier = timbl.TimblClassifier(fileprefix, self.gettimbloptions())
         self.classifier.load()
 
 
@@ -482,7 +483,7 @@ class TIMBLPuncRecaseModule(Module):
 
         self.log("Generating training instances...")
         fileprefix = modelfile.replace(".ibase","") #has been verified earlier
-        classifier = TimblClassifier(fileprefix, self.gettimbloptions())
+        classifier = timbl.TimblClassifier(fileprefix, self.gettimbloptions())
         if sourcefile.endswith(".bz2"):
             iomodule = bz2
         elif sourcefile.endswith(".gz"):
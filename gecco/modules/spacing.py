@@ -16,9 +16,10 @@ import os
 import json
 from pynlpl.formats import folia
 from gecco.gecco import Module
-from gecco.helpers.common import stripsourceextensions
+from gecco.helpers.common import stripsourceextensions, lazyimport
 from gecco.helpers.filters import hasalpha
-import colibricore #pylint: disable=import-error
+
+colibricore = lazyimport('colibricore')
 
 
 def splits(s):
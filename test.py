@@ -2,9 +2,38 @@
 import unittest
 import sys
 import os
-from pynlpl.formats import folia
+import re
+import io
+import json
+import time
+import tempfile
+import socket
+import random
+import urllib.request
+import subprocess
+from threading import Thread
+from collections import defaultdict
+from multiprocessing import Process, Array, Queue
+from queue import Empty
+from pynlpl.formats import folia, fql
+from gecco.helpers.editing import SuggestionsEdit, SplitEdit
+import gecco.helpers.protocol as protocol
+from gecco.helpers.queues import ChunkedQueue
+from gecco.helpers.scheduling import ExecutionPlan
+from gecco.helpers.registry import Heartbeat, heartbeatfile, readheartbeat, probeall, unixsocketpath
+from gecco.helpers.common import expandfiles, text2folia, folia2json, writejson, inputkey
+from gecco.helpers.streaming import FoLiAStreamReader, FoLiAStreamWriter
+from gecco.helpers.caching import getcache, FIFOCache, LRUCache, LFUCache, SharedCache
+from gecco.helpers.metrics import Metrics, SERVERMETRICS, mergemetrics, servehttp
+from gecco.helpers.tracing import Tracer, servertrace
+from gecco.helpers.resultstore import ResultStore, fingerprint
+from gecco.helpers.routing import getrouter, RoundRobinRouter, LeastOutstandingRouter, PowerOfTwoRouter, LatencyRouter
+from gecco.gecco import Corrector, Module, ProcessorThread
 
 TESTDIR = "./"
+IMPORTBUDGET = 1.0 #seconds
+BACKENDS = ('colibricore','timbl','Levenshtein','aspell','hunspell','ucto')
+CORRECTIONSET = "https://raw.githubusercontent.com/proycon/folia/master/setdefinitions/spellingcorrection.foliaset.xml"
 
 
 def findcorrectionbyannotator(test, elementid, annotator):
@@ -59,6 +88,764 @@ class FoLiAOutput(unittest.TestCase):
         self.assertEqual( correction.suggestions(0).text(), 'mistakes')
 
 
+def testdocument():
+    doc = folia.Document(id='untitled')
+    doc.declare(folia.Word, "tokconfig-en")
+    doc.declare(folia.Correction, CORRECTIONSET)
+    sentence = doc.append(folia.Text(doc, id='untitled.text')).append(folia.Sentence(doc, id='untitled.s.1'))
+    for i, text in enumerate(("It","wnet","well")):
+        sentence.append(folia.Word(doc, text=text, id='untitled.s.1.w.' + str(i+1)))
+    return doc
+
+def withoutdatetime(doc):
+    return re.sub(r' datetime="[^"]*"', '', doc.xmlstring())
+
+class DirectEdits(unittest.TestCase):
+    def test001_suggestions(self):
+        """Checking that suggestion edits applied directly give the same FoLiA as through FQL"""
+        directdoc = testdocument()
+        fqldoc = testdocument()
+        for annotator in ('errorlist','aspell','lexicon'): #multiple corrections on the same word
+            edit = SuggestionsEdit('untitled.s.1.w.2', ["went", ("want",0.5)], CORRECTIONSET, 'nonworderror', annotator)
+            edit.apply(directdoc)
+            fql.Query(edit.fql())(fqldoc)
+        self.assertEqual( withoutdatetime(directdoc), withoutdatetime(fqldoc) )
+        doc = folia.Document(string=directdoc.xmlstring())
+        self.assertEqual( doc['untitled.s.1.w.2'].text(), "wnet", "Checking the text of the word is unchanged" )
+        self.assertEqual( len(list(doc['untitled.s.1.w.2'].select(folia.Correction))), 3)
+
+
+class ImportTime(unittest.TestCase):
+    def test001_budget(self):
+        """Checking that gecco and its modules import quickly, without importing the backends"""
+        script = "import sys, time, json\nbegin = time.time()\nimport gecco.gecco, gecco.modules.errorlist, gecco.modules.lexicon, gecco.modules.lm, gecco.modules.confusibles, gecco.modules.puncrecase, gecco.modules.spacing\nprint(json.dumps({'duration': time.time() - begin, 'modules': list(sys.modules)}))"
+        result = json.loads(subprocess.check_output([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode('utf-8'))
+        for backend in BACKENDS:
+            self.assertNotIn(backend, result['modules'], "Checking " + backend + " is not imported")
+        self.assertLess(result['duration'], IMPORTBUDGET, "Checking import time")
+
+
+class Protocol(unittest.TestCase):
+    def test001_frames(self):
+        """Checking that frames read back as they were written"""
+        f = io.BytesIO(protocol.packframe(protocol.REQUEST, 1, b"first") + protocol.packframe(protocol.BATCH, 2**32-1, b"") + protocol.packframe(protocol.RESPONSE, 0, "t\u00e9st".encode('utf-8')))
+        self.assertEqual( protocol.readframe(f), (protocol.REQUEST, 1, b"first") )
+        self.assertEqual( protocol.readframe(f), (protocol.BATCH, 2**32-1, b"") )
+        self.assertEqual( protocol.readframe(f), (protocol.RESPONSE, 0, "t\u00e9st".encode('utf-8')) )
+        self.assertIsNone( protocol.readframe(f), "Checking end of connection" )
+
+    def test002_truncated(self):
+        """Checking that a truncated frame is taken as the end of the connection"""
+        frame = protocol.packframe(protocol.REQUEST, 1, b"payload")
+        self.assertIsNone( protocol.readframe(io.BytesIO(frame[:-1])) )
+        self.assertIsNone( protocol.readframe(io.BytesIO(frame[:protocol.HEADER.size-1])) )
+
+    def test003_negotiate(self):
+        """Checking codec negotiation of %HELLO%"""
+        self.assertIs( protocol.negotiate(['unknown','json']), protocol.JSONCodec )
+        self.assertIs( protocol.negotiate(list(protocol.CODECS)), list(protocol.CODECS.values())[0], "Checking the preferred codec is chosen" )
+        self.assertIsNone( protocol.negotiate(['unknown']) )
+        self.assertIsNone( protocol.negotiate([]) )
+
+    def test004_codecs(self):
+        """Checking that all codecs preserve the data"""
+        data = {'input': ["t\u00e9st", 1, 0.5, None, True], 'nested': {'list': [[1,2],[3]]}}
+        for codec in protocol.CODECS.values():
+            self.assertEqual( codec.loads(codec.dumps(data)), data, "Checking codec " + codec.name )
+
+
+def produce(queue, items):
+    for item in items:
+        queue.put(item)
+    queue.flush()
+
+class SharedMemoryQueue(unittest.TestCase):
+    def test001_wraparound(self):
+        """Checking that chunks larger than the buffer come through intact and in order"""
+        queue = ChunkedQueue(3, 64)
+        items = [ ("unit" + str(i), "x" * (i % 50)) for i in range(100) ]
+        producer = Thread(target=produce, args=(queue, items))
+        producer.start()
+        received = []
+        for _ in items:
+            received.append(queue.get(timeout=10))
+            queue.task_done()
+        producer.join()
+        self.assertEqual(received, items)
+        self.assertEqual(queue.pending(), 0)
+        queue.join()
+
+    def test002_processes(self):
+        """Checking that items are passed between processes"""
+        queue = ChunkedQueue(4, 256)
+        items = list(range(50))
+        producer = Process(target=produce, args=(queue, items))
+        producer.start()
+        received = [ queue.get(timeout=10) for _ in items ]
+        producer.join()
+        self.assertEqual(received, items)
+        self.assertEqual(queue.pending(), 50, "Checking nothing is marked done yet")
+
+    def test003_blocking(self):
+        """Checking that get() on an empty queue raises Empty, after the timeout if it blocks"""
+        queue = ChunkedQueue(2, 64)
+        self.assertRaises(Empty, queue.get, False)
+        begin = time.time()
+        self.assertRaises(Empty, queue.get, True, 0.2)
+        self.assertLess(time.time() - begin, 0.4)
+
+    def test004_flush(self):
+        """Checking that items are only written once a chunk is full or flushed"""
+        queue = ChunkedQueue(3, 1024)
+        queue.put(1)
+        queue.put(2)
+        self.assertRaises(Empty, queue.get, False)
+        queue.flush()
+        self.assertEqual(queue.get(False), 1)
+        self.assertEqual(queue.buffered(), 1)
+        self.assertEqual(queue.get(False), 2)
+
+
+class TimedModule(Module):
+    """Local module that records when and in which process it is initialised, prepares input and runs"""
+    UNIT = folia.Word
+
+    def record(self, event):
+        with open(self.settings['eventfile'], 'a', encoding='utf-8') as f:
+            f.write(event + " " + str(os.getpid()) + " " + repr(time.time()) + "\n")
+
+    def init(self, foliadoc):
+        self.record("init")
+
+    def prepareinput(self, word, **parameters):
+        self.record("prepareinput")
+        time.sleep(0.01)
+        return word.text()
+
+    def run(self, inputdata):
+        self.record("run")
+
+    def processoutput(self, outputdata, inputdata, unit_id, **parameters):
+        pass
+
+class Pipelining(unittest.TestCase):
+    def test001_overlap(self):
+        """Checking that the document is read in the data process only and that processors consume units while it still produces them"""
+        with tempfile.TemporaryDirectory() as d:
+            doc = folia.Document(id='untitled')
+            doc.declare(folia.Word, "tokconfig-en")
+            sentence = doc.append(folia.Text(doc, id='untitled.text')).append(folia.Sentence(doc, id='untitled.s.1'))
+            for i in range(50):
+                sentence.append(folia.Word(doc, text="w" + str(i), id='untitled.s.1.w.' + str(i+1)))
+            doc.save(os.path.join(d, "test.folia.xml"))
+            with open(os.path.join(d, "tokconfig"), 'w') as f:
+                f.write("")
+            corrector = Corrector(id='test', root=d, ucto=os.path.join(d, "tokconfig"), logfunction=lambda x: None)
+            corrector.append(TimedModule(corrector, id='timed', local=True, eventfile=os.path.join(d, "events")))
+            corrector.run(os.path.join(d, "test.folia.xml"), [], os.path.join(d, "out.folia.xml"), False, False)
+            events = defaultdict(list)
+            with open(os.path.join(d, "events"), 'r', encoding='utf-8') as f:
+                for line in f:
+                    event, pid, t = line.split()
+                    events[event].append( (int(pid), float(t)) )
+        self.assertEqual( (len(events['prepareinput']), len(events['run'])), (50, 50) )
+        datapid = events['init'][0][0]
+        self.assertNotEqual( datapid, os.getpid(), "Checking the master does not read the document" )
+        self.assertEqual( { pid for pid, _ in events['prepareinput'] }, {datapid} )
+        self.assertNotIn( datapid, { pid for pid, _ in events['run'] } )
+        self.assertLess( min( t for _, t in events['run'] ), max( t for _, t in events['prepareinput'] ), "Checking the first unit is processed before the last one is prepared" )
+
+
+class FakeModule:
+    def __init__(self, module_id, depends=()):
+        self.id = module_id
+        self.settings = {'depends': list(depends)}
+
+class Scheduling(unittest.TestCase):
+    def test001_levels(self):
+        """Checking that modules are grouped in levels after their dependencies"""
+        modules = [ FakeModule('c', ['b']), FakeModule('a'), FakeModule('b', ['a']), FakeModule('d') ]
+        plan = ExecutionPlan(modules)
+        self.assertEqual( [ [ module.id for module in level ] for level in plan.levels ], [['a','d'],['b'],['c']] )
+        self.assertEqual( [ module.id for module in plan ], ['a','d','b','c'] )
+        self.assertEqual( plan.prerequisites, {'a': set(), 'd': set(), 'b': {'a'}, 'c': {'a','b'}} )
+        self.assertTrue( plan.hasdependencies() )
+        self.assertFalse( ExecutionPlan([ FakeModule('a'), FakeModule('d') ]).hasdependencies() )
+
+    def test002_invalid(self):
+        """Checking that undefined and circular dependencies are refused"""
+        self.assertRaises(Exception, ExecutionPlan, [ FakeModule('a', ['x']) ])
+        self.assertRaises(Exception, ExecutionPlan, [ FakeModule('a', ['b']), FakeModule('b', ['a']) ])
+
+
+class FakeServerModule:
+    def server_load(self):
+        return 0.5
+
+class Registry(unittest.TestCase):
+    def test001_heartbeat(self):
+        """Checking that the load a server writes to its heartbeat file is read back while it is recent"""
+        with tempfile.TemporaryDirectory() as runpath:
+            filename = heartbeatfile(runpath, 'errorlist', '127.0.0.1', 12345)
+            self.assertIsNone( readheartbeat(filename, 10), "Checking there is no heartbeat before the server runs" )
+            heartbeat = Heartbeat(filename, FakeServerModule(), 10)
+            heartbeat.start()
+            for _ in range(100):
+                if os.path.exists(filename): break
+                time.sleep(0.01)
+            self.assertEqual( readheartbeat(filename, 10), 0.5 )
+            os.utime(filename, (time.time() - 20, time.time() - 20))
+            self.assertIsNone( readheartbeat(filename, 10), "Checking an old heartbeat is ignored" )
+            heartbeat.stop()
+            self.assertFalse( os.path.exists(filename), "Checking the heartbeat file is removed" )
+
+    def test002_probe(self):
+        """Checking that probing servers reports the load of the servers that answer and an exception for the others"""
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        def answer():
+            connection, _ = listener.accept()
+            connection.recv(1024)
+            connection.sendall(b"2.5")
+            connection.close()
+        server = Thread(target=answer)
+        server.start()
+        closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed.bind(('127.0.0.1', 0))
+        port = closed.getsockname()[1]
+        closed.close() #nothing listens on this port
+        loads = probeall([ ('127.0.0.1', listener.getsockname()[1]), ('127.0.0.1', port) ], 5)
+        server.join()
+        listener.close()
+        self.assertEqual( loads[0], 2.5 )
+        self.assertIsInstance( loads[1], Exception )
+
+    def test003_unixsocketpath(self):
+        """Checking that servers only get a Unix domain socket if its path fits in a socket address"""
+        self.assertEqual( unixsocketpath("/tmp/run", 'errorlist', '127.0.0.1', 12345), "/tmp/run/errorlist.127.0.0.1.12345.sock" )
+        self.assertIsNone( unixsocketpath("/tmp/" + "x" * 100, 'errorlist', '127.0.0.1', 12345) )
+
+
+class FakeCorrector:
+    def __init__(self, root, heartbeat=5.0):
+        self.root = root
+        self.settings = {'heartbeat': heartbeat, 'registryttl': 3 * heartbeat + 10, 'batchsize': 1, 'pipeline': 1, 'resultstore': None}
+        self.tracer = None
+
+class FakeRoutedModule:
+    def __init__(self, routing, loads, parent=None):
+        self.id = 'errorlist'
+        self.settings = {'routing': routing}
+        self.servers = [ ('127.0.0.1', 12345 + i, load) for i, load in enumerate(loads) ]
+        self.outstanding = Array('i', len(loads))
+        self.parent = parent
+
+def routerpick(processor, module, queue):
+    processor.setup()
+    queue.put( getrouter(module, processor.random).select() )
+
+class Routing(unittest.TestCase):
+    def test001_policies(self):
+        """Checking that the configured routing policy is used"""
+        for routing, routerclass in (('roundrobin', RoundRobinRouter), ('leastoutstanding', LeastOutstandingRouter), ('poweroftwo', PowerOfTwoRouter), ('latency', LatencyRouter)):
+            self.assertIsInstance( getrouter(FakeRoutedModule(routing, [0,0], FakeCorrector("/tmp/")), random.Random(1)), routerclass )
+        self.assertRaises(Exception, getrouter, FakeRoutedModule('unknown', [0,0]), random.Random(1))
+
+    def test002_roundrobin(self):
+        """Checking that round robin rotates over the servers and avoids a failed one"""
+        router = getrouter(FakeRoutedModule('roundrobin', [0,0,0]), random.Random(1))
+        self.assertEqual( sorted( router.select() for _ in range(3) ), [0,1,2] )
+        router.begin(1, 1)
+        router.end(1, 1, 0.1, False)
+        self.assertEqual( set( router.select() for _ in range(6) ), {0,2} )
+        for i in (0,2):
+            router.begin(i, 1)
+            router.end(i, 1, 0.1, False)
+        self.assertEqual( set( router.select() for _ in range(6) ), {0,1,2}, "Checking all servers are used again if they all failed" )
+
+    def test003_leastoutstanding(self):
+        """Checking that the server with the fewest outstanding units is picked"""
+        module = FakeRoutedModule('leastoutstanding', [0,0,0])
+        router = getrouter(module, random.Random(1))
+        router.begin(0, 5)
+        router.begin(2, 3)
+        self.assertEqual( router.select(), 1 )
+        router.end(0, 5, 0.1, True)
+        self.assertEqual( list(module.outstanding), [0,0,3] )
+        self.assertIn( router.select(), (0,1) )
+
+    def test004_poweroftwo(self):
+        """Checking that the less loaded of two servers is picked, with loads from the registry read at most once per interval"""
+        with tempfile.TemporaryDirectory() as root:
+            os.mkdir(os.path.join(root, "run"))
+            module = FakeRoutedModule('poweroftwo', [1.0,2.0], FakeCorrector(root + "/", 0))
+            router = getrouter(module, random.Random(1))
+            self.assertEqual( router.select(), 0 )
+            time.sleep(1.1)
+            with open(heartbeatfile(os.path.join(root, "run"), 'errorlist', '127.0.0.1', 12345), 'w') as f:
+                f.write("3.0")
+            self.assertEqual( router.select(), 1, "Checking the load is read from the registry" )
+            with open(heartbeatfile(os.path.join(root, "run"), 'errorlist', '127.0.0.1', 12345), 'w') as f:
+                f.write("0.0")
+            self.assertEqual( router.select(), 1, "Checking the registry is not read again right away" )
+
+    def test005_latency(self):
+        """Checking that faster servers get more requests"""
+        router = getrouter(FakeRoutedModule('latency', [0,0]), random.Random(1))
+        router.begin(0, 10)
+        router.end(0, 10, 1.0, True)
+        router.begin(1, 10)
+        router.end(1, 10, 0.1, True)
+        picks = [ router.select() for _ in range(1000) ]
+        self.assertGreater( picks.count(1), 800 )
+        self.assertGreater( picks.count(0), 0, "Checking slower servers still get some requests" )
+
+    def test006_processors(self):
+        """Checking that processors forked from the same master don't all start with the same pick"""
+        processor = ProcessorThread(FakeCorrector("/tmp/"), None, None, None, None)
+        module = FakeRoutedModule('roundrobin', [0] * 100)
+        queue = Queue()
+        children = [ Process(target=routerpick, args=(processor, module, queue)) for _ in range(4) ]
+        for child in children:
+            child.start()
+        picks = [ queue.get(True, 10) for _ in children ]
+        for child in children:
+            child.join()
+        self.assertGreater( len(set(picks)), 1 )
+
+
+class InputFiles(unittest.TestCase):
+    def test001_expand(self):
+        """Checking that directories and glob patterns expand to the files in them, in order"""
+        with tempfile.TemporaryDirectory() as d:
+            os.mkdir(os.path.join(d, "sub"))
+            for name in ("b.txt", "a.txt", "c.xml", os.path.join("sub","d.txt")):
+                open(os.path.join(d, name), 'w').close()
+            self.assertEqual( expandfiles([d]), [ os.path.join(d, name) for name in ("a.txt", "b.txt", "c.xml") ] + [ os.path.join(d, "sub", "d.txt") ] )
+            self.assertEqual( expandfiles([os.path.join(d, "*.txt"), os.path.join(d, "c.xml")]), [ os.path.join(d, name) for name in ("a.txt", "b.txt", "c.xml") ] )
+            self.assertRaises(Exception, expandfiles, [os.path.join(d, "*.json")])
+
+
+class FakeToken:
+    def __init__(self, text, nospace, endofsentence):
+        self.text = text
+        self.endofsentence = endofsentence
+        self.nospaceafter = nospace
+
+    def __str__(self):
+        return self.text
+
+    def type(self):
+        return 'PUNCTUATION' if self.text == '.' else 'WORD'
+
+    def nospace(self):
+        return self.nospaceafter
+
+    def isendofsentence(self):
+        return self.endofsentence
+
+class FakeTokenizer:
+    """Stands in for ucto: splits on spaces and splits off a final period, which ends the sentence"""
+
+    def process(self, text):
+        self.tokens = []
+        for word in text.split():
+            if word.endswith('.'):
+                self.tokens.append(FakeToken(word[:-1], True, False))
+                self.tokens.append(FakeToken('.', False, True))
+            else:
+                self.tokens.append(FakeToken(word, False, False))
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+class Tokenisation(unittest.TestCase):
+    def test001_text2folia(self):
+        """Checking the FoLiA document built from tokenised plain text"""
+        doc = text2folia(FakeTokenizer(), "It is apparantly not a concious decision.\nIt\nis not.\n\n  \nSecond paragraph", "tokconfig-en")
+        self.assertEqual( doc.id, 'untitled' )
+        self.assertTrue( doc.declared(folia.Word, "tokconfig-en") )
+        self.assertEqual( len(list(doc.paragraphs())), 2 )
+        self.assertEqual( [ sentence.id for sentence in doc.sentences() ], ['untitled.p.1.s.1', 'untitled.p.1.s.2', 'untitled.p.2.s.1'] )
+        self.assertEqual( doc['untitled.p.1.s.1.w.3'].text(), "apparantly" )
+        self.assertEqual( doc['untitled.p.1.s.1.w.8'].cls, "PUNCTUATION" )
+        self.assertEqual( doc['untitled.p.1.s.1'].text(), "It is apparantly not a concious decision." )
+        self.assertEqual( doc['untitled.p.2.s.1'].text(), "Second paragraph" )
+        doc = text2folia(FakeTokenizer(), "Text", "tokconfig-en", "doc")
+        self.assertEqual( doc['doc.p.1.s.1.w.1'].text(), "Text" )
+
+
+def streamdocument(filename):
+    """Saves a document of five paragraphs, the first three in a division"""
+    doc = folia.Document(id='untitled')
+    doc.declare(folia.Word, "tokconfig-en")
+    body = doc.append(folia.Text(doc, id='untitled.text'))
+    division = body.append(folia.Division(doc, id='untitled.div.1'))
+    for i in range(5):
+        paragraph = (division if i < 3 else body).append(folia.Paragraph(doc, id='untitled.p.' + str(i+1)))
+        sentence = paragraph.append(folia.Sentence(doc, id=paragraph.id + '.s.1'))
+        sentence.append(folia.Word(doc, text="word" + str(i+1), id=sentence.id + '.w.1'))
+    doc.save(filename)
+
+class Streaming(unittest.TestCase):
+    def test001_chunks(self):
+        """Checking that a document is read in chunks of paragraphs with context around them"""
+        with tempfile.TemporaryDirectory() as d:
+            streamdocument(os.path.join(d, "input.folia.xml"))
+            chunks = list(FoLiAStreamReader(os.path.join(d, "input.folia.xml")).chunks(2, 1))
+            self.assertEqual( [ chunk.index for chunk in chunks ], [0,1,2] )
+            self.assertEqual( [ (len(chunk.before), len(chunk.after)) for chunk in chunks ], [(0,1),(1,1),(1,0)] )
+            targets = []
+            for chunk in chunks:
+                doc = chunk.document()
+                targets.append( [ paragraph.id for paragraph in chunk.targets ] )
+                self.assertTrue( doc.declared(folia.Word, "tokconfig-en"), "Checking the declarations are kept" )
+            self.assertEqual( targets, [['untitled.p.1','untitled.p.2'],['untitled.p.3','untitled.p.4'],['untitled.p.5']] )
+            self.assertEqual( [ paragraph.id for paragraph in chunks[1].doc.paragraphs() ], ['untitled.p.2','untitled.p.3','untitled.p.4','untitled.p.5'], "Checking the context" )
+
+    def test002_empty(self):
+        """Checking that a document without text gives one empty chunk"""
+        with tempfile.TemporaryDirectory() as d:
+            doc = folia.Document(id='untitled')
+            doc.append(folia.Text(doc, id='untitled.text'))
+            doc.save(os.path.join(d, "input.folia.xml"))
+            chunks = list(FoLiAStreamReader(os.path.join(d, "input.folia.xml")).chunks(2, 1))
+            self.assertEqual( len(chunks), 1 )
+            chunks[0].document()
+            self.assertEqual( chunks[0].targets, [] )
+
+    def test003_writer(self):
+        """Checking that chunks finished out of order are written in order, and replace the output once all are written"""
+        for outputname in ("output.folia.xml", "output.folia.xml.gz", "output.folia.xml.bz2"):
+            with tempfile.TemporaryDirectory() as d:
+                streamdocument(os.path.join(d, "input.folia.xml"))
+                chunks = list(FoLiAStreamReader(os.path.join(d, "input.folia.xml")).chunks(2, 1))
+                writer = FoLiAStreamWriter(os.path.join(d, outputname))
+                for chunk in chunks:
+                    chunk.document()
+                self.assertEqual( writer.add(chunks[2]), 0 )
+                self.assertEqual( writer.add(chunks[1]), 0 )
+                self.assertEqual( writer.add(chunks[0]), 3 )
+                self.assertFalse( os.path.exists(os.path.join(d, outputname)), "Checking the output is not there before the total is known" )
+                self.assertTrue( writer.settotal(len(chunks)) )
+                doc = folia.Document(file=os.path.join(d, outputname))
+                self.assertEqual( [ (paragraph.id, paragraph.parent.id, paragraph.text()) for paragraph in doc.paragraphs() ], [ ('untitled.p.' + str(i), 'untitled.div.1' if i <= 3 else 'untitled.text', "word" + str(i)) for i in range(1,6) ] )
+
+    def test004_failed(self):
+        """Checking that a failed document leaves the output alone"""
+        with tempfile.TemporaryDirectory() as d:
+            streamdocument(os.path.join(d, "input.folia.xml"))
+            chunks = list(FoLiAStreamReader(os.path.join(d, "input.folia.xml")).chunks(5, 0))
+            writer = FoLiAStreamWriter(os.path.join(d, "input.folia.xml"))
+            chunks[0].document()
+            writer.add(chunks[0])
+            self.assertTrue( writer.settotal(1, True) )
+            self.assertEqual( os.listdir(d), ["input.folia.xml"] )
+
+
+class JSONOutput(unittest.TestCase):
+    def test001_writejson(self):
+        """Checking the JSON output of corrections on words and on spans of words"""
+        doc = testdocument()
+        f = io.StringIO()
+        writejson(doc, f)
+        self.assertEqual( f.getvalue(), "[]" )
+        SuggestionsEdit('untitled.s.1.w.2', ["went"], CORRECTIONSET, 'nonworderror', 'errorlist').apply(doc)
+        SplitEdit('untitled.s.1.w.3', [(["we","ll"],0.5)], CORRECTIONSET, 'spliterror', 'splits').apply(doc)
+        self.assertEqual( folia2json(doc), [
+            {'index': 1, 'text': "wnet", 'suggestions': [{'suggestion': "went", 'confidence': None}], 'annotator': 'errorlist'},
+            {'index': 2, 'text': "well", 'suggestions': [{'suggestion': "we ll", 'confidence': 0.5}], 'annotator': 'splits'},
+        ])
+        f = io.StringIO()
+        writejson(doc, f)
+        self.assertEqual( f.getvalue(), json.dumps(folia2json(doc)), "Checking the streamed output equals folia2json()" )
+
+
+class FakeModelModule:
+    def __init__(self, models, **settings):
+        self.id = 'lexicon'
+        self.settings = settings
+        self.models = models
+        self.submodules = {}
+
+class Results(unittest.TestCase):
+    def test001_store(self):
+        """Checking that stored outputs are found again, also by another store on the same file, until they are purged"""
+        with tempfile.TemporaryDirectory() as d:
+            store = ResultStore(os.path.join(d, "results.db"))
+            keys = [ ResultStore.key("lexicon:1", inputdata) for inputdata in ("wnet", ["wnet", 1]) ]
+            self.assertEqual( keys[0], ResultStore.key("lexicon:1", "wnet") )
+            self.assertNotEqual( keys[0], ResultStore.key("lexicon:2", "wnet"), "Checking the key depends on the fingerprint" )
+            self.assertIsNone( ResultStore.key("lexicon:1", object()) )
+            self.assertEqual( store.lookup(keys), {} )
+            store.store('lexicon', [ (keys[0], ["went"]), (keys[1], None), (None, "ignored") ])
+            other = ResultStore(os.path.join(d, "results.db"))
+            self.assertEqual( other.lookup(keys + [None]), {keys[0]: ["went"], keys[1]: None} )
+            self.assertEqual( store.purge('lexicon'), 2 )
+            self.assertEqual( other.lookup(keys), {} )
+            store.close()
+            other.close()
+
+    def test002_fingerprint(self):
+        """Checking that the fingerprint of a module changes with its models and settings, but not with its runtime settings"""
+        with tempfile.TemporaryDirectory() as d:
+            modelfile = os.path.join(d, "model")
+            with open(modelfile, 'w') as f:
+                f.write("model")
+            original = fingerprint(FakeModelModule([modelfile], freqthreshold=20, servers=[]))
+            self.assertEqual( fingerprint(FakeModelModule([modelfile], freqthreshold=20, servers=[('localhost',1234)], cachesize=10)), original )
+            self.assertNotEqual( fingerprint(FakeModelModule([modelfile], freqthreshold=10, servers=[])), original )
+            with open(modelfile, 'w') as f:
+                f.write("retrained model")
+            self.assertNotEqual( fingerprint(FakeModelModule([modelfile], freqthreshold=20, servers=[])), original )
+
+
+class Caching(unittest.TestCase):
+    def test001_types(self):
+        """Checking that the configured cache policy is used"""
+        for cachetype, cacheclass in (('fifo', FIFOCache), ('lru', LRUCache), ('lfu', LFUCache)):
+            self.assertIsInstance( getcache({'cachetype': cachetype}), cacheclass )
+        self.assertRaises(Exception, getcache, {'cachetype': 'unknown'})
+        cache = getcache({'cachesize': 0})
+        self.assertFalse(cache, "Checking a cache of size 0 is disabled")
+        cache.append("a", 1)
+        self.assertEqual( len(cache), 0 )
+
+    def test002_fifo(self):
+        """Checking that the FIFO cache evicts the oldest entry"""
+        cache = FIFOCache(2)
+        cache.append("a", 1)
+        cache.append("b", 2)
+        self.assertEqual( cache["a"], 1 )
+        cache.append("c", 3)
+        self.assertNotIn("a", cache)
+        self.assertEqual( (cache["b"], cache["c"]), (2, 3) )
+
+    def test003_lru(self):
+        """Checking that the LRU cache evicts the least recently used entry"""
+        cache = LRUCache(2)
+        cache.append("a", 1)
+        cache.append("b", 2)
+        self.assertEqual( cache["a"], 1 )
+        cache.append("c", 3)
+        self.assertNotIn("b", cache)
+        self.assertEqual( (cache["a"], cache["c"]), (1, 3) )
+
+    def test004_lfu(self):
+        """Checking that the LFU cache only admits a new entry if it is requested more often than the one it would evict"""
+        cache = LFUCache(2)
+        rare, frequent = 3, 4 #integer keys hash the same in every run
+        for key in (1, 2):
+            for _ in range(3):
+                self.assertRaises(KeyError, lambda: cache[key]) #pylint: disable=cell-var-from-loop
+            cache.append(key, key)
+        self.assertRaises(KeyError, lambda: cache[rare])
+        cache.append(rare, rare)
+        self.assertNotIn(rare, cache, "Checking a rare key is not admitted")
+        for _ in range(5):
+            self.assertRaises(KeyError, lambda: cache[frequent])
+        cache.append(frequent, frequent)
+        self.assertIn(frequent, cache, "Checking a frequent key is admitted")
+        self.assertEqual( len(cache), 2 )
+
+    def test005_contains(self):
+        """Checking that membership tests don't count as lookups"""
+        cache = LFUCache(10)
+        cache.append("a", 1)
+        shard = cache.shards[0]
+        frequency = shard.sketch.frequency("a")
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual( (cache.stats()['hits'], cache.stats()['misses']), (0, 0) )
+        self.assertEqual( shard.sketch.frequency("a"), frequency )
+        self.assertEqual( cache["a"], 1 )
+        self.assertEqual( cache.stats()['hits'], 1 )
+
+    def test006_ttl(self):
+        """Checking that entries expire"""
+        cache = FIFOCache(10, ttl=0.1)
+        cache.append("a", 1)
+        self.assertEqual( cache["a"], 1 )
+        time.sleep(0.2)
+        self.assertNotIn("a", cache)
+        self.assertRaises(KeyError, lambda: cache["a"])
+        self.assertEqual( cache.stats()['expirations'], 1 )
+
+    def test007_bytes(self):
+        """Checking that a cache bounded in bytes evicts entries to stay within its size"""
+        cache = LRUCache(0, 2000)
+        self.assertTrue(cache)
+        for i in range(100):
+            cache.append(i, "x" * 100)
+        stats = cache.stats()
+        self.assertLessEqual( stats['bytes'], 2000 )
+        self.assertGreater( stats['evictions'], 0 )
+        self.assertIn(99, cache)
+        cache.append("large", "x" * 5000)
+        self.assertNotIn("large", cache, "Checking an entry larger than the cache is not cached")
+
+    def test008_shards(self):
+        """Checking that the capacity is divided over the shards"""
+        cache = getcache({'cachetype': 'lru', 'cachesize': 100, 'cacheshards': 4})
+        self.assertEqual( len(cache.shards), 4 )
+        for i in range(1000):
+            cache.append(i, i)
+        self.assertLessEqual( len(cache), 100 )
+
+
+def sharedcacheappend(cache):
+    cache.append("wnet", ["went"])
+
+class SharedCaching(unittest.TestCase):
+    def test001_processes(self):
+        """Checking that entries added by a forked process are seen by the others"""
+        cache = getcache({'cachetype': 'shared', 'cachesize': 100})
+        self.assertIsInstance(cache, SharedCache)
+        self.assertRaises(KeyError, lambda: cache["wnet"])
+        process = Process(target=sharedcacheappend, args=(cache,))
+        process.start()
+        process.join()
+        self.assertEqual( cache["wnet"], ["went"] )
+
+    def test002_slots(self):
+        """Checking that entries replace the entry in their slot and that entries too large for a slot are not cached"""
+        cache = SharedCache(1, 128)
+        cache.append("a", 1)
+        cache.append("b", 2)
+        self.assertRaises(KeyError, lambda: cache["a"])
+        self.assertEqual( cache["b"], 2 )
+        cache.append("c", "x" * 200)
+        self.assertEqual( cache["b"], 2 )
+        self.assertEqual( cache.stats()['evictions'], 1 )
+
+    def test003_ttl(self):
+        """Checking that entries expire"""
+        cache = SharedCache(10, 128, 0.1)
+        cache.append("a", 1)
+        self.assertEqual( cache["a"], 1 )
+        time.sleep(0.2)
+        self.assertRaises(KeyError, lambda: cache["a"])
+
+
+class Deduplication(unittest.TestCase):
+    def test001_inputkey(self):
+        """Checking that equal inputs get equal keys and different inputs different ones"""
+        self.assertEqual( inputkey("wnet"), inputkey("wnet") )
+        self.assertEqual( inputkey({'a': 1, 'b': [1,2]}), inputkey({'b': [1,2], 'a': 1}) )
+        self.assertEqual( inputkey(("left","wnet","right")), inputkey(["left","wnet","right"]) )
+        self.assertNotEqual( inputkey("wnet"), inputkey("went") )
+        self.assertNotEqual( inputkey("\"wnet\""), inputkey(["wnet"]) )
+        self.assertNotEqual( inputkey("[\"wnet\"]"), inputkey(["wnet"]), "Checking a string never has the key of a structure" )
+        hash(inputkey({'a': [1,2]}))
+        self.assertIsNone( inputkey(object()), "Checking inputs that can't be serialised have no key" )
+
+
+def samples(text):
+    """Returns a dictionary of sample => value of metrics in the Prometheus text format"""
+    return dict( line.rsplit(" ", 1) for line in text.splitlines() if line and not line.startswith("#") )
+
+def metricsrequest(metrics):
+    metrics.begin('errorlist', 3)
+    metrics.end('errorlist', 3, 0.003, True, 10, 20)
+
+class LiveMetrics(unittest.TestCase):
+    def test001_render(self):
+        """Checking the counters and the latency histogram, including those added by forked processes"""
+        metrics = Metrics("gecco_server", ['errorlist'], (('host','localhost'),), SERVERMETRICS)
+        process = Process(target=metricsrequest, args=(metrics,))
+        process.start()
+        process.join()
+        metrics.begin('errorlist', 1)
+        metrics.end('errorlist', 1, 20, False)
+        values = samples(metrics.render())
+        labels = '{host="localhost",module="errorlist"}'
+        self.assertEqual( values['gecco_server_requests_total' + labels], "2" )
+        self.assertEqual( values['gecco_server_units_total' + labels], "4" )
+        self.assertEqual( values['gecco_server_errors_total' + labels], "1" )
+        self.assertEqual( values['gecco_server_inflight_units' + labels], "0" )
+        self.assertEqual( values['gecco_server_received_bytes_total' + labels], "10" )
+        self.assertEqual( values['gecco_server_request_duration_seconds_bucket{host="localhost",module="errorlist",le="0.0025"}'], "0" )
+        self.assertEqual( values['gecco_server_request_duration_seconds_bucket{host="localhost",module="errorlist",le="0.005"}'], "1" )
+        self.assertEqual( values['gecco_server_request_duration_seconds_bucket{host="localhost",module="errorlist",le="+Inf"}'], "2" )
+        self.assertEqual( values['gecco_server_request_duration_seconds_count' + labels], "2" )
+        self.assertNotIn( 'gecco_server_stored_units_total' + labels, values, "Checking counters of the master are left out" )
+
+    def test002_merge(self):
+        """Checking that the samples of several sources are grouped per metric"""
+        texts = []
+        for host in ('a','b'):
+            metrics = Metrics("gecco_server", ['errorlist'], (('host',host),), SERVERMETRICS)
+            metricsrequest(metrics)
+            texts.append(metrics.render())
+        merged = mergemetrics(texts)
+        self.assertEqual( merged.count("# TYPE gecco_server_requests_total counter"), 1 )
+        self.assertEqual( samples(merged), dict(list(samples(texts[0]).items()) + list(samples(texts[1]).items())) )
+        lines = merged.splitlines()
+        index = lines.index("# TYPE gecco_server_requests_total counter")
+        self.assertEqual( lines[index+1:index+3], ['gecco_server_requests_total{host="a",module="errorlist"} 1', 'gecco_server_requests_total{host="b",module="errorlist"} 1'] )
+
+    def test003_http(self):
+        """Checking that the metrics are served over HTTP"""
+        metrics = Metrics("gecco", ['errorlist'])
+        metricsrequest(metrics)
+        server = servehttp(metrics, 0)
+        try:
+            response = urllib.request.urlopen("http://127.0.0.1:" + str(server.server_address[1]) + "/metrics", timeout=10)
+            self.assertEqual( response.read().decode('utf-8'), metrics.render() )
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def tracespan(tracer):
+    tracer.span("prepareinput", "0123456789abcdef", 1.0, 1.5, "errorlist")
+
+class Tracing(unittest.TestCase):
+    def test001_sample(self):
+        """Checking that units are traced according to the sample"""
+        self.assertIsNone( Tracer("trace.json", 0).traceid() )
+        traceid = Tracer("trace.json", 1).traceid()
+        self.assertEqual( len(traceid), 16 )
+        self.assertNotEqual( Tracer("trace.json", 1).traceid(), traceid )
+
+    def test002_chrome(self):
+        """Checking that spans of all processes end up in a valid Chrome trace"""
+        with tempfile.TemporaryDirectory() as d:
+            tracer = Tracer(os.path.join(d, "trace.json"), 1)
+            self.assertEqual( tracer.format, 'chrome' )
+            tracer.create()
+            process = Process(target=tracespan, args=(tracer,))
+            process.start()
+            process.join()
+            tracer.serverspans('errorlist', servertrace("0123456789abcdef", begin=2.0, run=2.1, encode=2.4, end=2.5))
+            tracer.close()
+            with open(os.path.join(d, "trace.json"), 'r', encoding='utf-8') as f:
+                events = json.load(f)
+            spans = [ event for event in events if event['ph'] == 'X' ]
+            self.assertEqual( [ span['name'] for span in spans ], ['prepareinput', 'decode', 'run', 'encode'] )
+            self.assertEqual( (spans[0]['ts'], spans[0]['dur'], spans[0]['pid']), (1000000, 500000, process.pid) )
+            self.assertEqual( (spans[2]['ts'], spans[2]['dur'], spans[2]['pid']), (2100000, 300000, os.getpid()) )
+            self.assertTrue( all( span['args']['id'] == "0123456789abcdef" for span in spans ) )
+
+    def test003_jsonl(self):
+        """Checking that other trace files get one event per line"""
+        with tempfile.TemporaryDirectory() as d:
+            tracer = Tracer(os.path.join(d, "trace.jsonl"), 1)
+            tracer.create()
+            tracespan(tracer)
+            tracer.close()
+            with open(os.path.join(d, "trace.jsonl"), 'r', encoding='utf-8') as f:
+                events = [ json.loads(line) for line in f ]
+            self.assertEqual( [ event['name'] for event in events ], ['prepareinput'] )
+
+    def test004_protocol(self):
+        """Checking that trace IDs and records go along with messages of both protocols"""
+        self.assertEqual( protocol.unpacktrace(protocol.packtrace("0123456789abcdef", b"payload")), ("0123456789abcdef", b"payload") )
+        self.assertEqual( protocol.untraceline(protocol.traceline("0123456789abcdef", "[\"wnet\", 1]")), ("0123456789abcdef", "[\"wnet\", 1]") )
+        self.assertEqual( protocol.untraceline("\"wnet\""), (None, "\"wnet\"") )
+
+
 if __name__ == '__main__':
     try:
         TESTDIR = sys.argv[1]
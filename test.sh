@@ -44,6 +44,77 @@ if [ $? -ne 0 ]; then
     exit 2
 fi
 
+echo "Running system on test document (locally, multi-threaded, shared memory transport)">&2
+gecco test.yml run -s transport=sharedmemory --local test/test.txt
+if [ $? -ne 0 ]; then
+    echo "Run failed!!!" >&2
+    exit 2
+fi
+
+echo "Running unit tests after local run with shared memory transport">&2
+python ./test.py test/
+if [ $? -ne 0 ]; then
+    echo "Unit tests failed!" >&2
+    exit 2
+fi
+
+echo "Tokenising test document for streaming mode">&2
+mkdir -p test/stream
+python -c "import ucto; from gecco.gecco import Corrector; from gecco.helpers.common import text2folia; config = Corrector(id='test', root='test/', language='en').settings['ucto']; text2folia(ucto.Tokenizer(config), open('test/test.txt', encoding='utf-8').read(), config).save('test/stream/test.folia.xml')"
+if [ $? -ne 0 ]; then
+    echo "Tokenisation failed!!!" >&2
+    exit 2
+fi
+
+echo "Running system on test document (locally, streaming mode, one paragraph per chunk)">&2
+gecco test.yml run -s streaming=1 -s streamchunk=1 --local test/stream/test.folia.xml
+if [ $? -ne 0 ]; then
+    echo "Run failed!!!" >&2
+    exit 2
+fi
+
+echo "Running unit tests after local run in streaming mode">&2
+python ./test.py test/stream/
+if [ $? -ne 0 ]; then
+    echo "Unit tests failed!" >&2
+    exit 2
+fi
+
+echo "Starting daemon (locally)">&2
+gecco test.yml serve --local &
+DAEMON=$!
+for i in $(seq 1 120); do
+    if [ -S test/run/test.sock ]; then
+        break
+    fi
+    sleep 1
+done
+
+echo "Submitting test document to the daemon">&2
+gecco test.yml submit test/test.txt
+if [ $? -ne 0 ]; then
+    echo "Submit failed!!!" >&2
+    kill $DAEMON
+    exit 2
+fi
+
+echo "Running unit tests after submitting to the daemon">&2
+python ./test.py test/
+if [ $? -ne 0 ]; then
+    echo "Unit tests failed!" >&2
+    kill $DAEMON
+    exit 2
+fi
+
+echo "Shutting down daemon">&2
+gecco test.yml shutdown
+if [ $? -ne 0 ]; then
+    echo "Shutdown failed!!!" >&2
+    kill $DAEMON
+    exit 2
+fi
+wait $DAEMON
+
 echo "Running and evaluating test document">&2
 if [ $? -ne 0 ]; then
     gecco test.yml evaluate -s -p debug=1 --local test/test.txt test/test.folia.xml example/testreference.folia.xml
@@ -81,6 +152,81 @@ if [ $? -ne 0 ]; then
     exit 2
 fi
 
+echo "Running system on test document (using servers over TCP rather than Unix domain sockets)">&2
+gecco test.yml run -s unixsockets=0 test/test.txt
+if [ $? -ne 0 ]; then
+    echo "Run failed!!!" >&2
+    exit 2
+fi
+
+echo "Running unit tests after client/server run over TCP">&2
+python ./test.py test/
+if [ $? -ne 0 ]; then
+    echo "Unit tests failed!" >&2
+    exit 2
+fi
+
+echo "Running system on test document (using servers, batched)">&2
+gecco test.yml run -s batchsize=8 test/test.txt
+if [ $? -ne 0 ]; then
+    echo "Run failed!!!" >&2
+    exit 2
+fi
+
+echo "Running unit tests after batched client/server run">&2
+python ./test.py test/
+if [ $? -ne 0 ]; then
+    echo "Unit tests failed!" >&2
+    exit 2
+fi
+
+echo "Running system on test document (using servers, pipelined)">&2
+gecco test.yml run -s batchsize=8 -s pipeline=1 test/test.txt
+if [ $? -ne 0 ]; then
+    echo "Run failed!!!" >&2
+    exit 2
+fi
+
+echo "Running unit tests after pipelined client/server run">&2
+python ./test.py test/
+if [ $? -ne 0 ]; then
+    echo "Unit tests failed!" >&2
+    exit 2
+fi
+
+echo "Running system on test document (using servers, asyncio dispatcher)">&2
+gecco test.yml run -s dispatcher=asyncio test/test.txt
+if [ $? -ne 0 ]; then
+    echo "Run failed!!!" >&2
+    exit 2
+fi
+
+echo "Running unit tests after client/server run with asyncio dispatcher">&2
+python ./test.py test/
+if [ $? -ne 0 ]; then
+    echo "Unit tests failed!" >&2
+    exit 2
+fi
+
+echo "Running system on test document (using servers, tracing all units)">&2
+gecco test.yml run -s tracefile=trace.json -s tracesample=1 test/test.txt
+if [ $? -ne 0 ]; then
+    echo "Run failed!!!" >&2
+    exit 2
+fi
+python -m json.tool test/trace.json > /dev/null
+if [ $? -ne 0 ]; then
+    echo "Invalid trace!!!" >&2
+    exit 2
+fi
+
+echo "Collecting metrics of the servers">&2
+gecco test.yml metrics | grep -q "^gecco_server_requests_total"
+if [ $? -ne 0 ]; then
+    echo "Metrics failed!!!" >&2
+    exit 2
+fi
+
 echo "Stopping servers">&2
 gecco test.yml stopservers
 if [ $? -ne 0 ]; then